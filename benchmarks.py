@@ -0,0 +1,296 @@
+'''
+Benchmarks for the planner and water hot paths.
+
+Usage:
+    python benchmarks.py                            # run the suite and print the results.
+    python benchmarks.py --save benchmarks.json     # store the results as a baseline.
+    python benchmarks.py --baseline benchmarks.json # compare the results against a stored baseline.
+    python benchmarks.py --scaling                  # report plan time vs. total area.
+    python benchmarks.py --solver                   # compare the greedy planner with the exact solver.
+    python benchmarks.py --coldstart                # report the cold start (new interpreter, import and a minimal plan) against its budget.
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+from copy import deepcopy
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+import crops
+import water
+import system
+import choices
+import solver
+import utilities
+
+COSTS = ('linear', 'exponential', 'tabulated', 'quad')
+'''Groundwater pumping cost function types: exponential(r=0), exponential(r>0), an arbitrary function with a finite max_deficit (CostTable), an arbitrary function with an infinite max_deficit (quad).'''
+
+COLD_START_BUDGET = 0.25
+'''Target wall time (seconds) of a cold start: a new interpreter importing system and making a minimal plan with a default planner (importing scipy alone takes longer).'''
+COLD_START = '''
+import sys, time
+start = time.perf_counter()
+import numpy as np
+import system
+imported = time.perf_counter()
+system.default_planner().plan(np.array([[5, 0, 1, 0, 0.1], [5, 1, 1, 12, 0.1], [5, 1.2, 1, 13, 0.1]]))
+print(imported - start, time.perf_counter() - imported, 'scipy' in sys.modules)
+'''
+'''Script timed by coldstart(), it prints the seconds to import system (and numpy), the seconds of the plan, and whether scipy was imported.'''
+
+@dataclass
+class Result:
+    '''
+    Measurement of a benchmark.
+
+    Arguments:
+        name: str - name of the benchmarked function.
+        params: Dict - benchmark parameters (i.e. total_area, crops, cost, scenarios).
+        calls: int - number of calls timed.
+        seconds: float - wall time of all calls.
+        peak: int - peak memory allocated by the calls (bytes, measured by tracemalloc in a separate run).
+    '''
+    name: str
+    params: Dict
+    calls: int
+    seconds: float
+    peak: int
+
+    @property
+    def key(self) -> str:
+        return self.name + '[' + ','.join(f'{k}={v}' for k, v in sorted(self.params.items())) + ']'
+
+    @property
+    def calls_per_second(self) -> float:
+        return self.calls / self.seconds if self.seconds > 0 else float('inf')
+
+def measure(name: str, f: Callable[[], object], calls: int = 1, setup: Callable[[], object] = None, **params) -> Result:
+    '''
+    Times calls to f(), setup() is called (untimed) before each call and its return value passed to f if provided.
+    '''
+    def run():
+        seconds = 0.0
+        for _ in range(calls):
+            args = () if setup is None else (setup(),)
+            start = time.perf_counter()
+            f(*args)
+            seconds += time.perf_counter() - start
+        return seconds
+    seconds = run()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return Result(name=name, params=params, calls=calls, seconds=seconds, peak=peak)
+
+def cost_function(cost: str):
+    '''
+    Returns the pump_cost_function and max_deficit for a cost function type (see COSTS).
+    '''
+    if cost == 'linear':
+        return utilities.exponential(base=1, r=0), np.inf
+    if cost == 'exponential':
+        return utilities.exponential(base=1, r=0.0001), np.inf
+    if cost == 'tabulated':
+        return lambda x: 1 + 1e-8 * x**2, 1e7
+    if cost == 'quad':
+        return lambda x: 1 + 1e-8 * x**2, np.inf
+    raise ValueError(f'{cost} is not a cost function type, expected one of: {COSTS}.')
+
+def make_planner(total_area: int = 1000, n_crops: int = 3, cost: str = 'linear', seed: int = 0):
+    '''
+    Returns a central planner and inputs with n_crops crops (including fallow) and a total area of total_area units.
+    '''
+    rng = np.random.default_rng(seed)
+    pump_cost_function, max_deficit = cost_function(cost)
+    assets = [crops.Fallow()] + [crops.Annual(name=f'ANNUAL{i}', unit_costs=crops.UnitCost(rng.uniform(0, 2), rng.uniform(0, 2))) if i % 2 else
+                                 crops.Perennial(name=f'PERENNIAL{i}', unit_costs=crops.UnitCost(rng.uniform(0, 20), rng.uniform(0, 2)))
+                                 for i in range(1, n_crops)]
+    portfolio = np.bincount(rng.integers(0, n_crops, total_area), minlength=n_crops).astype('I')
+    planner = system.CentralPlanner(G=water.Groundwater(pump_cost_function=pump_cost_function, max_deficit=max_deficit),
+                                    S=water.Surfacewater(available=2 * total_area),
+                                    crops=np.array(assets, dtype=object), portfolio=portfolio, rng=np.random.default_rng(seed))
+    inputs = np.column_stack((np.full(n_crops, 5.0), rng.uniform(0.5, 1.5, n_crops), np.ones(n_crops),
+                              rng.uniform(5, 15, n_crops), np.full(n_crops, 0.1)))
+    inputs[0, 1] = inputs[0, 3] = 0
+    return planner, inputs
+
+def suite(areas: Sequence[int] = (100, 1000), n_crops: Sequence[int] = (3, 10), costs: Sequence[str] = COSTS,
+          scenarios: Sequence[int] = (1, 10), calls: int = 1000) -> List[Result]:
+    '''
+    Runs the benchmark suite.
+
+    Arguments:
+        areas: Sequence[int] - total areas planned.
+        n_crops: Sequence[int] - number of crops (including fallow).
+        costs: Sequence[str] - groundwater pumping cost function types (see COSTS).
+        scenarios: Sequence[int] - number of surface water scenarios planned by each plan benchmark.
+        calls: int - number of calls timed for the scalar benchmarks.
+    '''
+    results = []
+    rng = np.random.default_rng(0)
+    for cost in costs:
+        planner, inputs = make_planner(cost=cost)
+        planner.S = water.Surfacewater(available=0) # no surface water, so the water bids price groundwater (at the cost function being measured).
+        G, S = planner.G, planner.S
+        G.bid(10.0) # untimed, so the first quadrature's (lazy) scipy import is not measured.
+        results.append(measure('Groundwater.bid', lambda: G.bid(10.0), calls, cost=cost))
+        results.append(measure('water.bid', lambda: water.bid(d=5.0, p=1.0, s=S, g=G), calls, cost=cost))
+        results.append(measure('CentralPlanner.crop_outputs', lambda: planner.crop_outputs(1, inputs[1], False), calls, cost=cost))
+        results.append(measure('choices.crop_cycle', lambda: choices.crop_cycle(S, G, planner.crops[1], False, inputs[1]), calls, cost=cost))
+        for area in areas:
+            for n in n_crops:
+                for m in scenarios:
+                    planner, inputs = make_planner(area, n, cost)
+                    supplies = np.linspace(0, 4 * area, m)
+                    for blocks in (True, False):
+                        def plan(planner):
+                            for supply in supplies:
+                                planner.S.supply(supply)
+                                planner.plan(inputs, blocks=blocks)
+                        results.append(measure('CentralPlanner.plan', plan, 1, setup=lambda: deepcopy(planner),
+                                               total_area=area, crops=n, cost=cost, scenarios=m, blocks=blocks))
+                planner, inputs = make_planner(area, n, cost)
+                changed = inputs.copy()
+                changed[1, 3] *= 1.01
+                for blocks in (True, False):
+                    previous = deepcopy(planner)
+                    previous.plan(inputs, blocks=blocks)
+                    results.append(measure('CentralPlanner.replan', lambda planner: planner.replan(changed, blocks=blocks, previous=previous.warm_start), 1,
+                                           setup=lambda: deepcopy(planner), total_area=area, crops=n, cost=cost, blocks=blocks))
+    for T in (10, 100, 1000):
+        ts = rng.uniform(0, 10, T)
+        results.append(measure('utilities.expected_value', lambda: utilities.expected_value(ts, d=0.1), calls, T=T))
+    for cells in (1, 1000):
+        pump_cost_function, _ = cost_function('tabulated')
+        basin = water.GroundwaterField(deficit=rng.uniform(-10, 100, cells), max_deficit=1e4, sustainable_yield=1.0, pump_cost_functions=[pump_cost_function])
+        wells = rng.uniform(0, 20, cells)
+        results.append(measure('GroundwaterField.bids', lambda: basin.bids(wells), calls, cells=cells))
+    for holders in (1, 10000):
+        rights = water.SurfaceRights(priority=rng.integers(0, 100, holders), entitlement=rng.uniform(0, 10, holders))
+        rights.supply(2.5 * holders)
+        demands = rng.uniform(0, 12, holders)
+        results.append(measure('SurfaceRights.allocate', lambda: rights.allocate(demands), calls, holders=holders))
+    for series in (1, 10000):
+        forecast = utilities.ExpectedValue(d=0.1, shape=(series,))
+        xs = rng.uniform(0, 10, series)
+        results.append(measure('utilities.ExpectedValue.update', lambda: forecast.update(xs), calls, series=series))
+    return results
+
+def compare(results: List[Result], baseline: Dict[str, Dict], tolerance: float = 0.25) -> List[str]:
+    '''
+    Returns a description of each result that is more than tolerance (25% by default) slower per call, or uses more peak memory, than its baseline.
+    '''
+    regressions = []
+    for result in results:
+        if result.key not in baseline:
+            continue
+        base = Result(**baseline[result.key])
+        ratio = (result.seconds / result.calls) / (base.seconds / base.calls)
+        if ratio > 1 + tolerance:
+            regressions.append(f'{result.key}: {ratio:.2f}x slower ({result.calls_per_second:,.1f} vs. {base.calls_per_second:,.1f} calls/sec)')
+        if base.peak > 0 and result.peak / base.peak > 1 + tolerance:
+            regressions.append(f'{result.key}: {result.peak / base.peak:.2f}x peak memory ({result.peak:,} vs. {base.peak:,} bytes)')
+    return regressions
+
+def scaling(areas: Sequence[int] = (10, 100, 1000, 10000), n_crops: int = 3, cost: str = 'linear', per_unit_limit: int = 1000) -> List[Result]:
+    '''
+    Returns plan times vs. total area for the block planner, and the per unit planner (up to per_unit_limit units).
+    '''
+    results = []
+    for area in areas:
+        planner, inputs = make_planner(area, n_crops, cost)
+        for blocks in (True, False):
+            if blocks or area <= per_unit_limit:
+                results.append(measure('CentralPlanner.plan', lambda p: p.plan(inputs, blocks=blocks), 1, setup=lambda: deepcopy(planner),
+                                       total_area=area, crops=n_crops, cost=cost, blocks=blocks))
+    return results
+
+def solvers(areas: Sequence[int] = (100, 1000, 10000), n_crops: int = 5, costs: Sequence[str] = ('linear', 'exponential', 'tabulated'), seed: int = 0) -> str:
+    '''
+    Returns a report comparing the objective (total npv) and runtime of the greedy planner and the exact solver (see solver.compare()).
+    '''
+    lines = [f'{"cost":<12} {"total_area":>10} {"greedy npv":>14} {"exact npv":>14} {"gap %":>8} {"greedy ms":>10} {"exact ms":>10}']
+    for cost in costs:
+        for area in areas:
+            planner, inputs = make_planner(area, n_crops, cost, seed)
+            planner.S.available = area
+            r = solver.compare(planner, inputs)
+            gap = 100 * r['gap'] / abs(r['greedy']['objective']) if r['greedy']['objective'] else 0.0
+            lines.append(f'{cost:<12} {area:>10} {r["greedy"]["objective"]:>14,.1f} {r["exact"]["objective"]:>14,.1f} {gap:>8.3f} '
+                         f'{1000 * r["greedy"]["seconds"]:>10.2f} {1000 * r["exact"]["seconds"]:>10.2f}')
+    return '\n'.join(lines)
+
+def coldstart(repeats: int = 5, slowest: int = 10) -> Tuple[Dict[str, float], List[Tuple[str, int]]]:
+    '''
+    Times cold starts of a short lived worker: each runs COLD_START in a new interpreter.
+
+    Arguments:
+        repeats: int - number of cold starts, the median of each time is reported.
+        slowest: int - number of the slowest imports (by their own import time) to report.
+    Returns:
+        Tuple[Dict, List] in the form: ({'process', 'import', 'plan', 'scipy'}, [(module, microseconds), ...]),
+        process is the wall time of the whole interpreter (startup, imports, plan and exit) and scipy the fraction of cold starts that imported it.
+    '''
+    directory = os.path.dirname(os.path.abspath(__file__))
+    times = {'process': [], 'import': [], 'plan': [], 'scipy': []}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', COLD_START], cwd=directory, capture_output=True, text=True, check=True).stdout.split()
+        times['process'].append(time.perf_counter() - start)
+        times['import'].append(float(output[0]))
+        times['plan'].append(float(output[1]))
+        times['scipy'].append(float(output[2] == 'True'))
+    # -X importtime writes: import time: self [us] | cumulative | imported package, for each module imported.
+    lines = subprocess.run([sys.executable, '-X', 'importtime', '-c', COLD_START], cwd=directory, capture_output=True, text=True, check=True).stderr.splitlines()
+    imports = [(line.split('|')[2].strip(), int(line.split('|')[0].split(':')[1])) for line in lines if line.startswith('import time:') and 'self' not in line]
+    summary = {name: statistics.median(values) if name != 'scipy' else statistics.mean(values) for name, values in times.items()}
+    return summary, sorted(imports, key=lambda module: -module[1])[:slowest]
+
+def report(results: List[Result]) -> str:
+    lines = [f'{"benchmark":<100} {"calls/sec":>14} {"ms/call":>10} {"peak KiB":>10}']
+    for result in results:
+        lines.append(f'{result.key:<100} {result.calls_per_second:>14,.1f} {1000 * result.seconds / result.calls:>10.3f} {result.peak / 1024:>10,.1f}')
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the cropchoice planner and water hot paths.')
+    parser.add_argument('--save', help='path to save the results to as a baseline (json).')
+    parser.add_argument('--baseline', help='path of a baseline (json) to compare the results against.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='relative slow down reported as a regression, 0.25 by default.')
+    parser.add_argument('--quick', action='store_true', help='run a reduced suite.')
+    parser.add_argument('--scaling', action='store_true', help='report plan time vs. total area.')
+    parser.add_argument('--solver', action='store_true', help='compare the greedy planner with the exact solver.')
+    parser.add_argument('--coldstart', action='store_true', help='report the cold start time against its budget, exits with status 1 if it is over budget.')
+    parser.add_argument('--budget', type=float, default=COLD_START_BUDGET, help=f'cold start budget (seconds), {COLD_START_BUDGET} by default.')
+    args = parser.parse_args()
+    if args.scaling:
+        print(report(scaling()))
+    elif args.solver:
+        print(solvers())
+    elif args.coldstart:
+        summary, imports = coldstart()
+        print(f'cold start: {1000 * summary["process"]:.1f} ms (import {1000 * summary["import"]:.1f} ms, plan {1000 * summary["plan"]:.1f} ms), '
+              f'budget {1000 * args.budget:.1f} ms, scipy imported: {summary["scipy"] > 0}')
+        print('\n'.join(['slowest imports (self ms):'] + [f'  {module:<60} {us / 1000:>8.1f}' for module, us in imports]))
+        if summary['process'] > args.budget:
+            print('over budget.')
+            sys.exit(1)
+    else:
+        results = suite(areas=(100,), n_crops=(3,), scenarios=(1,), calls=100) if args.quick else suite()
+        print(report(results))
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare(results, json.load(f), args.tolerance)
+            print('\n'.join(['regressions:'] + regressions) if regressions else 'no regressions.')
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump({result.key: asdict(result) for result in results}, f, indent=1)
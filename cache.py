@@ -0,0 +1,216 @@
+'''
+Content addressed cache of plan (and crop cycle) results.
+
+Usage:
+    planner.cache = cache.Cache(path='.cropchoice-cache', max_bytes=2**30)
+    planner.plan(inputs) # computed
+    planner.plan(inputs) # after resetting the water states: read from the cache
+    print(planner.cache.stats)
+
+Results are keyed on a stable hash (fingerprint()) of everything they depend on: crop parameters, water states, cost function identity,
+random number generator state and the inputs, so a key is the same across processes and sessions.
+'''
+import os
+import types
+import pickle
+import hashlib
+from copy import deepcopy
+from collections import Counter, OrderedDict
+from typing import Callable, Optional
+
+import numpy as np
+
+_MISSING = object()
+
+def _update(h: 'hashlib._Hash', obj, seen: set):
+    if obj is None or isinstance(obj, (bool, int, str, bytes)):
+        h.update(f'{type(obj).__name__}:{obj!r};'.encode())
+    elif isinstance(obj, float):
+        h.update(f'float:{obj.hex()};'.encode())
+    elif isinstance(obj, (np.ndarray, np.generic)):
+        obj = np.asarray(obj)
+        if obj.dtype == object:
+            h.update(f'objects:{obj.shape};'.encode())
+            for item in obj.ravel():
+                _update(h, item, seen)
+        else:
+            h.update(f'array:{obj.dtype.str}:{obj.shape};'.encode())
+            h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (tuple, list)):
+        h.update(f'{type(obj).__name__}:{len(obj)};'.encode())
+        for item in obj:
+            _update(h, item, seen)
+    elif isinstance(obj, dict):
+        h.update(f'dict:{len(obj)};'.encode())
+        for key in sorted(obj, key=repr):
+            _update(h, key, seen)
+            _update(h, obj[key], seen)
+    elif isinstance(obj, types.CodeType):
+        h.update(f'code:{obj.co_name};'.encode())
+        h.update(obj.co_code)
+        _update(h, obj.co_consts, seen)
+        _update(h, obj.co_names, seen)
+    elif isinstance(obj, types.ModuleType):
+        h.update(f'module:{obj.__name__};'.encode())
+    elif isinstance(obj, types.FunctionType):
+        if id(obj) in seen: # i.e. a recursive function referencing itself as a global.
+            h.update(f'recursive:{obj.__module__}.{obj.__qualname__};'.encode())
+            return
+        seen = seen | {id(obj)}
+        h.update(f'function:{obj.__module__}.{obj.__qualname__};'.encode())
+        _update(h, obj.__code__, seen)
+        _update(h, obj.__defaults__, seen)
+        _update(h, tuple(cell.cell_contents for cell in obj.__closure__ or ()), seen)
+        # the values of the globals the function (or a function nested in it) reads, so changing a global changes the key.
+        _update(h, {name: obj.__globals__[name] for name in _global_names(obj.__code__) if name in obj.__globals__}, seen)
+    elif isinstance(obj, (types.BuiltinFunctionType, np.ufunc, type)):
+        h.update(f'callable:{getattr(obj, "__module__", None)}.{getattr(obj, "__qualname__", obj.__name__)};'.encode())
+    elif isinstance(obj, np.random.Generator):
+        _update(h, obj.bit_generator.state, seen)
+    elif hasattr(obj, '__dict__'):
+        if id(obj) in seen:
+            raise TypeError(f'{type(obj).__qualname__} contains a reference cycle and can not be fingerprinted.')
+        seen = seen | {id(obj)}
+        h.update(f'object:{type(obj).__module__}.{type(obj).__qualname__};'.encode())
+        # private attributes (i.e. Groundwater._cost_integral) are derived from the public ones, and some are caches.
+        _update(h, {k: v for k, v in vars(obj).items() if not k.startswith('_')}, seen)
+    else:
+        raise TypeError(f'{type(obj).__qualname__} can not be fingerprinted.')
+
+def _global_names(code: types.CodeType) -> set:
+    '''
+    Returns the names a code object (and the code objects nested in it, i.e. lambdas) may read as globals.
+    '''
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+    return names
+
+def fingerprint(*objects) -> str:
+    '''
+    Returns a stable (content based) hash of objects: numbers, strings, numpy arrays, containers, 
+    functions (by code, defaults, closure values and the values of the globals they read), modules (by name)
+    and objects (i.e. dataclasses) by their type and public attributes.
+
+    Raises:
+        TypeError: if an object can not be fingerprinted.
+    '''
+    h = hashlib.blake2b(digest_size=20)
+    _update(h, objects, set())
+    return h.hexdigest()
+
+class Cache:
+    '''
+    Two tier (in memory LRU and on disk) content addressed cache.
+
+    Arguments:
+        path: Optional[str] - directory of the on disk tier, only the in memory tier is used if None (default).
+        max_items: int - maximum number of results held in memory, 256 by default.
+        max_bytes: int - maximum size of the on disk tier, the least recently used results are evicted beyond it, 1 GiB by default.
+
+    Notes:
+        [1] stats counts: memory_hits, disk_hits, misses, uncacheable (calls that could not be fingerprinted, which are computed but not cached)
+            and evictions (from disk).
+        [2] Cached values are copied when they are read, so callers can change them without changing the cache.
+        [3] Copies of a planner (i.e. by deepcopy in ensemble.run()) share its cache.
+    '''
+    def __init__(self, path: Optional[str] = None, max_items: int = 256, max_bytes: int = 2**30):
+        self.path = path
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.memory: OrderedDict = OrderedDict()
+        self.stats: Counter = Counter()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def __deepcopy__(self, memo) -> 'Cache':
+        return self
+
+    def __len__(self) -> int:
+        return len(self.memory)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key + '.pkl')
+
+    def get(self, key: str, default=None):
+        '''
+        Returns a copy of the value cached for key, or default if it is not cached.
+        '''
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.stats['memory_hits'] += 1
+            return deepcopy(self.memory[key])
+        if self.path is not None and os.path.exists(self._file(key)):
+            try:
+                with open(self._file(key), 'rb') as f:
+                    value = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                value = None
+            else:
+                os.utime(self._file(key))
+                self.stats['disk_hits'] += 1
+                self._remember(key, value)
+                return deepcopy(value)
+        self.stats['misses'] += 1
+        return default
+
+    def put(self, key: str, value):
+        '''
+        Caches a value in memory, and on disk if the cache has a path.
+        '''
+        self._remember(key, deepcopy(value))
+        if self.path is not None:
+            temporary = self._file(key) + f'.{os.getpid()}.tmp'
+            with open(temporary, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self._file(key))
+            self.evict()
+
+    def _remember(self, key: str, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_items:
+            self.memory.popitem(last=False)
+
+    def evict(self):
+        '''
+        Removes the least recently used results from disk until the on disk tier is no larger than max_bytes.
+        '''
+        files = [entry for entry in os.scandir(self.path) if entry.name.endswith('.pkl')]
+        size = sum(entry.stat().st_size for entry in files)
+        for entry in sorted(files, key=lambda entry: entry.stat().st_mtime):
+            if size <= self.max_bytes:
+                break
+            size -= entry.stat().st_size
+            os.remove(entry.path)
+            self.stats['evictions'] += 1
+
+    def clear(self):
+        '''
+        Removes all results from memory and disk.
+        '''
+        self.memory.clear()
+        if self.path is not None:
+            for entry in os.scandir(self.path):
+                if entry.name.endswith('.pkl'):
+                    os.remove(entry.path)
+
+    def call(self, f: Callable[[], object], *key):
+        '''
+        Returns the cached value for the key objects (see fingerprint()), computing and caching f() on a miss.
+        '''
+        try:
+            k = fingerprint(*key)
+        except TypeError:
+            self.stats['uncacheable'] += 1
+            return f()
+        value = self.get(k, _MISSING)
+        if value is _MISSING:
+            value = f()
+            self.put(k, value)
+        return value
+
+    def hit_rate(self) -> float:
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        return hits / (hits + self.stats['misses']) if hits + self.stats['misses'] else 0.0
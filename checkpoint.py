@@ -0,0 +1,110 @@
+'''
+Checkpoint and resume of simulation state.
+
+Usage:
+    store = checkpoint.YearStore('outputs.bin', total_area=planner.total_area())
+    for year in simulation.Simulation(planner, forcing, surface_supply).run(checkpoint='state.npz', store=store):
+        ...
+
+If the job is killed, running the same simulation again with the same checkpoint and store resumes from the last checkpointed year,
+and continues bit for bit identically to an uninterrupted run.
+'''
+import os
+import json
+from typing import Dict
+
+import numpy as np
+
+import water
+import system
+import utilities
+
+def save(path: str, planner: system.Planner, t: int = 0, **arrays: np.ndarray):
+    '''
+    Saves the planner's water (including the deliveries to each surface water right), portfolio and random number generator states to an npz file.
+
+    Arguments:
+        path: str - path of the checkpoint (.npz), it is replaced atomically so a killed job leaves the previous checkpoint intact.
+        planner: system.Planner - the planner (i.e. CentralPlanner or IndividualPlanner).
+        t: int - index of the next year to simulate.
+        arrays: np.ndarray - any other state to save (i.e. partially filled outputs).
+    '''
+    temporary = path + '.tmp.npz'
+    if isinstance(planner.S, water.SurfaceRights):
+        arrays = dict(arrays, undelivered=np.float64(planner.S.undelivered), delivered=planner.S.delivered)
+    np.savez(temporary, t=np.int64(t), deficit=np.float64(planner.G.deficit), available=np.float64(planner.S.available),
+             portfolio=planner.portfolio, rng=np.array(json.dumps(utilities.rng_state(getattr(planner, 'rng', None)))), **arrays)
+    os.replace(temporary, path)
+
+def load(path: str) -> Dict[str, np.ndarray]:
+    '''
+    Returns the arrays saved in a checkpoint.
+    '''
+    with np.load(path) as checkpoint:
+        return {name: checkpoint[name] for name in checkpoint.files}
+
+def restore(path: str, planner: system.Planner) -> Dict[str, np.ndarray]:
+    '''
+    Restores the planner's states from a checkpoint saved by save(), returns the saved arrays (including t).
+    '''
+    checkpoint = load(path)
+    planner.G.deficit = float(checkpoint['deficit'])
+    if isinstance(planner.S, water.SurfaceRights):
+        planner.S.undelivered = float(checkpoint['undelivered'])
+        planner.S.delivered = checkpoint['delivered'].copy()
+        planner.S.reindex()
+    else:
+        planner.S.available = float(checkpoint['available'])
+    planner.portfolio = checkpoint['portfolio'].copy()
+    rng = utilities.set_rng_state(json.loads(str(checkpoint['rng'])), getattr(planner, 'rng', None))
+    if hasattr(planner, 'rng'):
+        planner.rng = rng
+    return checkpoint
+
+class YearStore:
+    '''
+    Append only store of yearly (dense) outputs in a raw binary file, read back as a memory mapped array.
+
+    Arguments:
+        path: str - path of the store.
+        total_area: int - units of land (rows) in each year's outputs.
+
+    Notes:
+        [1] Each year is appended to the end of the file, so a checkpoint never rewrites the years already stored.
+        [2] The file holds float64 values in native byte order: np.ndarray[shape=(years x total_area x [id, demand, sw, gw, precip, mr, mc, npv])].
+    '''
+    def __init__(self, path: str, total_area: int):
+        self.path = path
+        self.total_area = int(total_area)
+        self.year_bytes = self.total_area * 8 * np.dtype(float).itemsize
+
+    def __len__(self) -> int:
+        return os.path.getsize(self.path) // self.year_bytes if os.path.exists(self.path) else 0
+
+    def append(self, outputs: np.ndarray):
+        '''
+        Appends a year's dense outputs.
+        '''
+        outputs = np.ascontiguousarray(outputs, dtype=float)
+        if outputs.shape != (self.total_area, 8):
+            raise ValueError(f'expected outputs of shape {(self.total_area, 8)}, not {outputs.shape}.')
+        with open(self.path, 'ab') as f:
+            f.write(outputs.tobytes())
+
+    def truncate(self, years: int):
+        '''
+        Drops any years stored after the first years (i.e. written after the last checkpoint).
+        '''
+        if len(self) > years:
+            os.truncate(self.path, years * self.year_bytes)
+
+    def read(self) -> np.ndarray:
+        '''
+        Returns the stored years as a read only memory mapped np.ndarray[shape=(years x total_area x 8), dtype=float].
+        '''
+        if len(self) == 0:
+            return np.empty((0, self.total_area, 8))
+        return np.memmap(self.path, dtype=float, mode='r', shape=(len(self), self.total_area, 8))
+
+    def __getitem__(self, t: int) -> np.ndarray:
+        return self.read()[t]
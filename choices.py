@@ -1,5 +1,5 @@
 from copy import deepcopy
-from typing import Protocol
+from typing import Optional, Protocol
 from dataclasses import dataclass, field
 
 import numpy as np
@@ -7,12 +7,15 @@ import numpy as np
 import water
 import crops
 import system
+import cache as caches
 
-def crop_cycle(s: water.Surfacewater, g: water.Groundwater, crop: crops.Crop, new: bool, inputs: np.ndarray):
+def crop_cycle(s: water.Surfacewater, g: water.Groundwater, crop: crops.Crop, new: bool, inputs: np.ndarray, cache: Optional[caches.Cache] = None):
+    if cache is not None:
+        return cache.call(lambda: crop_cycle(s, g, crop, new, inputs), 'choices.crop_cycle', s, g, crop, new, np.asarray(inputs, dtype=float))
     demand = crop.water_demand(eto=inputs[0], kc=inputs[1])
     surface, ground = water.bid(d=demand, p=inputs[2], s=s, g=g)
     portion_water = (surface[0] + ground[0] + inputs[2]) / demand if 0 < demand < 1 else 1
-    marginal_revenue = crop.mr(p=inputs[3], q=crop.production(portion_water), r=inputs[4])
+    marginal_revenue = crop.mr(p=inputs[3], q=crop.production(portion_water), r=inputs[4], new=new)
     marginal_cost = crop.mc(new=new, wc=surface[1] + ground[1], r=inputs[4])
     return np.array([demand, surface[0], ground[0], inputs[2], marginal_revenue, marginal_cost, crop.npv(marginal_revenue, marginal_cost)])
     
@@ -1,26 +1,50 @@
 import math
 from enum import Enum
 from abc import abstractmethod
-from dataclasses import dataclass
-from typing import Callable, Protocol
+from functools import lru_cache
+from dataclasses import dataclass, field
+from typing import Callable, Protocol, Sequence, Tuple
+
+import numpy as np
 
 import utilities
 
-def unit_production(max_production: float = 1, no_production_threshold: float = 0, fx: Callable[[float], float] = utilities.unit_sigmoid(k=1)):
+@dataclass(frozen=True)
+class UnitProduction:
     '''
-    Returns a function that transforms a portion of demanded water supplied into units of production.
+    Transforms a portion of demanded water supplied into units of production.
     
     Arguments:
         max_production: float - maximum units of production when water demands are met, 1 by default.
         no_production_threshold: float - a portion of water demand met below which production is zero, 0 by default.
         fx: Callable[[float], float] = function that transforms portion water to portion of maximum production, utilities.unit_sigmoid(k=1) by default.
+    
+    Notes:
+        [1] x and the parameters may be floats or np.ndarrays (i.e. one parameter value per crop), arrays are broadcast against each other and an np.ndarray is returned.
     '''
-    def f(x: float):
+    max_production: float = 1
+    no_production_threshold: float = 0
+    fx: Callable[[float], float] = utilities.unit_sigmoid(k=1)
+    
+    def __call__(self, x: float) -> float:
         '''
         Expects x is portion of demanded water on domain [0, 1].
         '''
-        return 0 if x < no_production_threshold else fx(x) * max_production
-    return f
+        if utilities.is_scalar(x, self.no_production_threshold, self.max_production):
+            return 0 if x < self.no_production_threshold else self.fx(x) * float(self.max_production)
+        x = np.asarray(x, dtype=float)
+        return np.where(x < self.no_production_threshold, 0.0, self.fx(x) * np.asarray(self.max_production, dtype=float))
+
+def unit_production(max_production: float = 1, no_production_threshold: float = 0, fx: Callable[[float], float] = utilities.unit_sigmoid(k=1)):
+    '''
+    Returns a function that transforms a portion of demanded water supplied into units of production.
+    
+    Arguments:
+        max_production: float - maximum units of production when water demands are met, 1 by default.
+        no_production_threshold: float - a portion of water demand met below which production is zero, 0 by default.
+        fx: Callable[[float], float] = function that transforms portion water to portion of maximum production, utilities.unit_sigmoid(k=1) by default.
+    '''
+    return UnitProduction(max_production=max_production, no_production_threshold=no_production_threshold, fx=fx)
 
 class Names(Enum):
     '''
@@ -38,6 +62,76 @@ class UnitCost:
     startup_cost: float = 0
     non_water_cost: float = 1
     
+@lru_cache(maxsize=4096)
+def annuity(r: float, life: float) -> float:
+    '''
+    Returns the present value of a level annual payment of 1 (at the end of each year) over life years, 1 / r for a perpetuity (infinite life).
+    '''
+    if r == 0:
+        return life # the limit as r -> 0, undiscounted payments.
+    return (1 - (1 + r)**-life) / r if math.isfinite(life) else 1 / r
+
+def annuities(r: np.ndarray, life: np.ndarray) -> np.ndarray:
+    '''
+    Vectorized annuity(), r and life are broadcast against each other.
+    '''
+    r, life = np.broadcast_arrays(np.asarray(r, dtype=float), np.asarray(life, dtype=float))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(r == 0, life, np.where(np.isfinite(life), (1 - (1 + r)**-life) / r, 1 / r))
+
+@lru_cache(maxsize=4096)
+def discount_kernel(r: float, life: float, ages: int) -> np.ndarray:
+    '''
+    Returns the present value weights of a cash flow in each year of a crop's age [0, ages): np.ndarray[shape=(ages), dtype=float].
+    
+    Notes:
+        [1] The last weight includes every remaining year of the crop's life, so a schedule's last value is held until the end of its life.
+        [2] Kernels are cached per (r, life, ages) and read only.
+    '''
+    t = np.arange(1, ages + 1, dtype=float)
+    w = np.where(t <= life, (1 + r)**-t, 0.0)
+    if life > ages:
+        w[-1] += annuity(r, life) - annuity(r, ages)
+    w.setflags(write=False)
+    return w
+
+def _discount_kernels(r: np.ndarray, life: float, ages: int) -> np.ndarray:
+    '''
+    Returns discount_kernel() for each of an array of discount rates and a crop life: np.ndarray[shape=(rates x ages), dtype=float] (not cached).
+    '''
+    r = r[:, np.newaxis]
+    t = np.arange(1, ages + 1, dtype=float)
+    w = np.where(t <= life, (1 + r)**-t, 0.0)
+    if life > ages:
+        w[:, -1] += annuities(r[:, 0], life) - annuities(r[:, 0], ages)
+    return w
+
+def discount_kernels(r: np.ndarray, life: np.ndarray, ages: int, cached: int = 64) -> np.ndarray:
+    '''
+    Vectorized discount_kernel(), returns np.ndarray[shape=(... x crops x ages), dtype=float] for discount rates: np.ndarray[shape=(... x crops)] 
+    (or any shape broadcastable to it) and crop lives: np.ndarray[shape=(crops)].
+    
+    Notes:
+        [1] A kernel is built for each unique (rate, life) pair and gathered for each element of r, if there are at most cached unique pairs 
+            (i.e. a discount rate per scenario) their kernels are read from discount_kernel()'s cache, otherwise they are computed together.
+    '''
+    r, life = np.asarray(r, dtype=float), np.asarray(life, dtype=float)
+    shape = np.broadcast_shapes(r.shape, life.shape)
+    rates, rate = np.unique(r, return_inverse=True)
+    lives, crop = np.unique(life, return_inverse=True)
+    if len(rates) * len(lives) <= cached:
+        kernels = np.array([[discount_kernel(float(x), float(l), ages) for l in lives] for x in rates]).reshape(len(rates), len(lives), ages)
+    else:
+        kernels = np.stack([_discount_kernels(rates, l, ages) for l in lives], axis=1)
+    return kernels[np.broadcast_to(rate.reshape(r.shape), shape), np.broadcast_to(crop.reshape(life.shape), shape)]
+
+def schedule(values: Sequence[float], ages: int) -> np.ndarray:
+    '''
+    Returns a schedule by crop age padded to ages years by holding its last value (a level schedule of 1 if values is empty).
+    '''
+    values = np.asarray(values, dtype=float) if len(values) else np.ones(1)
+    return np.concatenate((values, np.full(ages - len(values), values[-1])))
+
 class Crop(Protocol):
     name: str
     
@@ -54,7 +148,7 @@ class Crop(Protocol):
         pass
     
     @abstractmethod
-    def mr(self, p: float, q: float, r: float) -> float:
+    def mr(self, p: float, q: float, r: float, new: bool = False) -> float:
         pass
     
     @abstractmethod
@@ -68,9 +162,23 @@ class Crop(Protocol):
     
 @dataclass
 class Perennial:
+    '''
+    Perennial crop (i.e. an orchard) with a production life of life years (a perpetuity by default).
+    
+    Arguments:
+        yield_schedule: Sequence[float] - portion of the crop's production in each year of age since planting (i.e. zero yield establishment years, then a ramp up),
+            the last value is held for the rest of the crop's life. Level (1) by default.
+        cost_schedule: Sequence[float] - multiplier of the crop's annual (non water and water) costs in each year of age since planting, level (1) by default.
+    
+    Notes:
+        [1] Schedules apply to new area (planted this year), existing area is valued at the mature (last) values of its schedules.
+        [2] Present values use discount kernels cached per (r, life), see discount_kernel().
+    '''
     name: str = Names.PERENNIAL.name
-    unit_costs: UnitCost = UnitCost()
+    unit_costs: UnitCost = field(default_factory=UnitCost)
     production_fx: Callable[[float], float] = unit_production(max_production=1, no_production_threshold=0)
+    yield_schedule: Sequence[float] = ()
+    cost_schedule: Sequence[float] = ()
     life = math.inf
     
     @staticmethod
@@ -88,13 +196,23 @@ class Perennial:
         return self.production_fx(water)
     
     def factor(self, r: float) -> float:
-        return 1/r if math.isfinite(self.life) else (1 - (1 / (1 + r)**self.life)) / r
+        return annuity(r, self.life)
+    
+    def scheduled_factor(self, values: Sequence[float], r: float, new: bool = False) -> float:
+        '''
+        Returns the present value of a schedule of annual cash flows by age (new area), or of its mature value (existing area).
+        '''
+        if len(values) == 0:
+            return self.factor(r)
+        if not new:
+            return values[-1] * self.factor(r)
+        return float(np.dot(discount_kernel(r, self.life, len(values)), values))
 
-    def mr(self, p: float, q: float, r: float):
-        return p * q * self.factor(r)
+    def mr(self, p: float, q: float, r: float, new: bool = False):
+        return p * q * self.scheduled_factor(self.yield_schedule, r, new)
     
     def mc(self, new: bool, wc: float, r: float):
-        annuity = (self.unit_costs.non_water_cost + wc) * self.factor(r)
+        annuity = (self.unit_costs.non_water_cost + wc) * self.scheduled_factor(self.cost_schedule, r, new)
         return self.unit_costs.startup_cost + annuity if new else annuity
     
     @staticmethod
@@ -104,7 +222,7 @@ class Perennial:
 @dataclass
 class Annual:
     name: str = Names.ANNUAL.name
-    unit_costs: UnitCost = UnitCost()
+    unit_costs: UnitCost = field(default_factory=UnitCost)
     production_fx: Callable[[float], float] = unit_production(max_production=1, no_production_threshold=0)
     
     @staticmethod
@@ -124,7 +242,7 @@ class Annual:
     def factor(self, r: float) -> float:
         return 1 / (1 + r)
 
-    def mr(self, p: float, q: float, r: float) -> float:
+    def mr(self, p: float, q: float, r: float, new: bool = False) -> float:
         return p * q * self.factor(r)
     
     def mc(self, new: bool, wc: float, r: float) -> float:
@@ -148,7 +266,7 @@ class Fallow:
     def factor(self, r: float=0) -> float:
         return 0
     
-    def mr(self, p:float=0, q:float=0, r:float=0) -> float:
+    def mr(self, p:float=0, q:float=0, r:float=0, new:bool=False) -> float:
         return 0
     
     def mc(self, new:bool=False, wc:float=0, r:float=0) -> float:
@@ -156,4 +274,154 @@ class Fallow:
     
     @staticmethod
     def npv(mr:float=0, mc:float=0) -> float:
-        return 0
\ No newline at end of file
+        return 0
+
+@dataclass
+class CropTable:
+    '''
+    Columnar (struct of arrays) representation of an array of crops, used to evaluate the economics of all crops (or all crops x scenarios) in single numpy expressions.
+    
+    Arguments:
+        names: np.ndarray[shape=(crops), dtype=str] - crop names.
+        types: np.ndarray[shape=(crops), dtype=int] - crop type, a Names value (FALLOW, ANNUAL or PERENNIAL).
+        startup_cost: np.ndarray[shape=(crops), dtype=float] - startup cost of new area.
+        non_water_cost: np.ndarray[shape=(crops), dtype=float] - non water cost per unit of area.
+        life: np.ndarray[shape=(crops), dtype=float] - years of production (1 for annual crops, math.inf for perpetual perennial crops).
+        max_production: np.ndarray[shape=(crops), dtype=float] - maximum units of production when water demands are met.
+        no_production_threshold: np.ndarray[shape=(crops), dtype=float] - portion of water demand met below which production is zero.
+        k: np.ndarray[shape=(crops), dtype=float] - unit sigmoid shape parameter of the production function.
+        production_fxs: np.ndarray[shape=(crops), dtype=object] - production functions without tabulated parameters (None for tabulated crops).
+        yield_schedule: np.ndarray[shape=(crops x ages), dtype=float] - portion of production by crop age of new area (see Perennial), level by default.
+        cost_schedule: np.ndarray[shape=(crops x ages), dtype=float] - multiplier of annual costs by crop age of new area, level by default.
+    
+    Notes:
+        [1] Use CropTable.from_crops() to build a table from an array of Perennial, Annual and Fallow crops.
+        [2] Arrays of inputs broadcast against the last (crops) dimension, so a (scenarios x crops) array evaluates all crops in all scenarios.
+        [3] With schedules, the present values of new area are a single product of the (cached) discount kernels of every scenario and crop 
+            with the schedules (see factors()).
+    '''
+    names: np.ndarray
+    types: np.ndarray
+    startup_cost: np.ndarray
+    non_water_cost: np.ndarray
+    life: np.ndarray
+    max_production: np.ndarray
+    no_production_threshold: np.ndarray
+    k: np.ndarray
+    production_fxs: np.ndarray
+    yield_schedule: np.ndarray = None
+    cost_schedule: np.ndarray = None
+    
+    def __post_init__(self):
+        n = len(self.names)
+        self.yield_schedule = np.ones((n, 1)) if self.yield_schedule is None else self.yield_schedule
+        self.cost_schedule = np.ones((n, 1)) if self.cost_schedule is None else self.cost_schedule
+    
+    @staticmethod
+    def from_crops(crops: np.ndarray) -> 'CropTable':
+        '''
+        Builds a crop table from an array of crop objects (i.e. CentralPlanner.crops).
+        '''
+        n = len(crops)
+        table = CropTable(names=np.array([crop.name for crop in crops]), types=np.zeros(n, dtype=int),
+                          startup_cost=np.zeros(n), non_water_cost=np.zeros(n), life=np.ones(n),
+                          max_production=np.zeros(n), no_production_threshold=np.zeros(n), k=np.ones(n),
+                          production_fxs=np.full(n, None, dtype=object))
+        for i, crop in enumerate(crops):
+            if isinstance(crop, Fallow):
+                table.types[i] = Names.FALLOW.value
+                continue
+            table.types[i] = Names.PERENNIAL.value if isinstance(crop, Perennial) else Names.ANNUAL.value
+            table.life[i] = crop.life if isinstance(crop, Perennial) else 1
+            table.startup_cost[i] = crop.unit_costs.startup_cost
+            table.non_water_cost[i] = crop.unit_costs.non_water_cost
+            fx = crop.production_fx
+            if isinstance(fx, UnitProduction) and isinstance(fx.fx, utilities.UnitSigmoid):
+                table.max_production[i] = fx.max_production
+                table.no_production_threshold[i] = fx.no_production_threshold
+                table.k[i] = fx.fx.k
+            else:
+                table.production_fxs[i] = fx
+        ages = max([1] + [len(getattr(crop, name, ())) for crop in crops for name in ('yield_schedule', 'cost_schedule')])
+        table.yield_schedule = np.array([schedule(getattr(crop, 'yield_schedule', ()), ages) for crop in crops]).reshape(n, ages)
+        table.cost_schedule = np.array([schedule(getattr(crop, 'cost_schedule', ()), ages) for crop in crops]).reshape(n, ages)
+        return table
+    
+    def __len__(self) -> int:
+        return len(self.names)
+    
+    def water_demand(self, eto: np.ndarray, kc: np.ndarray) -> np.ndarray:
+        '''
+        Computes water demand (ETc) for all crops, zero for fallowed land.
+        '''
+        return np.where(self.types == Names.FALLOW.value, 0.0, np.multiply(eto, kc))
+    
+    def production(self, water: np.ndarray) -> np.ndarray:
+        '''
+        Transforms the portion of demanded water supplied to each crop into units of production.
+        '''
+        x = np.asarray(water, dtype=float)
+        q = UnitProduction(self.max_production, self.no_production_threshold, utilities.UnitSigmoid(self.k))(x)
+        q = np.array(np.broadcast_to(q, np.broadcast_shapes(x.shape, self.k.shape)))
+        for i in [i for i, fx in enumerate(self.production_fxs) if fx is not None]:
+            q[..., i] = np.vectorize(self.production_fxs[i], otypes=[float])(np.broadcast_to(x, q.shape)[..., i])
+        return q
+    
+    def factor(self, r: np.ndarray) -> np.ndarray:
+        '''
+        Computes the present value of a level annual payment over each crop's life (0 for fallowed land), as each crop's factor().
+        '''
+        r = np.asarray(r, dtype=float)
+        factor = np.where(self.types == Names.ANNUAL.value, 1 / (1 + r), annuities(r, self.life))
+        return np.where(self.types == Names.FALLOW.value, 0.0, factor)
+    
+    def factors(self, r: np.ndarray, new: np.ndarray = False) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns the present value of each crop's yield schedule and cost schedule, for new area (by age) or existing area (mature values).
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray] in the form: (yield factors, cost factors), each np.ndarray[shape=(... x crops), dtype=float].
+        '''
+        factor = self.factor(r)
+        mature_yield, mature_cost = factor * self.yield_schedule[:, -1], factor * self.cost_schedule[:, -1]
+        if self.yield_schedule.shape[1] == 1 or not np.any(new):
+            shape = np.broadcast_shapes(np.shape(mature_yield), np.shape(new))
+            return np.broadcast_to(mature_yield, shape), np.broadcast_to(mature_cost, shape)
+        kernel = discount_kernels(r, self.life, self.yield_schedule.shape[1])
+        fallow = self.types == Names.FALLOW.value
+        new_yield = np.where(fallow, 0.0, np.einsum('...ck,ck->...c', kernel, self.yield_schedule))
+        new_cost = np.where(fallow, 0.0, np.einsum('...ck,ck->...c', kernel, self.cost_schedule))
+        return np.where(new, new_yield, mature_yield), np.where(new, new_cost, mature_cost)
+    
+    def mr(self, p: np.ndarray, q: np.ndarray, r: np.ndarray, new: np.ndarray = False) -> np.ndarray:
+        return np.multiply(p, q) * self.factors(r, new)[0]
+    
+    def mc(self, new: np.ndarray, wc: np.ndarray, r: np.ndarray) -> np.ndarray:
+        return np.where(new, self.startup_cost, 0.0) + (self.non_water_cost + wc) * self.factors(r, new)[1]
+    
+    @staticmethod
+    def npv(mr: np.ndarray, mc: np.ndarray) -> np.ndarray:
+        return mr - mc
+    
+    def evaluate(self, inputs: np.ndarray, supplied: np.ndarray = None, water_cost: np.ndarray = 0.0, new: np.ndarray = False) -> np.ndarray:
+        '''
+        Computes demand, marginal revenue, marginal cost and npv for all crops (and scenarios) in a single pass.
+        
+        Arguments:
+            inputs: np.ndarray[shape=(... x crops x [ETo, kc, precip, price, discount_rate]), dtype=float]
+            supplied: np.ndarray[shape=(... x crops), dtype=float] - surface and groundwater supplied, by default demand net of precipitation is met.
+            water_cost: np.ndarray[shape=(... x crops), dtype=float] - cost of the supplied water, 0 by default.
+            new: np.ndarray[shape=(... x crops), dtype=bool] - True if the area is new (incurring startup costs), False by default.
+        Returns:
+            outputs: np.ndarray[shape=(... x crops x [demand, mr, mc, npv]), dtype=float]
+        '''
+        inputs = np.asarray(inputs, dtype=float)
+        demand = self.water_demand(inputs[..., 0], inputs[..., 1])
+        if supplied is None:
+            supplied = np.maximum(demand - inputs[..., 2], 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            portion = np.where(demand > 0, (supplied + inputs[..., 2]) / demand, 1.0)
+        yield_factor, cost_factor = self.factors(inputs[..., 4], new) # computed once, rather than in both mr() and mc().
+        mr = np.multiply(inputs[..., 3], self.production(portion)) * yield_factor
+        mc = np.where(new, self.startup_cost, 0.0) + (self.non_water_cost + water_cost) * cost_factor
+        return np.stack(np.broadcast_arrays(demand, mr, mc, self.npv(mr, mc)), axis=-1)
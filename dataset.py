@@ -0,0 +1,316 @@
+'''
+Streaming, partitioned columnar dataset of plan outputs: Parquet, Arrow IPC or .npy shards.
+
+Usage:
+    with dataset.Writer('results', crops=planner.crops) as writer:
+        for year in simulation.Simulation(planner, forcing, surface_supply).run(writer=writer, scenario=0):
+            ...
+    for batch in dataset.scan('results', columns=('crop', 'count', 'npv'), years=range(10)):
+        npv += np.dot(batch['count'], batch['npv'])
+
+Layout:
+    path/_schema.json                                   the format, columns and crop dictionary of the dataset.
+    path/scenario=<s>/year=<t>/part-<k>.parquet         (or .arrow) one file of row groups per part of a partition,
+    path/scenario=<s>/year=<t>/part-<k>.npy             or one .npy shard per row group.
+
+Plans are written run length encoded: each row is a run of count consecutive units of land, starting at unit start,
+with the same crop and per-unit quantities (see results.runs()), so sums over units are weighted by count.
+'''
+import os
+import json
+from collections import OrderedDict
+from typing import Dict, Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+import results
+
+PARTITIONS = (('scenario', 'i4'), ('year', 'i4'))
+'''Partition columns of the dataset, encoded in the directory names (scenario=<s>/year=<t>) rather than in the files.'''
+FIELDS = (('start', 'i8'), ('count', 'u4'), ('crop', 'u2')) + tuple((name, 'f8') for name in results.COLUMNS[1:])
+'''Columns of each file: the first unit and number of units of land of each run, the crop (dictionary encoded: an index into the crop names) and its per-unit outputs.'''
+ROW = np.dtype(list(FIELDS))
+'''A row of the dataset (a run of units of land), the dtype of the .npy shards.'''
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow', 'npy': '.npy'}
+'''File extension of each format.'''
+
+def _pyarrow():
+    '''
+    Returns the pyarrow, pyarrow.parquet and pyarrow.ipc modules, or None if pyarrow is not installed.
+    '''
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow, pyarrow.parquet, pyarrow.ipc
+
+def arrow_schema(crops: Sequence[str]):
+    '''
+    Returns the pyarrow.Schema of the files, the crop column is a dictionary of the crop names.
+    '''
+    pa = _pyarrow()[0]
+    types = {'i8': pa.int64(), 'u4': pa.uint32(), 'f8': pa.float64()}
+    fields = [pa.field(name, pa.dictionary(pa.int16(), pa.string()) if name == 'crop' else types[dtype]) for name, dtype in FIELDS]
+    return pa.schema(fields, metadata={b'cropchoice': json.dumps({'partitions': [name for name, _ in PARTITIONS], 'crops': list(crops)}).encode()})
+
+def read_schema(path: str) -> Dict:
+    '''
+    Returns the dataset description: {'format', 'fields', 'partitions', 'crops'}.
+    '''
+    with open(os.path.join(path, '_schema.json')) as f:
+        return json.load(f)
+
+def partitions(path: str) -> Iterator[Tuple[int, int, str]]:
+    '''
+    Yields the (scenario, year, directory) of each partition of a dataset, in scenario and year order.
+    '''
+    def numbered(directory: str, name: str):
+        entries = [entry for entry in os.scandir(directory) if entry.is_dir() and entry.name.startswith(name + '=')]
+        return sorted((int(entry.name.split('=', 1)[1]), entry.path) for entry in entries)
+    for scenario, scenario_path in numbered(path, 'scenario'):
+        for year, year_path in numbered(scenario_path, 'year'):
+            yield scenario, year, year_path
+
+class Writer:
+    '''
+    Streams plan outputs to a partitioned columnar dataset, buffering them into row groups with bounded memory.
+
+    Arguments:
+        path: str - root directory of the dataset.
+        crops: Sequence - the crops of the plans (or their names), dictionary encoded as the crop column.
+        format: Optional[str] - 'parquet', 'arrow' (Arrow IPC file) or 'npy' (.npy shards), 'parquet' if pyarrow is installed and 'npy' otherwise.
+        row_group_size: int - rows buffered for a partition before they are written as a row group, 65,536 by default.
+        max_buffered_rows: int - maximum rows buffered across all partitions, the largest buffer is written (as a smaller row group) beyond it, 1,048,576 by default.
+        max_open_files: int - maximum partition files open at once (parquet and arrow), the least recently written is completed beyond it
+            and later rows of its partition are written to a new part file, 64 by default.
+        compression: str - parquet compression codec, 'zstd' by default.
+
+    Notes:
+        [1] Memory is bounded by max_buffered_rows rows (and one row group being written), however many plans are written.
+        [2] Plans are run length encoded (see results.runs()) before they are buffered, so a plan of long runs of identical units of land is a few rows.
+        [3] Files are written under temporary names and renamed once complete (when closed), so scan() never reads a partial file.
+            The first write to a partition replaces any files left in it (i.e. by an earlier run of the same scenario and year).
+        [4] Later writes to a partition append to it, their units of land start after those already written (the start column counts on).
+    '''
+    def __init__(self, path: str, crops: Sequence, format: Optional[str] = None, row_group_size: int = 65_536,
+                 max_buffered_rows: int = 1_048_576, max_open_files: int = 64, compression: str = 'zstd'):
+        self.path = path
+        self.crops = [str(getattr(crop, 'name', crop)) for crop in crops]
+        self.format = format if format is not None else 'parquet' if _pyarrow() is not None else 'npy'
+        if self.format not in FORMATS:
+            raise ValueError(f'{self.format} is not a valid format, expected one of: {", ".join(FORMATS)}.')
+        if self.format != 'npy' and _pyarrow() is None:
+            raise ImportError(f'pyarrow is required to write {self.format} files, install it or use format="npy".')
+        self.row_group_size = row_group_size
+        self.max_buffered_rows = max_buffered_rows
+        self.max_open_files = max_open_files
+        self.compression = compression
+        self.rows_written = 0
+        self._buffers: Dict[Tuple[int, int], list] = {}
+        self._buffered: Dict[Tuple[int, int], int] = {}
+        self._files: OrderedDict = OrderedDict() # (scenario, year) -> (file writer, sink, temporary path, path)
+        self._parts: Dict[Tuple[int, int], int] = {}
+        self._units: Dict[Tuple[int, int], int] = {} # units of land written to each partition.
+        self._schema = arrow_schema(self.crops) if self.format != 'npy' else None
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, '_schema.json'), 'w') as f:
+            json.dump({'format': self.format, 'fields': FIELDS, 'partitions': PARTITIONS, 'crops': self.crops}, f, indent=1)
+
+    def __enter__(self) -> 'Writer':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def buffered_rows(self) -> int:
+        return sum(self._buffered.values())
+
+    def write(self, outputs: Union[np.ndarray, results.RunLengthPlan], scenario: int = 0, year: int = 0, counts: Optional[Sequence[int]] = None):
+        '''
+        Writes a plan to the partition of a scenario and year.
+
+        Arguments:
+            outputs: np.ndarray[shape=(total_area x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float] - a plan's dense outputs,
+                or rows each repeated counts times, or its records (np.ndarray[dtype=results.RECORD]) or a results.RunLengthPlan.
+            scenario: int - scenario (i.e. ensemble member) of the plan.
+            year: int - year of the plan.
+            counts: Optional[Sequence[int]] - units of land of each row of outputs, 1 by default.
+        '''
+        if isinstance(outputs, results.RunLengthPlan):
+            outputs, counts = results.to_dense(outputs.segments), outputs.segments['count']
+        elif outputs.dtype.names is not None:
+            outputs = results.to_dense(outputs)
+        rows, counts = results.runs(outputs, np.ones(len(outputs), dtype=np.int64) if counts is None else counts)
+        key = (int(scenario), int(year))
+        if key not in self._parts:
+            self._clear(key)
+        batch = np.empty(len(rows), dtype=ROW)
+        batch['count'] = counts
+        batch['start'] = self._units[key] + np.cumsum(counts) - counts # units of land follow those of earlier writes to the partition.
+        self._units[key] += int(np.sum(counts))
+        batch['crop'] = rows[:, 0]
+        for i, name in enumerate(results.COLUMNS[1:], start=1):
+            batch[name] = rows[:, i]
+        self._buffers.setdefault(key, []).append(batch)
+        self._buffered[key] = self._buffered.get(key, 0) + len(batch)
+        if self._buffered[key] >= self.row_group_size:
+            self._flush(key, full=True)
+        while self.buffered_rows() > self.max_buffered_rows:
+            self._flush(max(self._buffered, key=self._buffered.get))
+
+    def flush(self):
+        '''
+        Writes all buffered rows.
+        '''
+        for key in list(self._buffers):
+            self._flush(key)
+
+    def close(self):
+        '''
+        Writes all buffered rows and completes the files.
+        '''
+        self.flush()
+        while self._files:
+            self._complete(next(iter(self._files)))
+
+    def _directory(self, key: Tuple[int, int]) -> str:
+        return os.path.join(self.path, f'scenario={key[0]}', f'year={key[1]}')
+
+    def _clear(self, key: Tuple[int, int]):
+        directory = self._directory(key)
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                if entry.name.startswith('part-'):
+                    os.remove(entry.path)
+        os.makedirs(directory, exist_ok=True)
+        self._parts[key] = 0
+        self._units[key] = 0
+
+    def _flush(self, key: Tuple[int, int], full: bool = False):
+        '''
+        Writes the buffered rows of a partition as row groups of (at most) row_group_size rows, only full row groups if full.
+        '''
+        rows = np.concatenate(self._buffers.pop(key))
+        del self._buffered[key]
+        stop = len(rows) - len(rows) % self.row_group_size if full else len(rows)
+        for start in range(0, stop, self.row_group_size):
+            self._write_group(key, rows[start:min(start + self.row_group_size, stop)])
+        if stop < len(rows):
+            self._buffers[key] = [rows[stop:]]
+            self._buffered[key] = len(rows) - stop
+
+    def _next_path(self, key: Tuple[int, int]) -> str:
+        part = self._parts[key]
+        self._parts[key] += 1
+        return os.path.join(self._directory(key), f'part-{part:05d}{FORMATS[self.format]}')
+
+    def _write_group(self, key: Tuple[int, int], rows: np.ndarray):
+        if len(rows) == 0:
+            return
+        self.rows_written += len(rows)
+        if self.format == 'npy':
+            path = self._next_path(key)
+            temporary = path + '.tmp'
+            with open(temporary, 'wb') as f:
+                np.save(f, rows)
+            os.replace(temporary, path)
+            return
+        pa, pq, ipc = _pyarrow()
+        if key not in self._files:
+            path = self._next_path(key)
+            temporary = path + '.tmp'
+            if self.format == 'parquet':
+                self._files[key] = (pq.ParquetWriter(temporary, self._schema, compression=self.compression), None, temporary, path)
+            else:
+                sink = pa.OSFile(temporary, 'wb')
+                self._files[key] = (ipc.new_file(sink, self._schema), sink, temporary, path)
+            while len(self._files) > self.max_open_files:
+                self._complete(next(iter(self._files)))
+        self._files.move_to_end(key)
+        writer = self._files[key][0]
+        batch = self._batch(rows)
+        if self.format == 'parquet':
+            writer.write_table(pa.Table.from_batches([batch]), row_group_size=len(rows))
+        else:
+            writer.write_batch(batch)
+
+    def _batch(self, rows: np.ndarray):
+        pa = _pyarrow()[0]
+        crops = pa.array(self.crops, type=pa.string())
+        columns = [pa.DictionaryArray.from_arrays(pa.array(rows[name].astype(np.int16)), crops) if name == 'crop' else pa.array(rows[name])
+                   for name, _ in FIELDS]
+        return pa.record_batch(columns, schema=self._schema)
+
+    def _complete(self, key: Tuple[int, int]):
+        writer, sink, temporary, path = self._files.pop(key)
+        writer.close()
+        if sink is not None:
+            sink.close()
+        os.replace(temporary, path)
+
+def _read(path: str, format: str, columns: Sequence[str], crops: Sequence[str]) -> Iterator[Dict[str, np.ndarray]]:
+    '''
+    Yields the row groups of a file as columns.
+    '''
+    if format == 'npy':
+        shard = np.load(path, mmap_mode='r')
+        yield {name: shard[name] for name in columns}
+        return
+    pa, pq, ipc = _pyarrow()
+    lookup = {name: i for i, name in enumerate(crops)}
+    def array(column) -> np.ndarray:
+        chunks = column.chunks if hasattr(column, 'chunks') else [column]
+        if pa.types.is_dictionary(column.type):
+            # indices are mapped through each chunk's dictionary, which need not be in the order of the crop names.
+            return np.concatenate([np.array([lookup[name] for name in chunk.dictionary.to_pylist()], dtype=np.uint16)[chunk.indices.to_numpy(zero_copy_only=False)]
+                                   for chunk in chunks]) if chunks else np.empty(0, dtype=np.uint16)
+        return np.concatenate([chunk.to_numpy(zero_copy_only=False) for chunk in chunks]) if chunks else np.empty(0)
+    if format == 'parquet':
+        f = pq.ParquetFile(path)
+        for i in range(f.num_row_groups):
+            table = f.read_row_group(i, columns=list(columns))
+            yield {name: array(table.column(name)) for name in columns}
+    else:
+        reader = ipc.open_file(pa.memory_map(path))
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            yield {name: array(batch.column(name)) for name in columns}
+
+def scan(path: str, columns: Optional[Sequence[str]] = None, scenarios: Optional[Sequence[int]] = None,
+         years: Optional[Sequence[int]] = None) -> Iterator[Dict[str, np.ndarray]]:
+    '''
+    Yields a dataset one row group at a time, so it can be reduced without loading it whole.
+
+    Arguments:
+        path: str - root directory of the dataset.
+        columns: Optional[Sequence[str]] - columns to read (of FIELDS and PARTITIONS), all by default.
+        scenarios: Optional[Sequence[int]] - scenarios to read, all by default.
+        years: Optional[Sequence[int]] - years to read, all by default.
+    Returns:
+        Iterator[Dict[str, np.ndarray]] - columns of each row group, crop holds the crop ids (indices into read_schema(path)['crops']).
+
+    Notes:
+        [1] Only the partitions of the requested scenarios and years are opened, and only the requested columns are read.
+        [2] Row groups of .npy shards are memory mapped (read only).
+    '''
+    schema = read_schema(path)
+    names = [name for name, _ in FIELDS]
+    columns = list(names) + [name for name, _ in PARTITIONS] if columns is None else list(columns)
+    unknown = set(columns) - set(names) - {name for name, _ in PARTITIONS}
+    if unknown:
+        raise KeyError(f'{sorted(unknown)} are not columns of the dataset, expected any of: {names + [name for name, _ in PARTITIONS]}.')
+    scenarios = None if scenarios is None else set(scenarios)
+    years = None if years is None else set(years)
+    extension = FORMATS[schema['format']]
+    for scenario, year, directory in partitions(path):
+        if (scenarios is not None and scenario not in scenarios) or (years is not None and year not in years):
+            continue
+        files = sorted(entry.path for entry in os.scandir(directory) if entry.name.startswith('part-') and entry.name.endswith(extension))
+        read = [name for name in columns if name in names] or ['count'] # a column is read to count the rows if only partition columns are requested.
+        for file in files:
+            for group in _read(file, schema['format'], read, schema['crops']):
+                n = len(group[read[0]])
+                partition = {'scenario': np.full(n, scenario, dtype='i4'), 'year': np.full(n, year, dtype='i4')}
+                yield {name: group[name] if name in group else partition[name] for name in columns}
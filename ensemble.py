@@ -0,0 +1,123 @@
+import os
+from copy import deepcopy
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import system
+import results
+import dataset
+
+@dataclass
+class EnsembleResult:
+    '''
+    Reduced results of an ensemble of plans, one row per member.
+
+    Arguments:
+        areas: np.ndarray[shape=(members x crops), dtype=int] - units of land allocated to each crop.
+        sw: np.ndarray[shape=(members), dtype=float] - total surface water delivered.
+        gw: np.ndarray[shape=(members), dtype=float] - total groundwater pumped.
+        npv: np.ndarray[shape=(members), dtype=float] - total npv of the allocated land.
+    '''
+    areas: np.ndarray
+    sw: np.ndarray
+    gw: np.ndarray
+    npv: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.sw)
+
+    def mean(self) -> Dict[str, np.ndarray]:
+        '''
+        Returns the ensemble mean of each result.
+        '''
+        return {'areas': self.areas.mean(axis=0), 'sw': self.sw.mean(), 'gw': self.gw.mean(), 'npv': self.npv.mean()}
+
+    def quantiles(self, q: Sequence[float] = (0.05, 0.5, 0.95)) -> Dict[str, np.ndarray]:
+        '''
+        Returns the ensemble quantiles q of each result, areas has the shape (len(q) x crops).
+        '''
+        return {'areas': np.quantile(self.areas, q, axis=0), 'sw': np.quantile(self.sw, q),
+                'gw': np.quantile(self.gw, q), 'npv': np.quantile(self.npv, q)}
+
+    def area_distribution(self, crop: int) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns the distinct areas allocated to a crop across the ensemble and the portion of members with each area.
+        '''
+        values, counts = np.unique(self.areas[:, crop], return_counts=True)
+        return values, counts / len(self)
+
+def summarize(outputs: np.ndarray, n_crops: int) -> Tuple[np.ndarray, float, float, float]:
+    '''
+    Reduces a plan to: (area per crop, total surface water, total groundwater, total npv).
+
+    Arguments:
+        outputs: np.ndarray[shape=(total_area x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float]
+        n_crops: int - number of crops.
+    '''
+    return (np.bincount(outputs[:,0].astype(int), minlength=n_crops),
+            outputs[:,2].sum(), outputs[:,3].sum(), outputs[:,7].sum())
+
+def run_member(planner: system.CentralPlanner, inputs: np.ndarray, surface_supply: float, seed: np.random.SeedSequence, runs: bool = False):
+    '''
+    Plans a single ensemble member on a copy of the planner, so the planner's water and portfolio states are not changed.
+    If runs, the member's plan is also returned, run length encoded (see results.runs()): (summary, (rows, counts)).
+    '''
+    member = deepcopy(planner)
+    member.rng = np.random.default_rng(seed)
+    member.S.supply(surface_supply)
+    outputs = member.plan(inputs)
+    summary = summarize(outputs, len(member.crops))
+    return (summary, results.runs(outputs, np.ones(len(outputs), dtype=np.int64))) if runs else summary
+
+def _run_chunk(planner: system.CentralPlanner, members: List[Tuple[np.ndarray, float, np.random.SeedSequence]], runs: bool = False):
+    return [run_member(planner, inputs, supply, seed, runs) for inputs, supply, seed in members]
+
+def run(planner: system.CentralPlanner, inputs: np.ndarray, surface_supply: np.ndarray,
+        seed: Optional[int] = None, processes: Optional[int] = None, chunksize: int = 16, writer: Optional[dataset.Writer] = None) -> EnsembleResult:
+    '''
+    Plans an ensemble of surface water and input (i.e. price) scenarios in parallel.
+
+    Arguments:
+        planner: system.CentralPlanner - planner whose states are copied for each member (the planner itself is not changed).
+        inputs: np.ndarray[shape=(members x crops x [ETo, kc, precip, price, discount_rate]), dtype=float] - or a single (crops x 5) array shared by all members.
+        surface_supply: np.ndarray[shape=(members), dtype=float] - surface water available to each member.
+        seed: Optional[int] - master seed, each member gets an independent np.random.Generator spawned from it.
+        processes: Optional[int] - number of worker processes, os.cpu_count() by default, members are planned in this process if 1.
+        chunksize: int - number of members sent to a worker at a time, 16 by default.
+        writer: Optional[dataset.Writer] - columnar dataset each member's plan is streamed to (as scenario: the member's index, year: 0).
+
+    Notes:
+        [1] Results are reproducible for a given seed, independent of the number of processes or chunksize.
+        [2] Workers only return the reduced results of each member (see summarize()), and their run length encoded plans if there is a writer, 
+            plans are written as each chunk is returned, so they are not all held in memory.
+        [3] The planner (including its crop production and pump cost functions) must be picklable to use more than one process.
+    '''
+    surface_supply = np.atleast_1d(np.asarray(surface_supply, dtype=float))
+    inputs = np.asarray(inputs, dtype=float)
+    if inputs.ndim == 2:
+        inputs = np.broadcast_to(inputs, (len(surface_supply),) + inputs.shape)
+    if len(inputs) != len(surface_supply):
+        raise ValueError(f'{len(inputs)} sets of inputs were provided for {len(surface_supply)} surface water scenarios.')
+    seeds = np.random.SeedSequence(seed).spawn(len(surface_supply))
+    members = list(zip(inputs, surface_supply, seeds))
+    chunks = [members[i:i + chunksize] for i in range(0, len(members), chunksize)]
+    processes = os.cpu_count() if processes is None else processes
+    runs = writer is not None
+    summaries = []
+    def collect(chunks_planned):
+        for chunk in chunks_planned:
+            for member in chunk:
+                if runs:
+                    member, (rows, counts) = member
+                    writer.write(rows, scenario=len(summaries), counts=counts)
+                summaries.append(member)
+    if processes == 1 or len(chunks) == 1:
+        collect(_run_chunk(planner, chunk, runs) for chunk in chunks)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            collect(pool.map(_run_chunk, [planner] * len(chunks), chunks, [runs] * len(chunks)))
+    areas, sw, gw, npv = zip(*summaries)
+    return EnsembleResult(areas=np.array(areas), sw=np.array(sw), gw=np.array(gw), npv=np.array(npv))
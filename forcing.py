@@ -0,0 +1,158 @@
+'''
+Memory mapped, chunked loading of daily climate forcing.
+
+Usage:
+    f = forcing.Forcing(eto=forcing.open_array('eto.npy'), precip=forcing.open_array('precip.f4', shape=(days, parcels)),
+                        kc=[0, 1.0, 1.2], price=prices, discount_rate=0.1, season=(90, 273))
+    simulation.Simulation(individual_planner, f, surface_supply)            # (parcels x crops x 5) inputs each year.
+    simulation.Simulation(central_planner, f.district(), surface_supply)    # (crops x 5) inputs each year.
+
+Daily values are never loaded all at once: blocks of years (time chunks) and parcels are read from the memory mapped arrays,
+aggregated to seasonal totals, and the next blocks are read ahead in a background thread while the current year is planned.
+'''
+from collections import deque
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+def open_array(path: str, dtype: str = 'f4', shape: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    '''
+    Memory maps (read only) a .npy file, or a raw binary file of the given dtype and shape: (days x parcels).
+    '''
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    if shape is None:
+        raise ValueError(f'the shape of raw binary file: {path} is required.')
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+@dataclass
+class Forcing:
+    '''
+    Seasonal planner inputs aggregated on the fly from daily forcing.
+
+    Arguments:
+        eto: np.ndarray[shape=(days x parcels), dtype=float] - daily reference ET (i.e. memory mapped by open_array()).
+        precip: np.ndarray[shape=(days x parcels), dtype=float] - daily (effective) precipitation.
+        kc: Sequence[float] - crop coefficient of each crop.
+        price: np.ndarray[shape=(years x crops) or (crops), dtype=float] - crop prices.
+        discount_rate: float or np.ndarray[shape=(years) or (years x crops), dtype=float] - discount rates.
+        season: Tuple[int, int] - [start, stop) days of each year aggregated, the whole year by default.
+        days_per_year: int - days in each year of the daily arrays, 365 by default.
+        chunk_years: int - years read in each time chunk, 1 by default.
+        parcel_block: int - parcels read in each block, 100,000 by default.
+        read_ahead: int - number of blocks read ahead in a background thread, 2 by default (0 reads each block when it is needed).
+
+    Notes:
+        [1] The daily arrays must be (days x parcels) so each year's season is a contiguous range of rows,
+            the parcel blocks keep each read (and the aggregation buffer) bounded for very large numbers of parcels.
+        [2] Every year has days_per_year days, leap days (if any) should be dropped from the daily arrays.
+    '''
+    eto: np.ndarray
+    precip: np.ndarray
+    kc: Sequence[float]
+    price: np.ndarray
+    discount_rate: Union[float, np.ndarray] = 0.0
+    season: Tuple[int, int] = (0, 365)
+    days_per_year: int = 365
+    chunk_years: int = 1
+    parcel_block: int = 100_000
+    read_ahead: int = 2
+
+    def __post_init__(self):
+        if self.eto.shape != self.precip.shape:
+            raise ValueError(f'eto: {self.eto.shape} and precip: {self.precip.shape} have different shapes.')
+        self.kc = np.asarray(self.kc, dtype=float)
+        shape = (self.years, len(self.kc))
+        self.price = np.broadcast_to(np.asarray(self.price, dtype=float), shape)
+        r = np.asarray(self.discount_rate, dtype=float)
+        self.discount_rate = np.broadcast_to(r[:, np.newaxis] if r.ndim == 1 else r, shape)
+
+    @property
+    def years(self) -> int:
+        return self.eto.shape[0] // self.days_per_year
+
+    @property
+    def parcels(self) -> int:
+        return self.eto.shape[1]
+
+    def __len__(self) -> int:
+        return self.years
+
+    def seasonal(self, years: slice, parcels: slice) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Reads and aggregates a block of years and parcels.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray] in the form: (seasonal eto, seasonal precip), each np.ndarray[shape=(years x parcels), dtype=float].
+        '''
+        start, stop = self.season
+        eto, precip = [], []
+        for t in range(*years.indices(self.years)):
+            days = slice(t * self.days_per_year + start, t * self.days_per_year + stop)
+            eto.append(self.eto[days, parcels].sum(axis=0, dtype=float))
+            precip.append(self.precip[days, parcels].sum(axis=0, dtype=float))
+        return np.array(eto), np.array(precip)
+
+    def blocks(self) -> Iterator[Tuple[slice, slice, np.ndarray, np.ndarray]]:
+        '''
+        Yields (years, parcels, seasonal eto, seasonal precip) for each time chunk (in time order) and parcel block, reading read_ahead blocks ahead.
+        '''
+        keys = [(slice(t, min(t + self.chunk_years, self.years)), slice(p, min(p + self.parcel_block, self.parcels)))
+                for t in range(0, self.years, self.chunk_years) for p in range(0, self.parcels, self.parcel_block)]
+        if self.read_ahead < 1:
+            for years, parcels in keys:
+                yield (years, parcels) + self.seasonal(years, parcels)
+            return
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pending = deque()
+            for years, parcels in keys:
+                pending.append((years, parcels, pool.submit(self.seasonal, years, parcels)))
+                if len(pending) > self.read_ahead:
+                    years, parcels, block = pending.popleft()
+                    yield (years, parcels) + block.result()
+            while pending:
+                years, parcels, block = pending.popleft()
+                yield (years, parcels) + block.result()
+
+    def seasons(self) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        '''
+        Yields (year, seasonal eto, seasonal precip) for each year, each np.ndarray[shape=(parcels), dtype=float].
+        '''
+        eto, precip, chunk = None, None, None
+        for years, parcels, block_eto, block_precip in self.blocks():
+            if chunk != years.start:
+                if chunk is not None:
+                    yield from ((chunk + i, eto[i], precip[i]) for i in range(len(eto)))
+                chunk = years.start
+                eto, precip = np.empty((len(block_eto), self.parcels)), np.empty((len(block_eto), self.parcels))
+            eto[:, parcels], precip[:, parcels] = block_eto, block_precip
+        if chunk is not None:
+            yield from ((chunk + i, eto[i], precip[i]) for i in range(len(eto)))
+
+    def inputs(self, t: int, eto: np.ndarray, precip: np.ndarray) -> np.ndarray:
+        '''
+        Returns year t's planner inputs: np.ndarray[shape=(parcels x crops x [ETo, kc, precip, price, discount_rate]), dtype=float].
+        '''
+        inputs = np.empty((len(eto), len(self.kc), 5))
+        inputs[..., 0] = eto[:, np.newaxis]
+        inputs[..., 1] = self.kc
+        inputs[..., 2] = precip[:, np.newaxis]
+        inputs[..., 3] = self.price[t]
+        inputs[..., 4] = self.discount_rate[t]
+        return inputs
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        '''
+        Yields each year's (parcels x crops x 5) inputs, i.e. for a system.IndividualPlanner.
+        '''
+        for t, eto, precip in self.seasons():
+            yield self.inputs(t, eto, precip)
+
+    def district(self) -> Iterator[np.ndarray]:
+        '''
+        Yields each year's (crops x 5) inputs, the seasonal eto and precip are averaged over the parcels, i.e. for a system.CentralPlanner.
+        '''
+        for t, eto, precip in self.seasons():
+            yield self.inputs(t, np.array([eto.mean()]), np.array([precip.mean()]))[0]
@@ -0,0 +1,108 @@
+'''
+Opt-in instrumentation of the planners and water objects.
+
+Usage:
+    with instrument.Instrument() as probe:
+        planner.plan(inputs)
+    print(probe.summary())
+
+While an Instrument is attached (as instrument.active) the planners and water objects report:
+phase timers (i.e. 'plan.choices'), call counters (i.e. 'groundwater.bid', 'groundwater.integral.quad', 'plan.shuffle')
+and water state trace events (i.e. 'surfacewater.deliver', 'groundwater.pump'). With no Instrument attached each hook is a single None check.
+'''
+import json
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import nullcontext
+from typing import Callable, Dict, Optional, Sequence
+
+active: Optional['Instrument'] = None
+'''The attached Instrument, None if instrumentation is off.'''
+
+_NULL = nullcontext()
+
+class _Timer:
+    __slots__ = ('timers', 'calls', 'name', 'start')
+
+    def __init__(self, timers: Dict[str, float], calls: Dict[str, int], name: str):
+        self.timers, self.calls, self.name = timers, calls, name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        self.timers[self.name] += time.perf_counter() - self.start
+        self.calls[self.name] += 1
+
+class Instrument:
+    '''
+    Collects phase timers, call counters and trace events.
+
+    Arguments:
+        callbacks: Sequence[Callable[[str, Dict], None]] - called with the name and data of each trace event (i.e. to stream events to an exporter).
+        record: bool - if True (default) the most recent trace events are kept in events.
+        max_events: int - maximum number of recorded trace events, 100,000 by default.
+    '''
+    def __init__(self, callbacks: Sequence[Callable[[str, Dict], None]] = (), record: bool = True, max_events: int = 100_000):
+        self.callbacks = list(callbacks)
+        self.record = record
+        self.timers: Dict[str, float] = defaultdict(float)
+        self.timer_calls: Dict[str, int] = defaultdict(int)
+        self.counters: Counter = Counter()
+        self.events: deque = deque(maxlen=max_events)
+        self._previous: Optional[Instrument] = None
+
+    def __enter__(self) -> 'Instrument':
+        global active
+        self._previous, active = active, self
+        return self
+
+    def __exit__(self, *args):
+        global active
+        active, self._previous = self._previous, None
+
+    def timer(self, name: str) -> _Timer:
+        '''
+        Returns a context manager that adds the time spent in its block to the named timer.
+        '''
+        return _Timer(self.timers, self.timer_calls, name)
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] += n
+
+    def event(self, name: str, **data):
+        '''
+        Records a trace event, and passes it to the callbacks.
+        '''
+        if self.record:
+            self.events.append((time.perf_counter(), name, data))
+        for callback in self.callbacks:
+            callback(name, data)
+
+    def summary(self) -> Dict:
+        '''
+        Returns the timers (total seconds and calls) and counters.
+        '''
+        return {'timers': {name: {'seconds': seconds, 'calls': self.timer_calls[name]} for name, seconds in self.timers.items()},
+                'counters': dict(self.counters)}
+
+    def export(self, path: str):
+        '''
+        Writes the summary and recorded trace events to a json file.
+        '''
+        with open(path, 'w') as f:
+            json.dump({**self.summary(), 'events': [{'time': t, 'name': name, **data} for t, name, data in self.events]}, f, default=float)
+
+def timer(name: str):
+    '''
+    Returns the active Instrument's named timer, or a no-op context manager if instrumentation is off.
+    '''
+    return _NULL if active is None else active.timer(name)
+
+def count(name: str, n: int = 1):
+    if active is not None:
+        active.count(name, n)
+
+def event(name: str, **data):
+    if active is not None:
+        active.event(name, **data)
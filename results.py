@@ -0,0 +1,143 @@
+from typing import Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+COLUMNS = ('id', 'demand', 'sw', 'gw', 'precip', 'mr', 'mc', 'npv')
+'''Names of the columns in a plan's outputs: np.ndarray[shape=(total_area x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float].'''
+RECORD = np.dtype([('id', 'u2')] + [(name, 'f4') for name in COLUMNS[1:]])
+'''Compact record (one per unit of land) with a uint16 crop id and float32 quantities.'''
+SEGMENT = np.dtype([('id', 'u2'), ('count', 'u4')] + [(name, 'f4') for name in COLUMNS[1:]])
+'''Run of consecutive units of land with the same crop and per-unit quantities.'''
+
+def runs(rows: np.ndarray, counts: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+    '''
+    Merges consecutive identical rows (each repeated counts times), returns the distinct runs of rows and the units of land in each run.
+    '''
+    rows, counts = np.asarray(rows, dtype=float), np.asarray(counts, dtype=np.int64)
+    if len(rows) > 1:
+        same = ((rows[1:] == rows[:-1]) | (np.isnan(rows[1:]) & np.isnan(rows[:-1]))).all(axis=1)
+        starts = np.flatnonzero(np.concatenate(([True], ~same)))
+        rows, counts = rows[starts], np.add.reduceat(counts, starts)
+    return rows, counts
+
+def to_records(outputs: np.ndarray) -> np.ndarray:
+    '''
+    Converts a plan's dense outputs to an np.ndarray[shape=(total_area), dtype=RECORD].
+    '''
+    records = np.empty(len(outputs), dtype=RECORD)
+    for i, name in enumerate(COLUMNS):
+        records[name] = outputs[:, i]
+    return records
+
+def to_dense(records: np.ndarray) -> np.ndarray:
+    '''
+    Converts RECORD (or SEGMENT) records back to a dense np.ndarray[shape=(records x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float].
+    '''
+    return np.column_stack([records[name].astype(float) for name in COLUMNS])
+
+class RunLengthPlan:
+    '''
+    Run length encoded plan, stores a segment of (crop id, count, per-unit quantities) for each run of identical units of land.
+
+    Arguments:
+        segments: np.ndarray[shape=(segments), dtype=SEGMENT]
+
+    Notes:
+        [1] Units of land are only expanded when asked for (i.e. by units(), records() or dense()),
+            the summary views (area(), sw(), gw(), npv()) are computed from the segments.
+    '''
+    def __init__(self, segments: np.ndarray):
+        self.segments = segments
+        self._ends = np.cumsum(segments['count'], dtype=np.int64)
+
+    @staticmethod
+    def from_rows(rows: np.ndarray, counts: Sequence[int]) -> 'RunLengthPlan':
+        '''
+        Builds a plan from dense rows (in the outputs column order) each repeated counts times, consecutive identical rows are merged.
+        '''
+        rows, counts = runs(rows, counts)
+        segments = np.empty(len(rows), dtype=SEGMENT)
+        segments['count'] = counts
+        for i, name in enumerate(COLUMNS):
+            segments[name] = rows[:, i]
+        return RunLengthPlan(segments)
+
+    @staticmethod
+    def encode(outputs: np.ndarray) -> 'RunLengthPlan':
+        '''
+        Run length encodes a plan's dense outputs.
+        '''
+        return RunLengthPlan.from_rows(outputs, np.ones(len(outputs), dtype=np.int64))
+
+    def __len__(self) -> int:
+        return int(self._ends[-1]) if len(self._ends) else 0
+
+    def __getitem__(self, n: int) -> np.void:
+        '''
+        Returns the RECORD for the nth unit of land.
+        '''
+        n = n + len(self) if n < 0 else n
+        if not 0 <= n < len(self):
+            raise IndexError(n)
+        return self.units(n, n + 1)[0]
+
+    def units(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        '''
+        Expands the units of land [start, stop) to an np.ndarray[shape=(stop - start), dtype=RECORD].
+        '''
+        stop = len(self) if stop is None else min(stop, len(self))
+        if stop <= start:
+            return np.empty(0, dtype=RECORD)
+        first, last = np.searchsorted(self._ends, [start, stop - 1], side='right')
+        counts = self.segments['count'][first:last + 1].astype(np.int64)
+        counts[0] -= start - (self._ends[first - 1] if first else 0)
+        counts[-1] -= self._ends[last] - stop
+        records = np.empty(stop - start, dtype=RECORD)
+        for name in RECORD.names:
+            records[name] = np.repeat(self.segments[name][first:last + 1], counts)
+        return records
+
+    def records(self) -> np.ndarray:
+        '''
+        Expands all units of land to an np.ndarray[shape=(total_area), dtype=RECORD].
+        '''
+        return self.units()
+
+    def dense(self) -> np.ndarray:
+        '''
+        Expands all units of land to the dense outputs returned by plan().
+        '''
+        return to_dense(self.records())
+
+    def area(self, n_crops: int = 0) -> np.ndarray:
+        '''
+        Returns the units of land allocated to each crop.
+        '''
+        return np.bincount(self.segments['id'], weights=self.segments['count'], minlength=n_crops).astype(np.int64)
+
+    def total(self, name: str) -> float:
+        '''
+        Returns the sum of a column (i.e. 'sw', 'gw' or 'npv') over all units of land.
+        '''
+        return float(np.dot(self.segments['count'].astype(float), self.segments[name].astype(float)))
+
+    def sw(self) -> float:
+        return self.total('sw')
+
+    def gw(self) -> float:
+        return self.total('gw')
+
+    def npv(self) -> float:
+        return self.total('npv')
+
+def format_plan(rows: np.ndarray, counts: Sequence[int], output: str = 'dense') -> Union[np.ndarray, RunLengthPlan]:
+    '''
+    Formats plan rows, each repeated counts times, as 'dense' outputs, 'records' or a run length encoded 'rle' plan.
+    '''
+    if output == 'dense':
+        return np.repeat(rows, counts, axis=0)
+    if output == 'records':
+        return np.repeat(to_records(rows), counts)
+    if output == 'rle':
+        return RunLengthPlan.from_rows(rows, counts)
+    raise ValueError(f'{output} is not a valid output format, expected one of: dense, records or rle.')
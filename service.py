@@ -0,0 +1,241 @@
+'''
+Local asynchronous scenario evaluation service.
+
+Usage:
+    python service.py --socket /tmp/cropchoice.sock                # serves the default CentralPlanner as config 'default'.
+
+    service.evaluate('default', [{'inputs': inputs.tolist(), 'surface': 100.0, 'seed': 1}, ...], path='/tmp/cropchoice.sock')
+
+Or from python, with warm planner configurations:
+    await service.Service({'district': planner}, processes=4).start(path='/tmp/cropchoice.sock')
+
+Protocol: newline delimited json over a Unix socket (or localhost TCP). Each request is one line:
+    {"id": ..., "op": "plan", "config": "default", "scenarios": [{"inputs": [[ETo, kc, precip, price, r], ...], "surface": float, "seed": int}, ...]}
+    {"id": ..., "op": "metrics"}
+A plan request streams one line per scenario as it completes: {"id": ..., "index": k, "area": [...], "sw": float, "gw": float, "npv": float},
+followed by {"id": ..., "done": true}. Errors are returned as {"id": ..., "error": message}.
+'''
+import os
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional
+
+import numpy as np
+
+import cache
+import system
+import ensemble
+
+_PLANNERS: Dict[str, system.CentralPlanner] = {}
+'''Planner configurations held (warm) by each worker.'''
+
+def _warm(planners: Dict[str, system.CentralPlanner]):
+    global _PLANNERS
+    _PLANNERS = planners
+
+def evaluate_scenario(config: str, inputs: np.ndarray, surface: float, seed: Optional[int] = None) -> Dict:
+    '''
+    Plans a scenario on a copy of a warm planner configuration, returns its reduced results (see ensemble.summarize()).
+    '''
+    planner = _PLANNERS[config]
+    area, sw, gw, npv = ensemble.run_member(planner, np.asarray(inputs, dtype=float), surface, np.random.SeedSequence(seed))
+    return {'area': area.tolist(), 'sw': float(sw), 'gw': float(gw), 'npv': float(npv)}
+
+class Service:
+    '''
+    Asyncio scenario evaluation service.
+
+    Arguments:
+        planners: Dict[str, system.CentralPlanner] - planner configurations by name, sent to each worker once when it starts.
+        processes: Optional[int] - number of worker processes, os.cpu_count() by default, scenarios are planned in a worker thread if 1.
+        max_pending: int - maximum scenarios accepted but not completed, 64 by default.
+
+    Notes:
+        [1] Identical scenarios (same config, inputs, surface water and seed) in flight at the same time are planned once,
+            and the result is sent to each request.
+        [2] Backpressure: once max_pending scenarios are pending the service stops reading requests until one completes,
+            results are written with the socket's flow control (writer.drain()).
+        [3] metrics(): requests, scenarios, completed, coalesced, errors, in_flight (unique scenarios being planned),
+            queue_depth (unique scenarios submitted to the workers and not completed), max_queue_depth,
+            waiting (scenarios waiting for a pending slot) and mean_seconds (mean time from submission to result of the completed scenarios,
+            a coalesced scenario's time is the time it waited for the scenario it joined).
+        [4] Requests of a connection are served one after another: the next request is read once the current plan request is done,
+            so clients send concurrent requests on separate connections.
+    '''
+    def __init__(self, planners: Dict[str, system.CentralPlanner], processes: Optional[int] = None, max_pending: int = 64):
+        self.planners = planners
+        self.processes = os.cpu_count() if processes is None else processes
+        self.max_pending = max_pending
+        self.counters: Counter = Counter()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.waiting = 0
+        self.seconds = 0.0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._executor: Optional[Executor] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: set = set()
+
+    async def start(self, path: Optional[str] = None, host: str = '127.0.0.1', port: int = 0) -> asyncio.AbstractServer:
+        '''
+        Starts the workers and listens on a Unix socket (path) or localhost TCP (host, port).
+        '''
+        self._slots = asyncio.Semaphore(self.max_pending)
+        if self.processes > 1:
+            self._executor = ProcessPoolExecutor(max_workers=self.processes, initializer=_warm, initargs=(self.planners,))
+        else:
+            _warm(self.planners)
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self.handle, path=path)
+        else:
+            self._server = await asyncio.start_server(self.handle, host=host, port=port)
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            await asyncio.sleep(0)
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def metrics(self) -> Dict:
+        completed = self.counters['completed']
+        return {**{name: self.counters[name] for name in ('requests', 'scenarios', 'completed', 'coalesced', 'errors')},
+                'in_flight': len(self._inflight), 'queue_depth': self.queue_depth, 'max_queue_depth': self.max_queue_depth,
+                'waiting': self.waiting, 'mean_seconds': self.seconds / completed if completed else 0.0}
+
+    async def evaluate(self, config: str, scenario: Dict) -> Dict:
+        '''
+        Plans a scenario in the worker pool, joining an identical scenario already in flight.
+        '''
+        if config not in self.planners:
+            raise KeyError(f'{config} is not a planner configuration, expected one of: {list(self.planners)}.')
+        inputs = np.asarray(scenario['inputs'], dtype=float)
+        surface, seed = float(scenario.get('surface', 0.0)), scenario.get('seed')
+        key = cache.fingerprint(config, inputs, surface, seed)
+        if key in self._inflight:
+            self.counters['coalesced'] += 1
+            return await asyncio.shield(self._inflight[key])
+        future = asyncio.get_running_loop().run_in_executor(self._executor, evaluate_scenario, config, inputs, surface, seed)
+        self._inflight[key] = future
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self.queue_depth -= 1
+            del self._inflight[key]
+
+    async def _scenario(self, id, index: int, config: str, scenario: Dict, results: asyncio.Queue):
+        start = time.perf_counter()
+        try:
+            result = {'id': id, 'index': index, **await self.evaluate(config, scenario)}
+            self.counters['completed'] += 1
+            self.seconds += time.perf_counter() - start # of completed scenarios only (including coalesced ones), matching the mean's denominator.
+        except Exception as e:
+            self.counters['errors'] += 1
+            result = {'id': id, 'index': index, 'error': f'{type(e).__name__}: {e}'}
+        finally:
+            self._slots.release()
+        await results.put(result)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        '''
+        Serves the requests of a connection, one line per request. Requests are served in order, a plan request's scenarios are planned 
+        concurrently but the connection's next request is not read until it is done (_plan() is awaited inline).
+        '''
+        self._connections.add(writer)
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as e:
+                    await self._write(writer, {'id': None, 'error': f'invalid json: {e}'})
+                    continue
+                self.counters['requests'] += 1
+                id, op = request.get('id'), request.get('op', 'plan')
+                if op == 'metrics':
+                    await self._write(writer, {'id': id, **self.metrics()})
+                elif op == 'plan':
+                    await self._plan(id, request.get('config', 'default'), request.get('scenarios', []), writer)
+                else:
+                    await self._write(writer, {'id': id, 'error': f'{op} is not a valid op, expected one of: plan or metrics.'})
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _plan(self, id, config: str, scenarios: List[Dict], writer: asyncio.StreamWriter):
+        results: asyncio.Queue = asyncio.Queue()
+        tasks = []
+        async def dispatch():
+            for index, scenario in enumerate(scenarios):
+                self.waiting += 1
+                try:
+                    await self._slots.acquire()
+                finally:
+                    self.waiting -= 1
+                self.counters['scenarios'] += 1
+                tasks.append(asyncio.create_task(self._scenario(id, index, config, scenario, results)))
+        dispatcher = asyncio.create_task(dispatch())
+        for _ in range(len(scenarios)):
+            await self._write(writer, await results.get())
+        await dispatcher
+        await self._write(writer, {'id': id, 'done': True})
+
+    @staticmethod
+    async def _write(writer: asyncio.StreamWriter, message: Dict):
+        writer.write((json.dumps(message) + '\n').encode())
+        await writer.drain()
+
+async def request(message: Dict, path: Optional[str] = None, host: str = '127.0.0.1', port: int = 0) -> AsyncIterator[Dict]:
+    '''
+    Sends a request to a service, and yields its responses as they are streamed back.
+    '''
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write((json.dumps(message) + '\n').encode())
+        await writer.drain()
+        while line := await reader.readline():
+            response = json.loads(line)
+            yield response
+            if message.get('op', 'plan') != 'plan' or response.get('done') or 'index' not in response:
+                break
+    finally:
+        writer.close()
+
+def evaluate(config: str, scenarios: List[Dict], path: Optional[str] = None, host: str = '127.0.0.1', port: int = 0) -> List[Dict]:
+    '''
+    Evaluates a batch of scenarios on a running service, returns the results in scenario order.
+    '''
+    async def collect():
+        return [response async for response in request({'id': 0, 'op': 'plan', 'config': config, 'scenarios': scenarios}, path, host, port)
+                if 'index' in response]
+    return sorted(asyncio.run(collect()), key=lambda response: response['index'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves cropchoice scenario evaluations.')
+    parser.add_argument('--socket', help='path of the Unix socket to listen on.')
+    parser.add_argument('--port', type=int, default=8765, help='localhost TCP port to listen on, if no socket is provided, 8765 by default.')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes, the number of cpus by default.')
+    parser.add_argument('--max-pending', type=int, default=64, help='maximum scenarios accepted but not completed, 64 by default.')
+    args = parser.parse_args()
+    async def main():
+        service = Service({'default': system.default_planner()}, processes=args.processes, max_pending=args.max_pending)
+        server = await service.start(path=args.socket, port=args.port)
+        async with server:
+            await server.serve_forever()
+    asyncio.run(main())
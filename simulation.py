@@ -0,0 +1,92 @@
+import os
+import itertools
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+import system
+import dataset
+import checkpoint as checkpoints
+
+@dataclass
+class Year:
+    '''
+    Results of one simulated year.
+
+    Arguments:
+        t: int - index of the simulated year.
+        outputs: np.ndarray[shape=(total_area x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float] - the year's plan.
+        portfolio: np.ndarray[shape=(crops), dtype=unsigned integer] - allocation of land carried into the next year.
+        available: float - surface water left undelivered at the end of the year.
+        deficit: float - groundwater deficit at the end of the year (after recharge).
+    '''
+    t: int
+    outputs: np.ndarray
+    portfolio: np.ndarray
+    available: float
+    deficit: float
+
+@dataclass
+class Simulation:
+    '''
+    Multi-year simulation driver, carries the planner's water and portfolio states from one year to the next.
+
+    Arguments:
+        planner: system.Planner - the planner (and its G, S and portfolio states) being simulated.
+        forcing: Iterable[np.ndarray] - yearly inputs, i.e. an np.ndarray[shape=(T x crops x [ETo, kc, precip, price, discount_rate]), dtype=float]
+            or any iterable of (crops x 5) arrays.
+        surface_supply: Iterable[float] - surface water supplied at the start of each year.
+        excess_yield: Optional[Iterable[float]] - groundwater recharge in excess of the sustainable yield for each year, 0 by default.
+
+    Notes:
+        [1] Each year: (1) surface water is resupplied, (2) land is allocated by planner.plan(),
+            (3) groundwater is recharged, and (4) the portfolio is updated from the plan.
+        [2] run() is a generator, only the current year is held in memory, so long runs should consume (or summarize) each year as it is yielded.
+        [3] run(checkpoint=...) saves the planner states after each year, and resumes from the last checkpointed year if the checkpoint exists (see checkpoint.py).
+    '''
+    planner: system.Planner
+    forcing: Iterable[np.ndarray]
+    surface_supply: Iterable[float]
+    excess_yield: Optional[Iterable[float]] = None
+
+    def step(self, t: int, inputs: np.ndarray, surface_supply: float, excess_yield: float = 0) -> Year:
+        '''
+        Simulates a single year, updating the planner states.
+        '''
+        self.planner.S.supply(surface_supply)
+        outputs = self.planner.plan(inputs)
+        self.planner.G.recharge(excess_yield=excess_yield)
+        self.planner.update_portfolio(outputs)
+        return Year(t=t, outputs=outputs, portfolio=self.planner.portfolio.copy(),
+                    available=self.planner.S.available, deficit=self.planner.G.deficit)
+
+    def run(self, checkpoint: Optional[str] = None, store: Optional[checkpoints.YearStore] = None, every: int = 1,
+            writer: Optional[dataset.Writer] = None, scenario: int = 0) -> Iterator[Year]:
+        '''
+        Yields the results of each simulated year.
+
+        Arguments:
+            checkpoint: Optional[str] - path of a checkpoint (.npz) saved every few years, the run resumes from it if it exists.
+            store: Optional[checkpoint.YearStore] - store each year's outputs are appended to.
+            every: int - number of years between checkpoints, 1 by default.
+            writer: Optional[dataset.Writer] - columnar dataset each year's outputs are streamed to, partitioned by scenario and year.
+            scenario: int - scenario partition the years are written to, 0 by default.
+        '''
+        excess_yield = self.excess_yield if self.excess_yield is not None else itertools.repeat(0)
+        years = enumerate(zip(self.forcing, self.surface_supply, excess_yield))
+        start = 0
+        if checkpoint is not None and os.path.exists(checkpoint):
+            start = int(checkpoints.restore(checkpoint, self.planner)['t'])
+            years = itertools.islice(years, start, None)
+        if store is not None:
+            store.truncate(start)
+        for t, (inputs, supply, excess) in years:
+            year = self.step(t, np.asarray(inputs, dtype=float), supply, excess)
+            if store is not None:
+                store.append(year.outputs)
+            if writer is not None:
+                writer.write(year.outputs, scenario=scenario, year=t)
+            if checkpoint is not None and (t + 1 - start) % every == 0:
+                checkpoints.save(checkpoint, self.planner, t + 1)
+            yield year
@@ -0,0 +1,176 @@
+import time
+from copy import deepcopy
+from dataclasses import dataclass
+from typing import Dict, Union
+
+import numpy as np
+
+import crops
+import water
+import results
+
+@dataclass
+class Solution:
+    '''
+    Exact district allocation of land and water, see solve().
+
+    Arguments:
+        area: np.ndarray[shape=(crops x [existing, new]), dtype=float] - units of land allocated to each crop.
+        sw: np.ndarray[shape=(crops x [existing, new]), dtype=float] - surface water delivered to each crop.
+        gw: np.ndarray[shape=(crops x [existing, new]), dtype=float] - groundwater pumped for each crop.
+        water_cost: np.ndarray[shape=(crops x [existing, new]), dtype=float] - annual cost of the water supplied to each crop.
+        inputs: np.ndarray[shape=(crops x [ETo, kc, precip, price, discount_rate]), dtype=float] - the solved inputs.
+        objective: float - total npv of the allocation.
+        seconds: float - wall time of the solve.
+        message: str - solver status message.
+        exact: bool - False if a crop's production is not linear in the water supplied, so its area was fully supplied or not planted (see solve()).
+    '''
+    area: np.ndarray
+    sw: np.ndarray
+    gw: np.ndarray
+    water_cost: np.ndarray
+    inputs: np.ndarray
+    objective: float
+    seconds: float
+    message: str
+    exact: bool = True
+
+    def rows(self, table: crops.CropTable):
+        '''
+        Returns the allocation as plan rows: (rows x [id, demand, sw, gw, precip, mr, mc, npv], units of land per row),
+        one row for the existing and new area of each crop, water and its cost are shared evenly by each unit of the existing (or new) area of a crop.
+        '''
+        ids, new = np.nonzero(self.area > 0)
+        sw, gw, wc = (x[ids, new] / self.area[ids, new] for x in (self.sw, self.gw, self.water_cost))
+        evaluated = table.evaluate(self.inputs, supplied=(sw + gw)[:, np.newaxis], water_cost=wc[:, np.newaxis], new=new.astype(bool)[:, np.newaxis])
+        evaluated = evaluated[np.arange(len(ids)), ids]
+        rows = np.column_stack((ids, evaluated[:, 0], sw, gw, self.inputs[ids, 2], evaluated[:, 1], evaluated[:, 2], evaluated[:, 3]))
+        return rows, self.area[ids, new]
+
+    def outputs(self, table: crops.CropTable, output: str = 'dense') -> Union[np.ndarray, results.RunLengthPlan]:
+        '''
+        Returns the allocation in a plan's output format (see CentralPlanner.plan()), the solution must have integer areas (see solve(integer=True)).
+        '''
+        rows, counts = self.rows(table)
+        if not np.allclose(counts, np.round(counts)):
+            raise ValueError('the solution has fractional areas, solve with integer=True to format it as a plan.')
+        return results.format_plan(rows, np.round(counts).astype(int), output)
+
+def layers(G: water.Groundwater, upper: float, n: int = 200):
+    '''
+    Returns the groundwater deficit layers that can be pumped (up to a deficit of upper) and their average unit pumping costs.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray] in the form: (layer depths, unit costs).
+    '''
+    depths, costs = [], []
+    if G.deficit < 0: # water in storage above the sustainable yield is priced at pump_cost_function(0), see Groundwater.bid().
+        depths.append(-G.deficit)
+        costs.append(G.pump_cost_function(0))
+    lower = max(G.deficit, 0)
+    upper = min(upper, G.max_deficit)
+    if upper > lower:
+        bounds = np.linspace(lower, upper, n + 1)
+        depths.extend(np.diff(bounds))
+        costs.extend(G.pump_costs(bounds[:-1], bounds[1:]) / np.diff(bounds))
+    return np.array(depths, dtype=float), np.array(costs, dtype=float)
+
+def linear(table: crops.CropTable) -> np.ndarray:
+    '''
+    Returns True for each crop whose production (and so revenue) is linear in the water supplied: a unit sigmoid production function with k=1 
+    and no production threshold (the defaults), or no water demand (fallow).
+    '''
+    return (table.types == crops.Names.FALLOW.value) | ((table.k == 1) & (table.no_production_threshold == 0) & np.equal(table.production_fxs, None))
+
+def solve(planner, inputs: np.ndarray, integer: bool = True, n_layers: int = 200) -> Solution:
+    '''
+    Solves the district allocation of land, surface water and groundwater as a single linear program, maximizing the total npv.
+
+    Arguments:
+        planner: system.CentralPlanner - planner providing the crops, portfolio and water states (they are not changed).
+        inputs: np.ndarray[shape=(crops x [ETo, kc, precip, price, discount_rate]), dtype=float]
+        integer: bool - if True (default) areas are whole units of land (a mixed integer program), otherwise the linear relaxation is solved.
+        n_layers: int - number of layers the groundwater deficit is divided into, 200 by default.
+    Returns:
+        Solution
+
+    Notes:
+        [1] Variables: the existing and new area of each crop, the surface water delivered to each crop, and the groundwater each crop pumps from each deficit layer.
+            Land may be partly supplied (up to its demand net of precipitation), its revenue is that of the land unsupplied 
+            plus the (constant) marginal revenue of each unit of water supplied, which is exact when production is linear in water (see linear()).
+        [2] The convex groundwater cost curve is represented exactly by its piecewise linear layers, each priced at the layer's average cost (pump_cost integral / depth).
+            With an increasing pump_cost_function lower layers are always pumped first, the error of the cost of a partly pumped layer is at most the
+            cost difference across that layer, so more layers give a tighter objective.
+        [3] Existing area is capped at portfolio + 1 units, matching CentralPlanner.is_new() (a unit is new once the crop's area exceeds its portfolio).
+        [4] Unlike the greedy planner, the groundwater layers are assigned to the crops that value them most,
+            since water costs are paid every year of a perennial crop's life but only once by an annual crop.
+        [5] The water of existing and new area is priced separately, since their costs are discounted by different (mature or age) schedules.
+        [6] scipy.optimize is imported on the first solve, so importing the solver (i.e. by system) does not import scipy.
+        [7] Crops whose production is not linear in water can not be represented, their land is fully supplied (or not planted) 
+            and the solution is flagged as not exact (Solution.exact), so it is not a bound on the greedy plan.
+        [8] The constraint matrices are sparse, so they grow linearly with the number of crops x layers.
+    '''
+    import scipy.sparse as sparse
+    import scipy.optimize as optimize
+    start = time.perf_counter()
+    inputs = np.asarray(inputs, dtype=float)
+    table = crops.CropTable.from_crops(planner.crops)
+    n, total_area = len(table), float(planner.total_area())
+    m = 2 * n # the existing and new area of each crop: [existing (n), new (n)].
+    new = np.repeat([False, True], n)
+    ids = np.tile(np.arange(n), 2)
+    demand = np.tile(np.maximum(table.water_demand(inputs[:, 0], inputs[:, 1]) - inputs[:, 2], 0), 2)
+    evaluate = lambda supplied: table.evaluate(inputs[ids][:, np.newaxis], supplied=supplied[:, np.newaxis], new=new[:, np.newaxis])[np.arange(m), ids, 3]
+    supplied = evaluate(demand)
+    partial = linear(table)[ids] & (demand > 0)
+    unsupplied = np.where(partial, evaluate(np.zeros(m)), supplied) # npv of a unit of land without water, or fully supplied if it can not be partly supplied.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        revenue = np.where(partial, (supplied - unsupplied) / demand, 0.0) # present value of the revenue of a unit of water.
+    factor = table.factors(inputs[:, 4], new.reshape(2, n))[1].ravel() # present value of an annual water cost of 1.
+    depths, unit_costs = layers(planner.G, max(planner.G.deficit, 0) + total_area * demand.max(), n_layers) if planner.G.active else (np.empty(0), np.empty(0))
+    k = len(depths)
+    # variables: [area (m), surface water (m), groundwater (m x k)]
+    c = np.concatenate((-unsupplied, planner.S.unit_cost * factor - revenue, (np.outer(factor, unit_costs) - revenue[:, np.newaxis]).ravel()))
+    constraints = []
+    land = np.concatenate((np.ones(m), np.zeros(m + m * k)))
+    constraints.append(optimize.LinearConstraint(land, total_area, total_area))
+    supply = sparse.hstack((sparse.diags(demand), -sparse.eye(m), -sparse.kron(sparse.eye(m), np.ones((1, k)))), format='csr')
+    constraints.append(optimize.LinearConstraint(supply, 0, np.where(partial, np.inf, 0))) # water supplied <= demand x area, or == if not partial.
+    surface = np.concatenate((np.zeros(m), np.ones(m), np.zeros(m * k)))
+    constraints.append(optimize.LinearConstraint(surface, -np.inf, max(planner.S.available, 0)))
+    if k:
+        ground = sparse.hstack((sparse.csr_matrix((k, 2 * m)), sparse.kron(np.ones((1, m)), sparse.eye(k))), format='csr')
+        constraints.append(optimize.LinearConstraint(ground, -np.inf, depths))
+    upper = np.concatenate((planner.portfolio + 1.0, np.full(n, np.inf), np.full(m, np.inf), np.tile(depths, m)))
+    integrality = np.concatenate((np.full(m, int(integer)), np.zeros(m + m * k)))
+    result = optimize.milp(c, constraints=constraints, integrality=integrality, bounds=optimize.Bounds(0, upper))
+    if result.x is None:
+        raise RuntimeError(f'the district allocation could not be solved: {result.message}')
+    x = result.x
+    gw = x[2 * m:].reshape(m, k) if k else np.zeros((m, 0))
+    sw = x[m:2 * m]
+    by_crop = lambda v: v.reshape(2, n).T
+    exact = bool(linear(table).all())
+    return Solution(area=by_crop(x[:m]), sw=by_crop(sw), gw=by_crop(gw.sum(axis=1)),
+                    water_cost=by_crop(planner.S.unit_cost * sw + gw @ unit_costs), inputs=inputs, objective=-result.fun,
+                    seconds=time.perf_counter() - start, message=result.message if exact else f'{result.message} (not exact: crops with non linear production were fully supplied)',
+                    exact=exact)
+
+def compare(planner, inputs: np.ndarray, integer: bool = True, n_layers: int = 200) -> Dict[str, Dict]:
+    '''
+    Compares the total npv (objective) and runtime of the greedy planner (CentralPlanner.plan()) and the exact solver (solve()),
+    each planning a copy of the planner.
+
+    Returns:
+        Dict in the form: {'greedy': {'objective', 'seconds', 'area'}, 'exact': {'objective', 'seconds', 'area', 'exact'}, 'gap': exact - greedy objective},
+        the gap is only a bound on the greedy plan's optimality if the solution is exact (see Solution.exact).
+    '''
+    greedy = deepcopy(planner)
+    start = time.perf_counter()
+    outputs = greedy.plan(inputs)
+    seconds = time.perf_counter() - start
+    solution = solve(deepcopy(planner), inputs, integer, n_layers)
+    objective = float(outputs[:, 7].sum())
+    return {'greedy': {'objective': objective, 'seconds': seconds, 'area': np.bincount(outputs[:, 0].astype(int), minlength=len(planner.crops))},
+            'exact': {'objective': solution.objective, 'seconds': solution.seconds, 'area': solution.area.sum(axis=1), 'exact': solution.exact},
+            'gap': solution.objective - objective}
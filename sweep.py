@@ -0,0 +1,161 @@
+from copy import deepcopy
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+import crops
+import system
+
+TABLE = np.dtype([('r', 'f8'), ('price', 'f8'), ('surface', 'f8'), ('crop', 'u2'),
+                  ('area', 'i8'), ('npv_sw', 'f8'), ('npv_gw', 'f8'), ('sw', 'f8'), ('gw', 'f8')])
+'''Tidy sweep results, one row per (r, price, surface, crop): area allocated, per unit npv (surface or groundwater supplied) and total water used by the crop.'''
+
+@dataclass
+class Sweep:
+    '''
+    Parameter sweep over discount rates, prices and surface water supplies for a central planner.
+
+    Arguments:
+        planner: system.CentralPlanner - planner providing the crops, portfolio and initial water states (it is not changed).
+        inputs: np.ndarray[shape=(crops x [ETo, kc, precip, price, discount_rate]), dtype=float] - base inputs.
+
+    Notes:
+        [1] The npv of each crop only depends on the crop economics (r and price), not the water supply.
+            These npv surfaces are computed once per (r, price) grid and cached, then broadcast over the surface water supplies.
+        [2] Allocations are computed for every grid point at once by the run(exact=False) greedy,
+            it matches CentralPlanner.plan() when pumping costs are linear (i.e. exponential(r=0)) and max_deficit is not binding,
+            up to the one unit of land that is partly supplied by surface water when it runs out. Ties go to the lowest crop id.
+        [3] run(exact=True) calls CentralPlanner.plan() for each grid point instead.
+    '''
+    planner: system.CentralPlanner
+    inputs: np.ndarray
+    _cache: Dict[Tuple[bytes, bytes], Tuple[np.ndarray, np.ndarray]] = field(init=False, repr=False, default_factory=dict)
+
+    def __post_init__(self):
+        self.table = crops.CropTable.from_crops(self.planner.crops)
+        self.inputs = np.asarray(self.inputs, dtype=float)
+        self.demand = np.maximum(self.table.water_demand(self.inputs[:, 0], self.inputs[:, 1]) - self.inputs[:, 2], 0)
+        self.pumped, self.pump_cost = self.planner.G.bids(self.demand)
+
+    def grid_inputs(self, r: np.ndarray, price: np.ndarray) -> np.ndarray:
+        '''
+        Returns the inputs broadcast over the grid: np.ndarray[shape=(r x price x crops x 5), dtype=float], price is a multiplier of the base prices.
+        '''
+        inputs = np.broadcast_to(self.inputs, (len(r), len(price)) + self.inputs.shape).copy()
+        inputs[..., 4] = np.asarray(r)[:, np.newaxis, np.newaxis]
+        inputs[..., 3] *= np.asarray(price)[np.newaxis, :, np.newaxis]
+        return inputs
+
+    def economics(self, r: np.ndarray, price: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns the per unit npv of each crop when supplied by surface water and by groundwater,
+        each an np.ndarray[shape=(r x price x [existing, new] x crops), dtype=float].
+        '''
+        r, price = np.asarray(r, dtype=float), np.asarray(price, dtype=float)
+        key = (r.tobytes(), price.tobytes())
+        if key not in self._cache:
+            inputs = self.grid_inputs(r, price)[:, :, np.newaxis]
+            new = np.array([False, True])[:, np.newaxis]
+            npv_sw = self.table.evaluate(inputs, supplied=self.demand, water_cost=self.planner.S.unit_cost * self.demand, new=new)[..., 3]
+            npv_gw = self.table.evaluate(inputs, supplied=self.pumped, water_cost=self.pump_cost, new=new)[..., 3]
+            self._cache[key] = (npv_sw, npv_gw)
+        return self._cache[key]
+
+    def allocate(self, npv_sw: np.ndarray, npv_gw: np.ndarray, surface: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        Greedy allocation of land for each grid point (see Notes [2]).
+
+        Arguments:
+            npv_sw, npv_gw: np.ndarray[shape=(points x [existing, new] x crops), dtype=float] - per unit npvs.
+            surface: np.ndarray[shape=(points), dtype=float] - surface water available.
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray] in the form: (area, sw, gw), each np.ndarray[shape=(points x crops)].
+        '''
+        points, n = len(surface), len(self.table)
+        total_area = float(self.planner.total_area())
+        # a crop is existing (not new) until its area exceeds its portfolio, see CentralPlanner.is_new().
+        capacity = np.broadcast_to(np.concatenate((self.planner.portfolio + 1.0, np.full(n, total_area))), (points, 2 * n)).copy()
+        demand = np.tile(self.demand, 2)
+        ids = np.tile(np.arange(n), 2)
+        area, sw, pumped = np.zeros((points, n)), np.zeros((points, n)), np.zeros((points, n))
+        land, available = np.full(points, total_area), np.asarray(surface, dtype=float).copy()
+        rows = np.arange(points)
+        # phase 1: land is supplied by surface water until it runs out.
+        surface_phase, fallowed = np.ones(points, dtype=bool), np.zeros(points, dtype=bool)
+        npv = npv_sw.reshape(points, 2 * n)
+        for o in np.argsort(-npv, axis=1, kind='stable').T:
+            value, d, c = npv[rows, o], demand[o], capacity[rows, o]
+            fallowed |= surface_phase & (value <= 0) & (land > 0)
+            use = surface_phase & ~fallowed
+            with np.errstate(divide='ignore', invalid='ignore'):
+                by_water = np.where(d > 0, np.floor(available / d), np.inf)
+            units = np.where(use, np.minimum(np.minimum(c, land), by_water), 0)
+            np.add.at(area, (rows, ids[o]), units)
+            np.add.at(sw, (rows, ids[o]), units * d)
+            capacity[rows, o] -= units
+            land -= units
+            available -= units * d
+            surface_phase &= ~(use & (by_water < np.minimum(c, land + units)))
+        # phase 2: the remaining land is supplied by groundwater.
+        npv = npv_gw.reshape(points, 2 * n)
+        for o in np.argsort(-npv, axis=1, kind='stable').T:
+            use = ~fallowed & (npv[rows, o] > 0)
+            units = np.where(use, np.minimum(capacity[rows, o], land), 0)
+            np.add.at(area, (rows, ids[o]), units)
+            np.add.at(pumped, (rows, ids[o]), units)
+            capacity[rows, o] -= units
+            land -= units
+        fallow = np.flatnonzero(self.table.types == crops.Names.FALLOW.value)[0]
+        area[:, fallow] += land
+        return area, sw, pumped * self.pumped
+
+    def run(self, r: Sequence[float], price: Sequence[float] = (1.0,), surface: Optional[Sequence[float]] = None, exact: bool = False) -> np.ndarray:
+        '''
+        Evaluates the npvs and allocations for every combination of r, price and surface water supply.
+
+        Arguments:
+            r: Sequence[float] - discount rates (replacing the inputs discount rates).
+            price: Sequence[float] - price multipliers (applied to the inputs prices), 1 by default.
+            surface: Sequence[float] - surface water supplies, the planner's available surface water by default.
+            exact: bool - if True each grid point is planned by CentralPlanner.plan(), False by default.
+        Returns:
+            np.ndarray[shape=(r x price x surface x crops), dtype=TABLE] - flatten (ravel) for a tidy table.
+        '''
+        r, price = np.asarray(r, dtype=float), np.asarray(price, dtype=float)
+        surface = np.asarray([self.planner.S.available] if surface is None else surface, dtype=float)
+        n = len(self.table)
+        shape = (len(r), len(price), len(surface))
+        npv_sw, npv_gw = self.economics(r, price)
+        if exact:
+            area, sw, gw = self._plan(r, price, surface)
+        else:
+            broadcast = lambda npv: np.broadcast_to(npv[:, :, np.newaxis], shape + npv.shape[2:]).reshape((-1,) + npv.shape[2:])
+            area, sw, gw = self.allocate(broadcast(npv_sw), broadcast(npv_gw), np.broadcast_to(surface, shape).ravel())
+        results = np.empty(shape + (n,), dtype=TABLE)
+        results['r'] = r[:, np.newaxis, np.newaxis, np.newaxis]
+        results['price'] = price[np.newaxis, :, np.newaxis, np.newaxis]
+        results['surface'] = surface[np.newaxis, np.newaxis, :, np.newaxis]
+        results['crop'] = np.arange(n)
+        results['area'] = np.round(area).reshape(shape + (n,))
+        results['npv_sw'] = npv_sw[:, :, np.newaxis, 0, :]
+        results['npv_gw'] = npv_gw[:, :, np.newaxis, 0, :]
+        results['sw'] = sw.reshape(shape + (n,))
+        results['gw'] = gw.reshape(shape + (n,))
+        return results
+
+    def _plan(self, r: np.ndarray, price: np.ndarray, surface: np.ndarray):
+        inputs = self.grid_inputs(r, price)
+        n = len(self.table)
+        area, sw, gw = (np.zeros((len(r), len(price), len(surface), n)) for _ in range(3))
+        for i in range(len(r)):
+            for j in range(len(price)):
+                for k, s in enumerate(surface):
+                    planner = deepcopy(self.planner)
+                    planner.S.supply(s)
+                    outputs = planner.plan(inputs[i, j])
+                    ids = outputs[:, 0].astype(int)
+                    area[i, j, k] = np.bincount(ids, minlength=n)
+                    sw[i, j, k] = np.bincount(ids, weights=outputs[:, 2], minlength=n)
+                    gw[i, j, k] = np.bincount(ids, weights=outputs[:, 3], minlength=n)
+        return area.reshape(-1, n), sw.reshape(-1, n), gw.reshape(-1, n)
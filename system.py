@@ -1,11 +1,18 @@
-from typing import Protocol
+import warnings
+from typing import List, Optional, Protocol, Tuple
 from abc import abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from concurrent import futures
 
 import numpy as np
 
 import water
 import crops
+import results
+import solver
+import utilities
+import instrument
+import cache as caches
 
 class Planner(Protocol):
     G: water.Groundwater
@@ -16,15 +23,139 @@ class Planner(Protocol):
     @abstractmethod
     def plan(self, inputs: np.ndarray) -> np.ndarray:
         pass
+    
+    @abstractmethod
+    def update_portfolio(self, outputs: np.ndarray):
+        pass
+
+def _check_groundwater(G):
+    if isinstance(G, water.GroundwaterField):
+        raise TypeError('planners price groundwater against a single deficit, G must be a water.Groundwater (see GroundwaterField.cell()), not a GroundwaterField.')
+
+def default_crops() -> np.ndarray:
+    '''
+    Returns the default crops: fallow, an annual and a perennial crop.
+    '''
+    return np.array([crops.Fallow(), crops.Annual(), crops.Perennial()], dtype=np.dtype(crops.Crop))
+
+@dataclass
+class Allocation:
+    '''
+    Live allocation state of a plan, updated as each unit (or block) of land is committed.
+    
+    Arguments:
+        portfolio: np.ndarray[shape=(assets), dtype=int] - area of each crop before the plan.
+        counts: np.ndarray[shape=(assets), dtype=int] - units of land committed to each crop.
+        sw: np.ndarray[shape=(assets), dtype=float] - surface water delivered to each crop.
+        gw: np.ndarray[shape=(assets), dtype=float] - groundwater pumped for each crop.
+        units: int - units of land committed.
+        ties: List[Tuple[int, np.ndarray]] - unit and tied crop ids of each tie broken by a random shuffle.
+        
+    Notes:
+        [1] The planner keeps the state of its current (or last) plan as CentralPlanner.allocation, so it can be inspected mid plan 
+            (i.e. from an instrument callback), all lookups are constant time.
+    '''
+    portfolio: np.ndarray
+    counts: np.ndarray = None
+    sw: np.ndarray = None
+    gw: np.ndarray = None
+    units: int = 0
+    ties: List[Tuple[int, np.ndarray]] = field(default_factory=list)
+    
+    def __post_init__(self):
+        n = len(self.portfolio)
+        self.counts = np.zeros(n, dtype=int) if self.counts is None else self.counts
+        self.sw = np.zeros(n) if self.sw is None else self.sw
+        self.gw = np.zeros(n) if self.gw is None else self.gw
+    
+    def is_new(self, id: int) -> bool:
+        '''
+        True if the next unit of land committed to crop id is new (i.e. the crop's area exceeds its portfolio).
+        '''
+        return self.portfolio[id] < self.counts[id]
+    
+    def remaining(self) -> np.ndarray:
+        '''
+        Returns the units of each crop's portfolio that have not been committed (yet).
+        '''
+        return np.maximum(self.portfolio.astype(int) - self.counts, 0)
+    
+    def commit(self, id: int, k: int = 1, sw: float = 0.0, gw: float = 0.0):
+        '''
+        Commits k units of land to crop id, using sw surface water and gw groundwater in total.
+        '''
+        self.counts[id] += k
+        self.sw[id] += sw
+        self.gw[id] += gw
+        self.units += k
+    
+    def total_sw(self) -> float:
+        return float(self.sw.sum())
+    
+    def total_gw(self) -> float:
+        return float(self.gw.sum())
+
+REPLAN_STEP_UNITS = 32
+'''Units of land CentralPlanner.replan() can scan for the first change in about the time block_plan() takes for a step (a block or a tie).'''
+
+@dataclass
+class WarmStart:
+    '''
+    A greedy plan and the state it was planned from, used to re-plan incrementally (see CentralPlanner.replan()).
+    
+    Arguments:
+        inputs: np.ndarray[shape=(assets x [ETo, kc, precip, price, discount_rate]), dtype=float] - inputs of the plan.
+        available: float - surface water available before the plan.
+        deficit: float - groundwater deficit before the plan.
+        portfolio: np.ndarray[shape=(assets), dtype=int] - portfolio before the plan.
+        key: Optional[str] - fingerprint of the crops and of the water parameters (not states) of the plan, None if they can not be fingerprinted.
+        rows: np.ndarray[shape=(rows x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float] - the plan's outputs, run length encoded.
+        repeats: np.ndarray[shape=(rows), dtype=int] - units of land per row.
+        ties: List[Tuple[int, np.ndarray]] - unit and tied crop ids of each tie broken by a random shuffle.
+        recomputed: float - fraction of the area evaluated by the plan, 1 for a cold plan.
+    '''
+    inputs: np.ndarray
+    available: float
+    deficit: float
+    portfolio: np.ndarray
+    key: Optional[str]
+    rows: np.ndarray = None
+    repeats: np.ndarray = None
+    ties: List[Tuple[int, np.ndarray]] = field(default_factory=list)
+    recomputed: float = 1.0
+    
+    def units(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        Returns the crop id, surface water, groundwater and npv of each unit of the plan.
+        '''
+        return tuple(np.repeat(self.rows[:, i], self.repeats) for i in (0, 2, 3, 7))
+    
+    def steps(self) -> int:
+        '''
+        Returns the number of steps block_plan() takes to plan the same land: a step per block (run of rows of the same crop and water bids) and per tie.
+        '''
+        if self.rows is None or len(self.rows) == 0:
+            return 0
+        bids = self.rows[:, [0, 2, 3]]
+        return 1 + int(np.any(bids[1:] != bids[:-1], axis=1).sum()) + len(self.ties)
 
 @dataclass
 class CentralPlanner:
-    G: water.Groundwater = water.Groundwater()
-    S: water.Surfacewater = water.Surfacewater()
-    crops: np.ndarray = np.array([crops.Fallow(), 
-                                  crops.Annual(),
-                                  crops.Perennial()], dtype=np.dtype(crops.Crop))
-    portfolio: np.ndarray = np.array([50, 25, 25], dtype='I')
+    G: water.Groundwater = field(default_factory=water.Groundwater)
+    S: water.Surfacewater = field(default_factory=water.Surfacewater)
+    crops: np.ndarray = field(default_factory=default_crops)
+    portfolio: np.ndarray = field(default_factory=lambda: np.array([50, 25, 25], dtype='I'))
+    rng: Optional[np.random.Generator] = None
+    '''Random number generator used to break ties, the global np.random state is used if None.'''
+    allocation: Optional[Allocation] = field(default=None, init=False, repr=False)
+    '''Allocation state of the current (or last) plan.'''
+    cache: Optional[caches.Cache] = field(default=None, repr=False, compare=False)
+    '''Cache of plan results, plans are always computed if None.'''
+    warm_start: Optional[WarmStart] = field(default=None, init=False, repr=False, compare=False)
+    '''The last greedy plan, re-planned incrementally by replan().'''
+    
+    def __post_init__(self):
+        _check_groundwater(self.G)
     
     def id(self, name: str) -> int:
         name = str.upper(name)
@@ -37,10 +168,28 @@ class CentralPlanner:
         id = self.id(name)
         return self.crops[id]
              
+    def shuffle(self, x: np.ndarray):
+        '''
+        Shuffles x in place, used to randomly break ties between equally valued choices.
+        '''
+        instrument.count('plan.shuffle')
+        (np.random if self.rng is None else self.rng).shuffle(x)
+             
     def total_area(self) -> int:
         return np.sum(self.portfolio)
     
-    def is_new(self, id: int, outputs: np.ndarray) -> bool:
+    def update_portfolio(self, outputs: np.ndarray):
+        '''
+        Sets the portfolio to the area allocated to each crop in a plan's (dense) outputs.
+        '''
+        self.portfolio = np.bincount(outputs[:,0].astype(int), minlength=len(self.crops)).astype('I')
+    
+    def is_new(self, id: int, outputs: Optional[np.ndarray] = None) -> bool:
+        '''
+        True if the next unit of land committed to crop id is new, from the allocation state of the current plan, or from a plan's (dense) outputs if provided.
+        '''
+        if outputs is None:
+            return self.allocation.is_new(id)
         return self.portfolio[id] < (outputs[:,0] == id).sum()
     
     def crop_outputs(self, id: int, inputs: np.ndarray, new: bool = False) -> np.ndarray:
@@ -48,26 +197,114 @@ class CentralPlanner:
         demand = crop.water_demand(eto=inputs[0], kc=inputs[1])
         surface, ground = water.bid(d=demand, p=inputs[2], s=self.S, g=self.G)
         portion_water: float = (surface[0] + ground[0] + inputs[2]) / demand if 0 < demand else 1
-        marginal_revenue = crop.mr(p=inputs[3], q=crop.production(portion_water), r=inputs[4])
+        marginal_revenue = crop.mr(p=inputs[3], q=crop.production(portion_water), r=inputs[4], new=new)
         marginal_cost = crop.mc(new=new, wc=surface[1] + ground[1], r=inputs[4])
         return np.array([id, demand, surface[0], ground[0], inputs[2], marginal_revenue, marginal_cost, crop.npv(marginal_revenue, marginal_cost)])
     
-    def plan(self, inputs: np.ndarray):
+    def choices(self, inputs: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        '''
+        Returns the outputs of committing the next unit of land to each crop, given the current water state.
+        
+        Arguments:
+            inputs: np.ndarray[shape=(assets x [ETo, kc, precip, price, discount_rate]), dtype=float]
+            counts: np.ndarray[shape=(assets), dtype=int] - units of land already committed to each crop.
+        Returns:
+            choices: np.ndarray[shape=(assets x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float]
+        '''
+        choices = np.full((len(self.crops), 8), np.nan)
+        for c in range(0, len(self.crops)):
+            choices[c,:] = self.crop_outputs(c, inputs[c,:], self.portfolio[c] < counts[c])
+        return choices
+    
+    def plan(self, inputs: np.ndarray, blocks: bool = True, output: str = 'dense', method: str = 'greedy'):
         '''
         This will loop over each unit of land committing it to production of the highest npv crop, given the available water and other factors.
         
         Arguments:
             inputs: np.ndarray[shape=(assets x [ETo, kc, precip, price, discount_rate]), dtype=float]
+            blocks: bool - if True (default) consecutive units with the same choice are committed together by block_plan(), 
+                otherwise each unit of land is evaluated one at a time.
+            output: str - 'dense' (default), 'records' (np.ndarray[dtype=results.RECORD]) or 'rle' (results.RunLengthPlan).
+            method: str - 'greedy' (default) or 'exact', which allocates all of the land in a single solve (see exact_plan()).
+        Returns:
+            outputs: np.ndarray[shape=(total_area x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float], in the requested output format.
+        
+        Notes:
+            [1] If the planner has a cache, a plan of the same crops, portfolio, water states, random number generator state and inputs is read from it,
+                and the water, random number generator and allocation states are set to those left by the cached plan (S is replaced by a copy of the cached surface water).
+        '''
+        with instrument.timer('plan'):
+            if self.cache is None:
+                return self._plan(inputs, blocks, output, method)
+            def compute():
+                outputs = self._plan(inputs, blocks, output, method)
+                return outputs, self.S, self.G.deficit, utilities.rng_state(self.rng), self.allocation, self.warm_start
+            outputs, self.S, self.G.deficit, state, self.allocation, self.warm_start = self.cache.call(
+                compute, 'CentralPlanner.plan', self.crops, self.portfolio, self.G, self.S, utilities.rng_state(self.rng), 
+                np.asarray(inputs, dtype=float), blocks, output, method)
+            self.rng = utilities.set_rng_state(state, self.rng)
+            return outputs
+    
+    def _plan(self, inputs: np.ndarray, blocks: bool, output: str, method: str):
+        if method == 'exact':
+            self.warm_start = None
+            return self.exact_plan(inputs, output)
+        if method != 'greedy':
+            raise ValueError(f'{method} is not a valid planning method, expected one of: greedy or exact.')
+        return self.block_plan(inputs, output) if blocks else self.unit_plan(inputs, output)
+    
+    def exact_plan(self, inputs: np.ndarray, output: str = 'dense'):
+        '''
+        Allocates the land, surface water and groundwater by solving a single mixed integer linear program that maximizes the total npv (see solver.solve()).
+        
+        Arguments:
+            inputs: np.ndarray[shape=(assets x [ETo, kc, precip, price, discount_rate]), dtype=float]
+            output: str - 'dense' (default), 'records' or 'rle', see plan().
+        Returns:
+            outputs: np.ndarray[shape=(total_area x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float], in the requested output format.
+        
+        Notes:
+            [1] The allocation is only exact if each crop's production is linear in the water supplied (see solver.linear()), 
+                otherwise a warning is issued since the plan is not a bound on the greedy plan.
+        '''
+        solution = solver.solve(self, inputs)
+        if not solution.exact:
+            warnings.warn(f'the exact plan is not exact: {solution.message}', stacklevel=3)
+        self.allocation = allocation = Allocation(portfolio=self.portfolio)
+        for c, units in enumerate(np.round(solution.area.sum(axis=1)).astype(int)):
+            allocation.commit(c, units, solution.sw[c].sum(), solution.gw[c].sum())
+        self.S.deliver(q=solution.sw.sum())
+        self.G.pump(q=solution.gw.sum())
+        return solution.outputs(crops.CropTable.from_crops(self.crops), output)
+    
+    def unit_plan(self, inputs: np.ndarray, output: str = 'dense'):
+        '''
+        Per unit version of plan(), evaluates each unit of land one at a time.
+        
+        Arguments:
+            inputs: np.ndarray[shape=(assets x [ETo, kc, precip, price, discount_rate]), dtype=float]
+            output: str - 'dense' (default), 'records' or 'rle', see plan().
         Returns:
-            outputs: np.ndarray[shape=(total_area x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float]
+            outputs: np.ndarray[shape=(total_area x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float], in the requested output format.
+        '''
+        self.allocation = Allocation(portfolio=self.portfolio)
+        warm_start = self._warm_start(inputs)
+        outputs = self._units(inputs)
+        self._record(warm_start, [outputs], [np.ones(len(outputs), dtype=int)])
+        return outputs if output == 'dense' else results.format_plan(outputs, np.ones(len(outputs), dtype=int), output)
+    
+    def _units(self, inputs: np.ndarray, start: int = 0) -> np.ndarray:
         '''
-        outputs = np.full((self.total_area(), 8), np.nan) # area x [id, d, sw, gw, p, mr, mc, npv]
-        for n in range(0,5): #self.total_area()):
+        Plans the units of land from start one at a time, continuing the current allocation, returns their outputs.
+        '''
+        outputs = np.full((self.total_area() - start, 8), np.nan) # area x [id, d, sw, gw, p, mr, mc, npv]
+        allocation = self.allocation
+        for n in range(0, len(outputs)):
             # choices: shape = assets x [id, demand, sw, gw, precip, mr, mc, npv] 
             choices = np.full((len(self.crops), 8), np.nan)
             for c in range(0, len(self.crops)):
-                new = self.is_new(c, outputs)
-                choices[c,:] = self.crop_outputs(c, inputs[c,:], new)
+                with instrument.timer('plan.crop_outputs'):
+                    choices[c,:] = self.crop_outputs(c, inputs[c,:], allocation.is_new(c))
             maxnpv = choices[:,7].max()
             if maxnpv <= 0:
                 fallow = self.id(name=crops.Names.FALLOW.name)
@@ -75,9 +312,479 @@ class CentralPlanner:
             else:
                 maxes = choices[choices[:,7] == maxnpv]
                 if maxes.shape[0] > 1:
-                    np.random.shuffle(maxes)
+                    allocation.ties.append((start + n, maxes[:,0].astype(int)))
+                    self.shuffle(maxes)
                     maxes = maxes[0,:]
                 outputs[n,:] = maxes
             self.S.deliver(q=outputs[n,2])
             self.G.pump(q=outputs[n,3])
-        return outputs
\ No newline at end of file
+            allocation.commit(int(outputs[n,0]), 1, outputs[n,2], outputs[n,3])
+        instrument.count('plan.units', len(outputs))
+        return outputs
+    
+    def block_plan(self, inputs: np.ndarray, output: str = 'dense'):
+        '''
+        Event driven version of plan(), commits runs of consecutive units of land to the highest npv crop in a single step.
+        
+        Arguments:
+            inputs: np.ndarray[shape=(assets x [ETo, kc, precip, price, discount_rate]), dtype=float]
+            output: str - 'dense' (default), 'records' or 'rle', see plan().
+        Returns:
+            outputs: np.ndarray[shape=(total_area x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float], in the requested output format.
+        
+        Notes:
+            [1] The winning crop can only change when: a crop's surface water bid is curtailed, the groundwater deficit crosses a pumping threshold, 
+                the winning crop's area exceeds its portfolio (so it becomes new), or rising pumping costs close the gap to the next best crop. 
+                Each block is bounded by the first of these events, and the last unit of the block is found by bisection.
+            [2] The result matches plan(blocks=False) (up to floating point rounding of the water states) when the pump_cost_function is monotone, 
+                ties are resolved one unit at a time using the same random shuffle.
+            [3] Once no crop has a positive npv all of the remaining land is fallowed, since fallowing does not change the water states.
+        '''
+        self.allocation = Allocation(portfolio=self.portfolio)
+        warm_start = self._warm_start(inputs)
+        rows, repeats = self._blocks(inputs)
+        self._record(warm_start, rows, repeats)
+        if not rows:
+            return results.format_plan(np.empty((0, 8)), np.empty(0, dtype=int), output)
+        with instrument.timer('plan.format'):
+            return results.format_plan(np.concatenate(rows), np.concatenate(repeats), output)
+    
+    def _blocks(self, inputs: np.ndarray, start: int = 0):
+        '''
+        Plans the units of land from start in blocks, continuing the current allocation.
+        
+        Returns:
+            Tuple[List[np.ndarray], List[np.ndarray]] in the form: (blocks of rows x [id, demand, sw, gw, precip, mr, mc, npv], units of land per row).
+        '''
+        total_area = int(self.total_area())
+        rows, repeats = [], [] # blocks of rows x [id, d, sw, gw, p, mr, mc, npv], and units of land per row.
+        allocation = self.allocation
+        counts = allocation.counts
+        n = start
+        while n < total_area:
+            with instrument.timer('plan.choices'):
+                choices = self.choices(inputs, counts)
+            maxnpv = choices[:,7].max()
+            if maxnpv <= 0:
+                fallow = self.id(name=crops.Names.FALLOW.name)
+                rows.append(choices[fallow:fallow+1,:])
+                repeats.append([total_area - n])
+                allocation.commit(fallow, total_area - n)
+                break
+            maxes = choices[choices[:,7] == maxnpv]
+            if maxes.shape[0] > 1:
+                allocation.ties.append((n, maxes[:,0].astype(int)))
+                self.shuffle(maxes)
+                rows.append(maxes[0:1,:])
+                repeats.append([1])
+                allocation.commit(int(maxes[0,0]), 1, maxes[0,2], maxes[0,3])
+                self.S.deliver(q=maxes[0,2])
+                self.G.pump(q=maxes[0,3])
+                n += 1
+                continue
+            c = int(maxes[0,0])
+            with instrument.timer('plan.block_length'):
+                k = self._block_length(c, choices, inputs, counts, total_area - n)
+            with instrument.timer('plan.block_outputs'):
+                block, block_repeats = self._block_outputs(c, choices[c,:], inputs[c,:], allocation.is_new(c), k)
+            instrument.count('plan.blocks')
+            instrument.event('plan.block', crop=c, start=n, units=k)
+            rows.append(block)
+            repeats.append(block_repeats)
+            allocation.commit(c, k, k * choices[c,2], k * choices[c,3])
+            self.S.deliver(q=k * choices[c,2])
+            self.G.pump(q=k * choices[c,3])
+            n += k
+        instrument.count('plan.units', total_area - start)
+        return rows, repeats
+    
+    def _warm_start(self, inputs: np.ndarray) -> WarmStart:
+        '''
+        Returns the warm start record of a greedy plan from the current state, its rows are recorded once the plan is complete (see _record()).
+        '''
+        try:
+            key = caches.fingerprint(self.crops, self.G.active, self.G.max_deficit, self.G.pump_cost_function, type(self.S).__qualname__, self.S.unit_cost)
+        except TypeError:
+            key = None
+        return WarmStart(inputs=np.array(inputs, dtype=float), available=self.S.available, deficit=self.G.deficit, 
+                         portfolio=np.array(self.portfolio), key=key)
+    
+    def _record(self, warm_start: WarmStart, rows: List[np.ndarray], repeats: List[np.ndarray], recomputed: float = 1.0):
+        warm_start.rows = np.concatenate(rows) if rows else np.empty((0, 8))
+        warm_start.repeats = np.concatenate(repeats) if repeats else np.empty(0, dtype=int)
+        warm_start.ties = self.allocation.ties
+        warm_start.recomputed = recomputed
+        self.warm_start = warm_start
+    
+    def replan(self, inputs: np.ndarray, blocks: bool = True, output: str = 'dense', previous: Optional[WarmStart] = None):
+        '''
+        Incremental (warm start) version of plan(), re-evaluates only the land whose choice can change since a previous greedy plan,
+        i.e. after a crop's price, or the surface water supply, changes.
+        
+        Arguments:
+            inputs: np.ndarray[shape=(assets x [ETo, kc, precip, price, discount_rate]), dtype=float]
+            blocks: bool - if True (default) the land that is re-evaluated is planned by block_plan(), otherwise by unit_plan().
+            output: str - 'dense' (default), 'records' or 'rle', see plan().
+            previous: Optional[WarmStart] - the previous plan, the planner's last greedy plan (warm_start) by default.
+        Returns:
+            outputs: np.ndarray[shape=(total_area x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float], in the requested output format.
+        
+        Notes:
+            [1] The previous plan is replayed up to the first unit of land whose choice can change (see _first_change()), and the rest is planned as usual,
+                from the water states, inputs and portfolio of the planner. A cold plan is made if there is no previous plan, 
+                or its crops, total area or water parameters (not states) differ.
+            [2] The result matches plan() (up to floating point rounding of the water states): ties in the replayed units are broken by the same random shuffles,
+                and the land is re-evaluated from the first tie that is broken differently.
+            [3] The fraction of the area re-evaluated is reported as warm_start.recomputed (and counted by the instrument as plan.recomputed).
+            [4] Finding the first change is a vectorized pass over the replayed units, so the saving is largest against unit_plan() 
+                (or crops that are costly to evaluate), block_plan() already evaluates each block of land once.
+                If blocks, a cold block_plan() is made when it is cheaper: when the previous plan took fewer steps (see WarmStart.steps()) 
+                than one per REPLAN_STEP_UNITS units of land, i.e. unless most of the land was planned by ties broken one unit at a time.
+        '''
+        previous = self.warm_start if previous is None else previous
+        total_area = int(self.total_area())
+        with instrument.timer('replan'):
+            cold = previous is None or previous.key is None or previous.repeats.sum() != total_area or (blocks and previous.steps() * REPLAN_STEP_UNITS < total_area)
+            warm_start = None if cold else self._warm_start(inputs) # the key is only fingerprinted if the previous plan can be replayed.
+            if cold or previous.key != warm_start.key:
+                instrument.count('plan.recomputed', total_area)
+                return self.plan(inputs, blocks, output)
+            inputs = warm_start.inputs
+            with instrument.timer('replan.first_change'):
+                start = self._first_change(inputs, previous)
+            self.allocation = allocation = Allocation(portfolio=self.portfolio)
+            ids = np.repeat(previous.rows[:,0], previous.repeats)
+            for n, tied in previous.ties:
+                if n >= start:
+                    break
+                state = utilities.rng_state(self.rng)
+                shuffled = tied.astype(float)[:, np.newaxis] # shuffled as the tied rows of choices are, so the random numbers drawn are the same.
+                self.shuffle(shuffled)
+                if shuffled[0,0] != ids[n]:
+                    self.rng = utilities.set_rng_state(state, self.rng)
+                    start = n
+                    break
+                allocation.ties.append((n, tied))
+            ends = np.cumsum(previous.repeats)
+            m = int(np.searchsorted(ends, start, side='left')) # rows of the previous plan before start, the last one possibly in part.
+            rows = [previous.rows[:m + 1]] if start > 0 else []
+            repeats = [np.minimum(previous.repeats[:m + 1], start - (ends[:m + 1] - previous.repeats[:m + 1]))] if start > 0 else []
+            if start > 0:
+                # water is delivered by block (consecutive rows of the same crop and water use), as it is by block_plan().
+                replayed = np.column_stack((rows[0][:, [0, 2, 3]], repeats[0]))
+                blocks_start = np.flatnonzero(np.r_[True, np.any(replayed[1:, :3] != replayed[:-1, :3], axis=1)])
+                for (c, sw, gw), k in zip(replayed[blocks_start, :3], np.add.reduceat(replayed[:, 3], blocks_start)):
+                    allocation.commit(int(c), int(k), k * sw, k * gw)
+                    self.S.deliver(q=k * sw)
+                    self.G.pump(q=k * gw)
+            if blocks:
+                block_rows, block_repeats = self._blocks(inputs, start)
+                rows, repeats = rows + block_rows, repeats + block_repeats
+            else:
+                unit_rows = self._units(inputs, start)
+                rows, repeats = rows + [unit_rows], repeats + [np.ones(len(unit_rows), dtype=int)]
+            recomputed = (total_area - start) / total_area if total_area else 0.0
+            instrument.count('plan.recomputed', total_area - start)
+            instrument.event('replan', start=start, recomputed=recomputed)
+            self._record(warm_start, rows, repeats, recomputed)
+            return results.format_plan(warm_start.rows, warm_start.repeats, output)
+    
+    def _first_change(self, inputs: np.ndarray, previous: WarmStart, chunk: int = 64) -> int:
+        '''
+        Returns the first unit of land of a previous plan whose choice can change with the inputs, and the water and portfolio states of the planner.
+        
+        Notes:
+            [1] The outputs of a crop at a unit of land are unchanged if its inputs, whether it is new (the portfolio), its surface water bid 
+                (the available surface water) and its groundwater bid (the deficit) are unchanged, given the water used by the units before it.
+            [2] A unit's choice can change if the outputs of its chosen crop change, or the outputs of another crop change 
+                and its npv is not below the chosen crop's npv both before and after the change.
+            [3] The units are scanned in chunks of growing size (from chunk units), all crops of a chunk are evaluated in a single pass (see crops.CropTable.evaluate()).
+        '''
+        table = crops.CropTable.from_crops(self.crops)
+        tables = {}
+        ids, sw, gw, npv = previous.units()
+        ids = ids.astype(int)
+        used_sw, used_gw = np.cumsum(sw) - sw, np.cumsum(gw) - gw # water used by the units before each unit.
+        changed_inputs = ~np.all(previous.inputs == inputs, axis=1)
+        configurations = [(previous.inputs, previous.available, previous.deficit, previous.portfolio), 
+                          (inputs, self.S.available, self.G.deficit, self.portfolio)]
+        counts = np.zeros(len(self.crops), dtype=int)
+        a = 0
+        while a < len(ids):
+            b = min(a + chunk, len(ids))
+            chosen = np.zeros((b - a, len(self.crops)), dtype=bool)
+            chosen[np.arange(b - a), ids[a:b]] = True
+            before = counts + np.cumsum(chosen, axis=0) - chosen # units committed to each crop before each unit.
+            bids = []
+            for x, available, deficit, portfolio in configurations:
+                D = np.maximum(table.water_demand(x[:, 0], x[:, 1]) - x[:, 2], 0)
+                surface = (available - used_sw[a:b])[:, np.newaxis]
+                bids.append((x, np.where(surface < D, surface, D), D, (deficit + used_gw[a:b])[:, np.newaxis], portfolio < before))
+            (_, s0, D0, _, new0), (_, s1, D1, _, new1) = bids
+            # groundwater bids (D - s) only differ if the surface bids or inputs differ, their costs also differ if the deficit does.
+            changed = changed_inputs | (new0 != new1) | (s0 != s1)
+            if self.G.active and previous.deficit != self.G.deficit:
+                changed |= (D0 > s0) | (D1 > s1)
+            can_change = (changed & chosen).any(axis=1)
+            stop = int(np.argmax(can_change)) + 1 if can_change.any() else b - a # units after the first changed choice need not be evaluated.
+            losers = changed[:stop] & ~chosen[:stop]
+            units, columns = np.flatnonzero(losers.any(axis=1)), np.flatnonzero(losers.any(axis=0))
+            if len(units):
+                # only the crops (columns) whose outputs changed are evaluated, i.e. a single crop after a price change.
+                key = tuple(columns)
+                if key not in tables:
+                    tables[key] = crops.CropTable.from_crops(self.crops[columns])
+                best = npv[a + units, np.newaxis]
+                below = best - 1e-9 * np.maximum(np.abs(best), 1) # outputs evaluated in a single pass may differ from crop_outputs() by rounding.
+                cells = np.ix_(units, columns)
+                for x, s, D, deficits, new in bids:
+                    ground, ground_cost = self.G.bids(D[columns] - s[cells], deficits[units])
+                    npvs = tables[key].evaluate(x[columns], supplied=s[cells] + ground, water_cost=self.S.unit_cost * s[cells] + ground_cost, new=new[cells])[..., 3]
+                    can_change[units] |= (losers[cells] & (npvs >= below)).any(axis=1)
+            if can_change.any():
+                return a + int(np.argmax(can_change))
+            counts += chosen.sum(axis=0)
+            a, chunk = b, 2 * chunk
+        return len(ids)
+    
+    def _block_events(self, c: int, choices: np.ndarray, counts: np.ndarray, remaining: int) -> int:
+        '''
+        Returns the number of units crop c can be committed before the next event that can change the water bids of any crop.
+        '''
+        def first_crossing(level: float, step: float, thresholds: np.ndarray) -> int:
+            # first j > 0 such that level + j * step crosses above a threshold (step > 0).
+            ahead = thresholds[np.isfinite(thresholds) & (thresholds >= level)]
+            return int(np.floor((ahead - level) / step).min()) + 1 if ahead.size else remaining
+        events = [remaining]
+        if not self.portfolio[c] < counts[c]:
+            events.append(int(self.portfolio[c]) - int(counts[c]) + 1)
+        sw, gw, surface_demand = choices[c,2], choices[c,3], np.maximum(choices[:,1] - choices[:,4], 0)
+        if sw > 0:
+            events.append(first_crossing(-self.S.available, sw, -surface_demand[surface_demand > 0]))
+        if gw > 0 and self.G.active:
+            thresholds = np.concatenate((-surface_demand, [0], self.G.max_deficit - surface_demand))
+            events.append(first_crossing(self.G.deficit, gw, thresholds))
+        return max(1, min(events))
+    
+    def _is_block(self, c: int, choices: np.ndarray, inputs: np.ndarray, counts: np.ndarray, j: int) -> bool:
+        '''
+        True if crop c, with the same water bids, is still the unique best choice after committing j units to it.
+        '''
+        rights = isinstance(self.S, water.SurfaceRights) # its available setter drops the supply above the claims, so undelivered is restored instead.
+        supply, deficit = self.S.undelivered if rights else self.S.available, self.G.deficit
+        self.S.available = self.S.available - j * choices[c,2]
+        self.G.deficit = deficit + j * choices[c,3] if self.G.active else 0
+        counts = counts.copy()
+        counts[c] += j
+        try:
+            hypothetical = self.choices(inputs, counts)
+        finally:
+            if rights:
+                self.S.undelivered = supply
+            else:
+                self.S.available = supply
+            self.G.deficit = deficit
+        maxnpv = hypothetical[:,7].max()
+        return maxnpv > 0 and (hypothetical[:,7] == maxnpv).sum() == 1 and hypothetical[c,7] == maxnpv \
+            and hypothetical[c,2] == choices[c,2] and hypothetical[c,3] == choices[c,3] \
+            and (self.portfolio[c] < counts[c]) == (self.portfolio[c] < counts[c] - j)
+    
+    def _block_length(self, c: int, choices: np.ndarray, inputs: np.ndarray, counts: np.ndarray, remaining: int) -> int:
+        '''
+        Returns the number of consecutive units of land committed to crop c before the best choice changes.
+        '''
+        window = self._block_events(c, choices, counts, remaining)
+        if window == 1 or self._is_block(c, choices, inputs, counts, window - 1):
+            return window
+        lo, hi = 0, window - 1 # _is_block is True at lo and False at hi.
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self._is_block(c, choices, inputs, counts, mid):
+                lo = mid
+            else:
+                hi = mid
+        return hi
+    
+    def _block_outputs(self, c: int, row: np.ndarray, inputs: np.ndarray, new: bool, k: int):
+        '''
+        Returns the outputs for k consecutive units of land committed to crop c, starting from the current water state.
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray] in the form: (rows x [id, demand, sw, gw, precip, mr, mc, npv], units of land per row).
+        '''
+        if row[3] > 0 and self.G.active and k > 1:
+            crop = self.crops[c]
+            rows = np.tile(row, (k, 1))
+            surface_cost = self.S.bid(row[2])[1]
+            ground_costs = self.G.bids(row[3], self.G.deficit + np.arange(k) * row[3])[1]
+            rows[:,6] = crop.mc(new=new, wc=surface_cost + ground_costs, r=inputs[4])
+            rows[:,7] = crop.npv(rows[:,5], rows[:,6])
+            return rows, np.ones(k, dtype=int)
+        return row[np.newaxis,:], np.array([k])
+
+def choose(table: crops.CropTable, G: water.Groundwater, unit_cost: float, inputs: np.ndarray, 
+           allotment: np.ndarray, deficits: np.ndarray, current: np.ndarray, seed=None) -> np.ndarray:
+    '''
+    Returns the highest npv crop for each parcel, given the water available to it.
+    
+    Arguments:
+        table: crops.CropTable - the crops.
+        G: water.Groundwater - groundwater, used to price pumping (its state is not changed).
+        unit_cost: float - unit cost of surface water.
+        inputs: np.ndarray[shape=(parcels x crops x [ETo, kc, precip, price, discount_rate]), dtype=float]
+        allotment: np.ndarray[shape=(parcels), dtype=float] - surface water available to each parcel.
+        deficits: np.ndarray[shape=(parcels), dtype=float] - groundwater deficit each parcel's pumping is priced at.
+        current: np.ndarray[shape=(parcels), dtype=int] - crop currently grown on each parcel, other crops are new.
+        seed: seed of the np.random.Generator used to break ties.
+    Returns:
+        choices: np.ndarray[shape=(parcels), dtype=int] - crop id chosen for each parcel, fallow if no crop has a positive npv.
+    '''
+    demand = np.maximum(table.water_demand(inputs[..., 0], inputs[..., 1]) - inputs[..., 2], 0)
+    sw = np.minimum(demand, allotment[:, np.newaxis])
+    gw, gw_cost = G.bids(demand - sw, deficits[:, np.newaxis])
+    new = np.arange(len(table)) != current[:, np.newaxis]
+    npv = table.evaluate(inputs, supplied=sw + gw, water_cost=unit_cost * sw + gw_cost, new=new)[..., 3]
+    best = npv.max(axis=1)
+    ties = npv == best[:, np.newaxis]
+    choices = (ties * np.random.default_rng(seed).random(ties.shape)).argmax(axis=1)
+    fallow = np.flatnonzero(table.types == crops.Names.FALLOW.value)[0]
+    return np.where(best > 0, choices, fallow)
+
+@dataclass
+class IndividualPlanner:
+    '''
+    Agent based planner, each parcel (one unit of land) chooses its own highest npv crop, sharing a water district's surface water and groundwater.
+    
+    Arguments:
+        G: water.Groundwater - groundwater shared by all parcels.
+        S: water.Surfacewater - surface water shared by all parcels, or a water.SurfaceRights with one right per parcel.
+        crops: np.ndarray - crops (and fallow) each parcel can choose between.
+        portfolio: np.ndarray[shape=(parcels), dtype=int] - crop id currently grown on each parcel.
+        priority: Optional[np.ndarray[shape=(parcels), dtype=int]] - parcel indices in surface water priority (seniority) order, 
+            the seniority of the rights (if S is a SurfaceRights) or parcel index order by default.
+        rng: Optional[np.random.Generator] - random number generator used to break ties.
+        max_rounds: int - maximum rounds of choosing and reconciling water, 10 by default.
+        processes: int - number of worker processes parcels are partitioned across, parcels are evaluated in this process if 1 (default).
+        chunksize: int - number of parcels evaluated by a worker at a time, 250,000 by default.
+    
+    Notes:
+        [1] Each round all parcels choose in a vectorized batch, treating the surface water left by more senior parcels' previous round choices as their allotment,
+            and pricing pumping at the deficit left by more senior parcels. The district then reconciles these choices (see water.bids()), 
+            rounds are repeated until no parcel changes its choice or max_rounds is reached.
+        [2] Unlike the CentralPlanner, the portfolio holds a crop id per parcel.
+        [3] With surface water rights, a parcel's allotment is what its right would be allocated given the demands of the other parcels 
+            (see water.SurfaceRights.allotments()), so senior rights are filled first and rights of equal priority share shortages pro rata.
+    '''
+    G: water.Groundwater = field(default_factory=water.Groundwater)
+    S: water.Surfacewater = field(default_factory=water.Surfacewater)
+    crops: np.ndarray = field(default_factory=default_crops)
+    portfolio: np.ndarray = field(default_factory=lambda: np.repeat(np.arange(3), [50, 25, 25]))
+    priority: Optional[np.ndarray] = None
+    rng: Optional[np.random.Generator] = None
+    max_rounds: int = 10
+    processes: int = 1
+    chunksize: int = 250_000
+    
+    def __post_init__(self):
+        _check_groundwater(self.G)
+    
+    def total_area(self) -> int:
+        return len(self.portfolio)
+    
+    def update_portfolio(self, outputs: np.ndarray):
+        '''
+        Sets the portfolio to the crop chosen for each parcel in a plan's (dense) outputs.
+        '''
+        self.portfolio = outputs[:,0].astype(int)
+    
+    def _choose(self, table: 'crops.CropTable', inputs: np.ndarray, allotment: np.ndarray, deficits: np.ndarray, pool: Optional['futures.ProcessPoolExecutor'] = None) -> np.ndarray:
+        rng = np.random.default_rng() if self.rng is None else self.rng
+        n = self.total_area()
+        bounds = list(range(0, n, self.chunksize)) + [n]
+        chunks = [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+        seeds = rng.integers(0, 2**63, size=len(chunks))
+        if pool is None or len(chunks) == 1:
+            choices = [choose(table, self.G, self.S.unit_cost, inputs[i], allotment[i], deficits[i], self.portfolio[i], seed) 
+                       for i, seed in zip(chunks, seeds)]
+        else:
+            choices = list(pool.map(choose, [table] * len(chunks), [self.G] * len(chunks), [self.S.unit_cost] * len(chunks),
+                                    [inputs[i] for i in chunks], [allotment[i] for i in chunks], [deficits[i] for i in chunks], 
+                                    [self.portfolio[i] for i in chunks], seeds))
+        return np.concatenate(choices)
+    
+    def _signals(self, demand: np.ndarray, order: np.ndarray):
+        '''
+        Returns the surface water allotment and groundwater deficit seen by each parcel, given the demands of more senior parcels.
+        '''
+        ordered = demand[order]
+        allotment, deficits = np.empty(len(demand)), np.empty(len(demand))
+        if isinstance(self.S, water.SurfaceRights):
+            allotment = self.S.allotments(demand)
+            sw = self.S.allocate(demand)[order]
+        else:
+            before = np.cumsum(ordered) - ordered
+            allotment[order] = np.maximum(self.S.available - before, 0)
+            sw = np.clip(self.S.available - before, 0, ordered)
+        pumped = np.cumsum(ordered - sw) - (ordered - sw)
+        deficits[order] = np.minimum(self.G.deficit + pumped, max(self.G.max_deficit, self.G.deficit))
+        return allotment, deficits
+    
+    def plan(self, inputs: np.ndarray, output: str = 'dense'):
+        '''
+        Allocates each parcel to its highest npv crop, given the water available to it from the district.
+        
+        Arguments:
+            inputs: np.ndarray[shape=(parcels x crops x [ETo, kc, precip, price, discount_rate]), dtype=float] - or a (crops x 5) array shared by all parcels.
+            output: str - 'dense' (default), 'records' or 'rle', see CentralPlanner.plan().
+        Returns:
+            outputs: np.ndarray[shape=(parcels x [id, demand, sw, gw, precip, mr, mc, npv]), dtype=float], in the requested output format.
+        '''
+        table = crops.CropTable.from_crops(self.crops)
+        n = self.total_area()
+        inputs = np.broadcast_to(np.asarray(inputs, dtype=float), (n, len(self.crops), 5))
+        order = np.asarray(self.priority) if self.priority is not None else self.S.order if isinstance(self.S, water.SurfaceRights) else np.arange(n)
+        parcels = np.arange(n)
+        gross = table.water_demand(inputs[..., 0], inputs[..., 1])
+        demand = np.maximum(gross - inputs[..., 2], 0)
+        choices = np.asarray(self.portfolio, dtype=int)
+        pool = futures.ProcessPoolExecutor(max_workers=self.processes) if self.processes > 1 else None
+        try:
+            for _ in range(self.max_rounds):
+                allotment, deficits = self._signals(demand[parcels, choices], order)
+                update = self._choose(table, inputs, allotment, deficits, pool)
+                if np.array_equal(update, choices):
+                    break
+                choices = update
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        chosen = inputs[parcels, choices]
+        (sw, sw_cost), (gw, gw_cost) = water.bids(gross[parcels, choices], chosen[:, 2], self.S, self.G, order=order, deliver=True)
+        new = np.arange(len(self.crops)) != np.asarray(self.portfolio)[:, np.newaxis]
+        evaluated = table.evaluate(inputs, supplied=(sw + gw)[:, np.newaxis], water_cost=(sw_cost + gw_cost)[:, np.newaxis], new=new)[parcels, choices]
+        rows = np.column_stack((choices, evaluated[:, 0], sw, gw, chosen[:, 2], evaluated[:, 1], evaluated[:, 2], evaluated[:, 3]))
+        return results.format_plan(rows, np.ones(n, dtype=int), output)
+
+def default_planner(kind: str = 'central', total_area: Optional[int] = None, **kwargs) -> Planner:
+    '''
+    Returns a planner of the default crops and water states.
+
+    Arguments:
+        kind: str - 'central' (CentralPlanner) or 'individual' (IndividualPlanner).
+        total_area: Optional[int] - units of land, split 50/25/25 between fallow, the annual and the perennial crop, 100 by default.
+        kwargs: any other arguments of the planner (i.e. G, S, rng), which replace the defaults.
+    Returns:
+        Planner
+
+    Notes:
+        [1] Importing system (and building a planner) does not import scipy, it is imported the first time
+            a groundwater cost needs numerical quadrature (see water.Groundwater.pump_cost()) or a plan is solved exactly (see solver.solve()).
+    '''
+    if kind not in ('central', 'individual'):
+        raise ValueError(f'{kind} is not a valid planner kind, expected one of: central or individual.')
+    if total_area is not None and 'portfolio' not in kwargs:
+        if 'crops' in kwargs:
+            raise ValueError('a portfolio is required to set the total area of a planner with crops other than the defaults.')
+        counts = np.array([total_area - 2 * (total_area // 4), total_area // 4, total_area // 4])
+        kwargs['portfolio'] = counts.astype('I') if kind == 'central' else np.repeat(np.arange(3), counts)
+    return CentralPlanner(**kwargs) if kind == 'central' else IndividualPlanner(**kwargs)
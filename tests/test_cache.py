@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import cache
+import water
+
+RATE = 1.0
+
+def cost(x):
+    return RATE * x
+
+def recursive(x):
+    return x if x <= 0 else recursive(x - 1)
+
+def test_fingerprint_changes_with_the_globals_a_function_reads():
+    global RATE
+    before = cache.fingerprint(cost), cache.fingerprint(lambda x: RATE * np.exp(x)), cache.fingerprint(water.Groundwater(pump_cost_function=cost))
+    try:
+        RATE = 2.0
+        after = cache.fingerprint(cost), cache.fingerprint(lambda x: RATE * np.exp(x)), cache.fingerprint(water.Groundwater(pump_cost_function=cost))
+    finally:
+        RATE = 1.0
+    assert all(b != a for b, a in zip(before, after))
+    assert cache.fingerprint(cost) == before[0]
+
+def test_fingerprint_of_recursive_function_is_stable():
+    assert cache.fingerprint(recursive) == cache.fingerprint(recursive)
+
+def test_cached_plan_is_recomputed_when_a_global_changes():
+    global RATE
+    c = cache.Cache()
+    calls = []
+    def compute():
+        calls.append(RATE)
+        return RATE
+    assert c.call(compute, cost) == 1.0
+    try:
+        RATE = 3.0
+        assert c.call(compute, cost) == 3.0
+    finally:
+        RATE = 1.0
+    assert c.call(compute, cost) == 1.0 and calls == [1.0, 3.0]
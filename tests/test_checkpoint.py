@@ -0,0 +1,62 @@
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+import checkpoint
+import crops
+import simulation
+import system
+import utilities
+import water
+
+YEARS = 8
+
+def simulation_inputs(rights: bool):
+    '''
+    Returns a planner of two tied annual crops (so plans draw on the random number generator) and the forcing and surface supply of YEARS years.
+    '''
+    rng = np.random.default_rng(0)
+    assets = np.array([crops.Fallow(), crops.Annual(name='A'), crops.Annual(name='B'), crops.Perennial(unit_costs=crops.UnitCost(20, 1))], dtype=object)
+    S = water.SurfaceRights(priority=[1, 2, 2], entitlement=[100, 150, 150]) if rights else water.Surfacewater()
+    planner = system.CentralPlanner(crops=assets, S=S, G=water.Groundwater(pump_cost_function=utilities.exponential(base=1, r=0.01)),
+                                    portfolio=np.array([100, 50, 50, 50], dtype='I'), rng=np.random.default_rng(1))
+    forcing = np.tile([[5, 0, 1, 0, 0.1], [5, 1, 1, 12, 0.1], [5, 1, 1, 12, 0.1], [5, 1, 1, 6, 0.1]], (YEARS, 1, 1)).astype(float)
+    prices = rng.uniform(0.8, 1.2, (YEARS, 4))
+    prices[:, 2] = prices[:, 1] # prices change from year to year, the annual crops stay tied.
+    forcing[..., 3] *= prices
+    return planner, forcing, rng.uniform(200, 600, YEARS)
+
+@pytest.mark.parametrize('rights', [False, True])
+@pytest.mark.parametrize('every, interrupted', [(1, 3), (3, 5)])
+def test_resume_matches_uninterrupted_run(tmp_path, rights, every, interrupted):
+    planner, forcing, supply = simulation_inputs(rights)
+    expected_planner = deepcopy(planner)
+    expected_store = checkpoint.YearStore(str(tmp_path / 'expected.bin'), total_area=planner.total_area())
+    for _ in simulation.Simulation(expected_planner, forcing, supply).run(checkpoint=str(tmp_path / 'expected.npz'), store=expected_store, every=every):
+        pass
+    store = checkpoint.YearStore(str(tmp_path / 'outputs.bin'), total_area=planner.total_area())
+    run = simulation.Simulation(deepcopy(planner), forcing, supply).run(checkpoint=str(tmp_path / 'state.npz'), store=store, every=every)
+    for _ in range(interrupted): # killed partway, after years not yet checkpointed were stored.
+        next(run)
+    run.close()
+    resumed = deepcopy(planner) # a new job starts from the initial states, which the checkpoint replaces.
+    years = [year.t for year in simulation.Simulation(resumed, forcing, supply).run(checkpoint=str(tmp_path / 'state.npz'), store=store, every=every)]
+    assert years == list(range(interrupted - interrupted % every, YEARS))
+    np.testing.assert_array_equal(store.read(), expected_store.read())
+    assert resumed.rng.bit_generator.state == expected_planner.rng.bit_generator.state
+    np.testing.assert_array_equal(resumed.portfolio, expected_planner.portfolio)
+    assert resumed.G.deficit == expected_planner.G.deficit and resumed.S.available == expected_planner.S.available
+
+def test_resume_restores_global_random_state(tmp_path):
+    planner, forcing, supply = simulation_inputs(False)
+    planner.rng = None
+    np.random.seed(2)
+    expected = [year.outputs for year in simulation.Simulation(deepcopy(planner), forcing, supply).run()]
+    np.random.seed(2)
+    run = simulation.Simulation(deepcopy(planner), forcing, supply).run(checkpoint=str(tmp_path / 'state.npz'))
+    outputs = [next(run).outputs for _ in range(4)]
+    run.close()
+    np.random.seed(3)
+    outputs += [year.outputs for year in simulation.Simulation(deepcopy(planner), forcing, supply).run(checkpoint=str(tmp_path / 'state.npz'))]
+    np.testing.assert_array_equal(np.stack(outputs), np.stack(expected))
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import crops
+import system
+import utilities
+import water
+
+LIVES = np.array([1.0, np.inf, 25.0, 3.0])
+
+@pytest.mark.parametrize('r', [np.array(0.1), np.full((5, 4), 0.07), np.array([[0.05], [0.1], [0.05]]),
+                               np.random.default_rng(0).uniform(0.01, 0.2, (100, 4))])
+def test_discount_kernels_match_discount_kernel(r):
+    kernels = crops.discount_kernels(r, LIVES, 6)
+    shape = np.broadcast_shapes(r.shape, LIVES.shape)
+    assert kernels.shape == shape + (6,)
+    rates = np.broadcast_to(r, shape)
+    for index in np.ndindex(shape):
+        np.testing.assert_allclose(kernels[index], crops.discount_kernel(float(rates[index]), float(LIVES[index[-1]]), 6))
+
+def test_discount_kernels_cache_scalar_pairs():
+    crops.discount_kernel.cache_clear()
+    crops.discount_kernels(np.full((10_000, 4), 0.07), LIVES, 4)
+    assert crops.discount_kernel.cache_info().currsize == len(LIVES)
+
+def crop_assets():
+    orchard = crops.Perennial(name='orchard', unit_costs=crops.UnitCost(30, 2), yield_schedule=(0, 0.5, 1), cost_schedule=(2, 1))
+    orchard.life = 25.0
+    return np.array([crops.Fallow(), crops.Annual(name='A', unit_costs=crops.UnitCost(1, 2)),
+                     crops.Annual(name='B', production_fx=crops.unit_production(max_production=2, no_production_threshold=0.3, fx=utilities.unit_sigmoid(k=3))),
+                     crops.Perennial(name='vines', unit_costs=crops.UnitCost(20, 1), yield_schedule=(0, 1)), orchard], dtype=object)
+
+@pytest.mark.parametrize('r', [0.0, 0.03, 0.2])
+@pytest.mark.parametrize('new', [False, True])
+def test_crop_table_evaluate_matches_crop_outputs(r, new):
+    assets = crop_assets()
+    if r == 0:
+        assets = assets[[0, 1, 2, 4]] # perpetuities have no finite value at r = 0.
+    planner = system.CentralPlanner(crops=assets, S=water.Surfacewater(available=1e6, unit_cost=0.5), portfolio=np.zeros(len(assets), dtype='I'))
+    inputs = np.column_stack([np.full(len(assets), 5.0), np.linspace(0, 1.2, len(assets)), np.full(len(assets), 1.0), np.linspace(5, 15, len(assets)), np.full(len(assets), r)])
+    expected = np.array([planner.crop_outputs(c, inputs[c], new) for c in range(len(assets))])
+    outputs = crops.CropTable.from_crops(assets).evaluate(inputs, supplied=expected[:, 2] + expected[:, 3], water_cost=planner.S.unit_cost * expected[:, 2], new=new)
+    np.testing.assert_allclose(outputs, expected[:, [1, 5, 6, 7]])
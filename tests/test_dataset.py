@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import dataset
+import results
+
+CROPS = ('FALLOW', 'ANNUAL', 'PERENNIAL')
+
+def random_plan(seed: int) -> np.ndarray:
+    '''
+    Returns the dense outputs of a plan of runs of identical units of land.
+    '''
+    rng = np.random.default_rng(seed)
+    runs = rng.integers(5, 20)
+    rows = np.column_stack([rng.integers(0, len(CROPS), runs), rng.uniform(0, 10, (runs, len(results.COLUMNS) - 1))])
+    return np.repeat(rows, rng.integers(1, 8, runs), axis=0)
+
+def read_plan(path: str, scenario: int, year: int) -> np.ndarray:
+    '''
+    Returns the dense outputs of a partition, reassembled from the start and count of its rows.
+    '''
+    columns = ('start', 'count', 'crop') + results.COLUMNS[1:]
+    groups = list(dataset.scan(path, columns=columns, scenarios=[scenario], years=[year]))
+    rows = {name: np.concatenate([group[name] for group in groups]) for name in columns}
+    order = np.argsort(rows['start'], kind='stable')
+    start, count = rows['start'][order], rows['count'][order].astype(np.int64)
+    np.testing.assert_array_equal(start, np.cumsum(count) - count) # the runs tile the units of land, without gaps or overlaps.
+    return np.repeat(np.column_stack([rows[name][order] for name in columns[2:]]).astype(float), count, axis=0)
+
+@pytest.mark.parametrize('format', list(dataset.FORMATS))
+def test_write_then_scan(tmp_path, format):
+    if format != 'npy':
+        pytest.importorskip('pyarrow')
+    plans = {(0, 0): [random_plan(0), random_plan(1), random_plan(2)], (0, 1): [random_plan(3)], (1, 0): [random_plan(4), random_plan(5)]}
+    with dataset.Writer(str(tmp_path), crops=CROPS, format=format, row_group_size=4, max_buffered_rows=10, max_open_files=1) as writer:
+        for i in range(3): # interleaved, so partitions are flushed (and their files completed) between writes.
+            for (scenario, year), outputs in plans.items():
+                if i < len(outputs):
+                    writer.write(outputs[i], scenario=scenario, year=year)
+    assert dataset.read_schema(str(tmp_path))['crops'] == list(CROPS)
+    for (scenario, year), outputs in plans.items():
+        np.testing.assert_array_equal(read_plan(str(tmp_path), scenario, year), np.concatenate(outputs))
+
+def test_write_run_length_plans(tmp_path):
+    outputs = random_plan(6)
+    rows, counts = results.runs(outputs, np.ones(len(outputs), dtype=np.int64))
+    with dataset.Writer(str(tmp_path), crops=CROPS, format='npy') as writer:
+        writer.write(rows, counts=counts)
+        writer.write(outputs)
+    np.testing.assert_array_equal(read_plan(str(tmp_path), 0, 0), np.concatenate([outputs, outputs]))
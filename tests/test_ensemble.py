@@ -0,0 +1,61 @@
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+import crops
+import dataset
+import ensemble
+import system
+import utilities
+import water
+
+MEMBERS = 10
+
+def ensemble_inputs():
+    '''
+    Returns a planner of two tied annual crops (so members draw on their random number generators), and the inputs and surface supply of each member.
+    '''
+    rng = np.random.default_rng(0)
+    assets = np.array([crops.Fallow(), crops.Annual(name='A'), crops.Annual(name='B'), crops.Perennial(unit_costs=crops.UnitCost(20, 1))], dtype=object)
+    planner = system.CentralPlanner(crops=assets, G=water.Groundwater(pump_cost_function=utilities.exponential(base=1, r=0.01)),
+                                    portfolio=np.array([100, 50, 50, 50], dtype='I'))
+    inputs = np.tile([[5, 0, 1, 0, 0.1], [5, 1, 1, 12, 0.1], [5, 1, 1, 12, 0.1], [5, 1, 1, 6, 0.1]], (MEMBERS, 1, 1)).astype(float)
+    inputs[:, 3, 3] *= rng.uniform(0.5, 1.5, MEMBERS)
+    return planner, inputs, rng.uniform(100, 800, MEMBERS)
+
+@pytest.mark.parametrize('processes, chunksize', [(3, 2), (2, 16), (4, 1)])
+def test_results_do_not_depend_on_processes(processes, chunksize):
+    planner, inputs, supply = ensemble_inputs()
+    original = deepcopy(planner)
+    serial = ensemble.run(planner, inputs, supply, seed=7, processes=1)
+    parallel = ensemble.run(planner, inputs, supply, seed=7, processes=processes, chunksize=chunksize)
+    for name in ('areas', 'sw', 'gw', 'npv'):
+        np.testing.assert_array_equal(getattr(parallel, name), getattr(serial, name))
+    np.testing.assert_array_equal(planner.portfolio, original.portfolio) # the planner's states are not changed.
+    assert planner.S.available == original.S.available and planner.G.deficit == original.G.deficit and planner.rng is None
+    seeds = np.random.SeedSequence(7).spawn(MEMBERS)
+    for i in range(MEMBERS):
+        areas, sw, gw, npv = ensemble.run_member(planner, inputs[i], supply[i], seeds[i])
+        np.testing.assert_array_equal(serial.areas[i], areas)
+        assert (serial.sw[i], serial.gw[i], serial.npv[i]) == (sw, gw, npv)
+
+def test_seeds_break_ties_differently():
+    planner, inputs, supply = ensemble_inputs()
+    a, b = ensemble.run(planner, inputs, supply, seed=7, processes=1), ensemble.run(planner, inputs, supply, seed=8, processes=1)
+    assert (a.areas[:, 1:3].sum(axis=1) == b.areas[:, 1:3].sum(axis=1)).all() and not np.array_equal(a.areas, b.areas)
+
+def test_members_are_written(tmp_path):
+    planner, inputs, supply = ensemble_inputs()
+    with dataset.Writer(str(tmp_path), crops=planner.crops, format='npy') as writer:
+        result = ensemble.run(planner, inputs, supply, seed=7, processes=2, chunksize=3, writer=writer)
+    for member in range(MEMBERS):
+        groups = list(dataset.scan(str(tmp_path), columns=('crop', 'count', 'sw'), scenarios=[member]))
+        crop, count, sw = (np.concatenate([group[name] for group in groups]) for name in ('crop', 'count', 'sw'))
+        np.testing.assert_array_equal(np.bincount(crop, weights=count, minlength=len(planner.crops)), result.areas[member])
+        assert np.dot(count, sw) == pytest.approx(result.sw[member])
+
+def test_inputs_must_match_members():
+    planner, inputs, supply = ensemble_inputs()
+    with pytest.raises(ValueError):
+        ensemble.run(planner, inputs[:-1], supply, processes=1)
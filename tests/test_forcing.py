@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+import forcing
+
+YEARS, DAYS, PARCELS = 5, 30, 23
+
+@pytest.fixture
+def daily(tmp_path):
+    '''
+    Returns daily eto and precip, and their memory mapped copies (a .npy file and a raw float32 file), with a partial last year.
+    '''
+    rng = np.random.default_rng(0)
+    eto, precip = rng.uniform(0, 8, (2, YEARS * DAYS + 11, PARCELS)).astype('f4')
+    np.save(tmp_path / 'eto.npy', eto)
+    precip.tofile(tmp_path / 'precip.f4')
+    return eto, precip, forcing.open_array(str(tmp_path / 'eto.npy')), forcing.open_array(str(tmp_path / 'precip.f4'), shape=precip.shape)
+
+@pytest.mark.parametrize('chunk_years, parcel_block, read_ahead', [(1, 100_000, 2), (2, 7, 0), (3, 7, 2), (5, 1, 1)])
+def test_seasonal_aggregation_matches_dense_sum(daily, chunk_years, parcel_block, read_ahead):
+    eto, precip, mapped_eto, mapped_precip = daily
+    season = (5, 20)
+    price, r = np.arange(YEARS * 3).reshape(YEARS, 3), np.linspace(0.05, 0.1, YEARS)
+    f = forcing.Forcing(eto=mapped_eto, precip=mapped_precip, kc=[0, 1.0, 1.2], price=price, discount_rate=r, season=season, days_per_year=DAYS,
+                        chunk_years=chunk_years, parcel_block=parcel_block, read_ahead=read_ahead)
+    seasonal = [x[:YEARS * DAYS].reshape(YEARS, DAYS, PARCELS)[:, slice(*season)].sum(axis=1, dtype=float) for x in (eto, precip)]
+    assert len(f) == YEARS
+    seasons = list(f.seasons())
+    assert [t for t, _, _ in seasons] == list(range(YEARS))
+    np.testing.assert_allclose(np.array([e for _, e, _ in seasons]), seasonal[0], rtol=1e-12)
+    np.testing.assert_allclose(np.array([p for _, _, p in seasons]), seasonal[1], rtol=1e-12)
+    for t, (inputs, district) in enumerate(zip(f, f.district())):
+        assert inputs.shape == (PARCELS, 3, 5)
+        np.testing.assert_allclose(inputs[..., 0], np.repeat(seasonal[0][t][:, np.newaxis], 3, axis=1), rtol=1e-12)
+        np.testing.assert_allclose(inputs[..., 2], np.repeat(seasonal[1][t][:, np.newaxis], 3, axis=1), rtol=1e-12)
+        np.testing.assert_array_equal(inputs[..., 1], np.broadcast_to([0, 1.0, 1.2], (PARCELS, 3)))
+        np.testing.assert_array_equal(inputs[..., 3], np.broadcast_to(price[t], (PARCELS, 3)))
+        assert (inputs[..., 4] == r[t]).all()
+        np.testing.assert_allclose(district[:, [0, 2]], [[seasonal[0][t].mean(), seasonal[1][t].mean()]] * 3, rtol=1e-12)
+
+def test_shapes_must_match(daily):
+    eto, precip, mapped_eto, _ = daily
+    with pytest.raises(ValueError):
+        forcing.Forcing(eto=mapped_eto, precip=precip[:, :-1], kc=[0, 1.0], price=[1, 2])
+    with pytest.raises(ValueError):
+        forcing.open_array('precip.f4')
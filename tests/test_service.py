@@ -0,0 +1,82 @@
+import time
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+import service
+import system
+
+INPUTS = [[5, 0, 1, 0, 0.1], [5, 1, 1, 12, 0.1], [5, 1, 1, 3, 0.1]]
+
+def scenario(surface: float, seed: int = 1):
+    return {'inputs': INPUTS, 'surface': surface, 'seed': seed}
+
+async def plan(path: str, scenarios, config: str = 'default'):
+    return [response async for response in service.request({'id': 1, 'op': 'plan', 'config': config, 'scenarios': scenarios}, path=path)]
+
+async def metrics(path: str):
+    return [response async for response in service.request({'id': 2, 'op': 'metrics'}, path=path)][0]
+
+@pytest.fixture
+def gate(monkeypatch):
+    '''
+    Holds each scenario in its worker until the gate is set.
+    '''
+    event, evaluate = threading.Event(), service.evaluate_scenario
+    def gated(*args):
+        event.wait(10)
+        return evaluate(*args)
+    monkeypatch.setattr(service, 'evaluate_scenario', gated)
+    return event
+
+def serve(tmp_path, test, max_pending: int = 64):
+    async def main():
+        server = service.Service({'default': system.default_planner()}, processes=1, max_pending=max_pending)
+        await server.start(path=str(tmp_path / 'service.sock'))
+        try:
+            return await test(server, str(tmp_path / 'service.sock'))
+        finally:
+            await server.close()
+    return asyncio.run(main())
+
+def test_identical_scenarios_are_coalesced(tmp_path):
+    scenarios = [scenario(100.0), scenario(100.0), scenario(50.0), scenario(100.0), scenario(100.0, seed=2)]
+    async def test(server, path):
+        return await plan(path, scenarios), server.metrics()
+    responses, counters = serve(tmp_path, test)
+    assert responses[-1] == {'id': 1, 'done': True}
+    results = {response['index']: response for response in responses[:-1]}
+    assert sorted(results) == list(range(len(scenarios)))
+    for index, s in enumerate(scenarios):
+        expected = service.evaluate_scenario('default', np.array(s['inputs']), s['surface'], s['seed'])
+        assert {name: results[index][name] for name in expected} == expected
+    assert counters['coalesced'] == 2 and counters['completed'] == len(scenarios) and counters['in_flight'] == 0
+
+def test_backpressure_and_latency_metrics(tmp_path, gate):
+    held = 0.05
+    async def test(server, path):
+        requested = asyncio.create_task(plan(path, [scenario(float(surface)) for surface in range(6)] + [{'inputs': INPUTS, 'seed': 'x'}]))
+        while (await metrics(path))['waiting'] == 0:
+            await asyncio.sleep(0.001)
+        pending = await metrics(path)
+        await asyncio.sleep(held)
+        gate.set()
+        responses = await requested
+        return pending, responses, await metrics(path)
+    pending, responses, final = serve(tmp_path, test, max_pending=2)
+    # two scenarios are submitted (one planning, one queued in the worker), the next waits for a slot and the rest are not read.
+    assert pending['queue_depth'] == pending['in_flight'] == 2 and pending['waiting'] == 1 and pending['scenarios'] == 2
+    assert len([response for response in responses if 'index' in response and 'error' not in response]) == 6
+    assert final['completed'] == 6 and final['errors'] == 1 and final['max_queue_depth'] == 2
+    assert final['waiting'] == 0 and final['queue_depth'] == final['in_flight'] == 0
+    # the mean is over the completed scenarios, the first was held at least held seconds and the others are planned after it.
+    assert held / 6 < final['mean_seconds'] < 10
+
+def test_unknown_config_is_an_error(tmp_path):
+    async def test(server, path):
+        return await plan(path, [scenario(100.0)], config='missing'), server.metrics()
+    responses, counters = serve(tmp_path, test)
+    assert 'error' in responses[0] and responses[-1]['done']
+    assert counters['errors'] == 1 and counters['completed'] == 0 and counters['mean_seconds'] == 0.0
@@ -0,0 +1,29 @@
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+import crops
+import water
+import system
+import solver
+import utilities
+
+INPUTS = np.array([[5, 0, 1, 0, 0.1], [5, 1, 1, 12, 0.1], [5, 1.2, 1, 13, 0.1]])
+
+@pytest.mark.parametrize('available, max_deficit', [(5, 10), (0, 0), (50, 100), (300, np.inf), (1000, np.inf)])
+def test_exact_plan_bounds_greedy_plan(available, max_deficit):
+    planner = system.CentralPlanner(S=water.Surfacewater(available=available), G=water.Groundwater(max_deficit=max_deficit))
+    r = solver.compare(planner, INPUTS)
+    assert r['exact']['exact']
+    assert r['gap'] >= -1e-6 * max(1, abs(r['greedy']['objective']))
+    outputs = deepcopy(planner).plan(INPUTS, method='exact')
+    assert outputs[:, 7].sum() == pytest.approx(r['exact']['objective'])
+    assert outputs[:, 2].sum() <= available + 1e-6 and outputs[:, 3].sum() <= max_deficit + 1e-6
+
+def test_exact_plan_flags_non_linear_production():
+    annual = crops.Annual(production_fx=crops.unit_production(fx=utilities.unit_sigmoid(k=2)))
+    planner = system.CentralPlanner(crops=np.array([crops.Fallow(), annual, crops.Perennial()], dtype=object))
+    assert not solver.solve(planner, INPUTS).exact
+    with pytest.warns(UserWarning, match='not exact'):
+        planner.plan(INPUTS, method='exact')
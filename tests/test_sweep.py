@@ -0,0 +1,56 @@
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+import crops
+import sweep
+import system
+import utilities
+import water
+
+GRID = {'r': [0.03, 0.1, 0.2], 'price': [0.5, 1.0, 2.0]}
+
+def sweep_inputs():
+    '''
+    Returns a planner with linear pumping costs and no binding max_deficit (where the greedy sweep is exact), and its inputs,
+    every crop demands 4 units of water per unit of land.
+    '''
+    assets = np.array([crops.Fallow(), crops.Annual(name='A', unit_costs=crops.UnitCost(1, 2)), crops.Annual(name='B', unit_costs=crops.UnitCost(0, 4)),
+                       crops.Perennial(unit_costs=crops.UnitCost(40, 1))], dtype=object)
+    planner = system.CentralPlanner(crops=assets, G=water.Groundwater(deficit=10, pump_cost_function=utilities.exponential(base=1.5, r=0)),
+                                    S=water.Surfacewater(unit_cost=0.5), portfolio=np.array([40, 30, 20, 10], dtype='I'))
+    return planner, np.array([[5, 0, 1, 0, 0.1], [5, 1, 1, 10, 0.1], [5, 1, 1, 11, 0.1], [5, 1, 1, 7, 0.1]])
+
+def test_greedy_matches_exact():
+    planner, inputs = sweep_inputs()
+    original = deepcopy(planner)
+    s = sweep.Sweep(planner, inputs)
+    surface = [0.0, 40.0, 200.0, 400.0, 2000.0] # multiples of the demand, so no unit of land is partly supplied by surface water.
+    greedy, exact = s.run(surface=surface, **GRID), s.run(surface=surface, exact=True, **GRID)
+    assert greedy.shape == (3, 3, 5, 4)
+    np.testing.assert_array_equal(greedy['area'], exact['area'])
+    np.testing.assert_allclose(greedy['sw'], exact['sw'])
+    np.testing.assert_allclose(greedy['gw'], exact['gw'])
+    assert len(np.unique(greedy['area'].reshape(-1, 4), axis=0)) > 5 # the grid spans different allocations.
+    np.testing.assert_array_equal(greedy['area'].sum(axis=-1), planner.total_area())
+    np.testing.assert_array_equal(planner.portfolio, original.portfolio)
+    assert planner.S.available == original.S.available and planner.G.deficit == original.G.deficit
+
+def test_greedy_matches_exact_up_to_a_partly_supplied_unit():
+    planner, inputs = sweep_inputs()
+    s = sweep.Sweep(planner, inputs)
+    surface = [1.0, 41.0, 203.0, 402.5]
+    greedy, exact = s.run(surface=surface, **GRID), s.run(surface=surface, exact=True, **GRID)
+    assert np.abs(greedy['area'] - exact['area']).sum(axis=-1).max() <= 2
+    np.testing.assert_array_equal(greedy['area'].sum(axis=-1), exact['area'].sum(axis=-1))
+
+def test_economics_are_cached_and_match_crop_table():
+    planner, inputs = sweep_inputs()
+    s = sweep.Sweep(planner, inputs)
+    npv_sw, npv_gw = s.economics(GRID['r'], GRID['price'])
+    assert s.economics(GRID['r'], GRID['price'])[0] is npv_sw
+    grid = s.grid_inputs(GRID['r'], GRID['price'])
+    table = crops.CropTable.from_crops(planner.crops)
+    np.testing.assert_allclose(npv_sw[1, 2, 0], table.evaluate(grid[1, 2], supplied=s.demand, water_cost=planner.S.unit_cost * s.demand)[:, 3])
+    np.testing.assert_allclose(npv_gw[0, 1, 1], table.evaluate(grid[0, 1], supplied=s.pumped, water_cost=s.pump_cost, new=True)[:, 3])
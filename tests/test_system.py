@@ -0,0 +1,187 @@
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+import crops
+import water
+import system
+import utilities
+
+COSTS = {'linear': (utilities.exponential(base=1, r=0), np.inf),
+         'exponential': (utilities.exponential(base=1, r=0.002), np.inf),
+         'tabulated': (lambda x: 1 + 1e-5 * x**2, 150.0),
+         'quad': (lambda x: 1 + 1e-5 * x**2, np.inf)}
+
+def random_planner(seed: int, cost: str):
+    '''
+    Returns a planner of fallow, two annual (tied if seed is even) and a perennial crop, and its inputs,
+    with surface water and a groundwater deficit drawn so that plans cross curtailment and deficit thresholds.
+    '''
+    rng = np.random.default_rng(seed)
+    pump_cost_function, max_deficit = COSTS[cost]
+    annual = crops.UnitCost(rng.uniform(0, 5), rng.uniform(0, 3))
+    assets = np.array([crops.Fallow(), crops.Annual(name='A', unit_costs=annual),
+                       crops.Annual(name='B', unit_costs=annual if seed % 2 == 0 else crops.UnitCost(rng.uniform(0, 5), rng.uniform(0, 3))),
+                       crops.Perennial(unit_costs=crops.UnitCost(rng.uniform(0, 50), rng.uniform(0, 3)))], dtype=object)
+    inputs = np.column_stack([rng.uniform(1, 6, 4), rng.uniform(0, 1.5, 4), rng.uniform(0, 2, 4), rng.uniform(5, 20, 4), rng.uniform(0.02, 0.2, 4)])
+    inputs[0, 1] = inputs[0, 3] = 0
+    if seed % 2 == 0:
+        inputs[2] = inputs[1]
+    G = water.Groundwater(deficit=rng.uniform(-100, 100), max_deficit=max_deficit, pump_cost_function=pump_cost_function)
+    planner = system.CentralPlanner(crops=assets, G=G, S=water.Surfacewater(available=rng.uniform(0, 200)),
+                                    portfolio=rng.integers(0, 100, 4).astype('I'), rng=np.random.default_rng(seed))
+    return planner, inputs
+
+def plans(planner: system.CentralPlanner, *calls):
+    '''
+    Returns the outputs and the final water states of each call on a copy of the planner.
+    '''
+    results = []
+    for call in calls:
+        copy = deepcopy(planner)
+        results.append((call(copy), copy.S.available, copy.G.deficit))
+    return results
+
+@pytest.mark.parametrize('cost', list(COSTS))
+@pytest.mark.parametrize('seed', range(8))
+def test_block_plan_matches_unit_plan(cost, seed):
+    planner, inputs = random_planner(seed, cost)
+    (units, sw_units, deficit_units), (blocks, sw_blocks, deficit_blocks) = plans(planner, lambda p: p.plan(inputs, blocks=False), lambda p: p.plan(inputs))
+    np.testing.assert_allclose(blocks, units, equal_nan=True)
+    assert sw_blocks == pytest.approx(sw_units) and deficit_blocks == pytest.approx(deficit_units)
+
+@pytest.mark.parametrize('seed', range(12))
+def test_block_plan_matches_unit_plan_with_rights(seed):
+    planner, inputs = random_planner(seed, list(COSTS)[seed % len(COSTS)])
+    rng = np.random.default_rng(seed + 100)
+    planner.S = water.SurfaceRights(priority=rng.integers(0, 3, 5), entitlement=rng.uniform(0, 2 * planner.S.available / 5 + 1, 5))
+    planner.S.supply(rng.uniform(0.5, 2) * planner.S.entitlement.sum()) # the supply often exceeds the claims.
+    results = []
+    for blocks in (False, True):
+        copy = deepcopy(planner)
+        results.append((copy.plan(inputs, blocks=blocks), copy.S.undelivered, copy.S.delivered, copy.G.deficit))
+    (units, undelivered_units, delivered_units, deficit_units), (blocks, undelivered_blocks, delivered_blocks, deficit_blocks) = results
+    np.testing.assert_allclose(blocks, units, atol=1e-9, equal_nan=True) # deliveries pro rata to the holders leave rounding residues of supply.
+    assert undelivered_blocks == pytest.approx(undelivered_units) and deficit_blocks == pytest.approx(deficit_units)
+    np.testing.assert_allclose(delivered_blocks, delivered_units, atol=1e-9)
+
+def test_block_plan_matches_unit_plan_with_global_ties():
+    planner, inputs = random_planner(0, 'linear')
+    planner.rng = None
+    np.random.seed(3)
+    units = deepcopy(planner).plan(inputs, blocks=False)
+    np.random.seed(3)
+    np.testing.assert_allclose(deepcopy(planner).plan(inputs), units, equal_nan=True)
+
+def tied_planner(area: int = 500):
+    '''
+    Returns a planner (and its inputs) of two tied annual crops, so block_plan() breaks most ties one unit at a time.
+    '''
+    assets = np.array([crops.Fallow(), crops.Annual(name='A'), crops.Annual(name='B'), crops.Perennial()], dtype=object)
+    planner = system.CentralPlanner(crops=assets, S=water.Surfacewater(available=3 * area), portfolio=np.array([area // 2, area // 4, area // 8, area // 8], dtype='I'),
+                                    rng=np.random.default_rng(0))
+    return planner, np.array([[5, 0, 1, 0, 0.1], [5, 1, 1, 12, 0.1], [5, 1, 1, 12, 0.1], [5, 1, 1, 3, 0.1]])
+
+CHANGES = {'price': lambda planner, inputs: inputs * np.where(np.arange(5) == 3, np.linspace(1, 1.02, len(inputs))[:, np.newaxis], 1),
+           'supply': lambda planner, inputs: planner.S.supply(planner.S.available * 0.5) or inputs,
+           'deficit': lambda planner, inputs: setattr(planner.G, 'deficit', planner.G.deficit + 25) or inputs,
+           'none': lambda planner, inputs: inputs}
+
+@pytest.mark.parametrize('blocks', [True, False])
+@pytest.mark.parametrize('change', list(CHANGES))
+@pytest.mark.parametrize('seed', range(4))
+def test_replan_matches_plan(blocks, change, seed):
+    planner, inputs = random_planner(seed, ('linear', 'exponential', 'tabulated', 'quad')[seed]) if seed < 3 else tied_planner()
+    previous = deepcopy(planner)
+    previous.plan(inputs, blocks=blocks)
+    changed = CHANGES[change](planner, inputs.copy())
+    cold, warm = deepcopy(planner), deepcopy(planner)
+    expected = cold.plan(changed, blocks=blocks)
+    np.testing.assert_allclose(warm.replan(changed, blocks=blocks, previous=previous.warm_start), expected, equal_nan=True)
+    assert warm.S.available == pytest.approx(cold.S.available) and warm.G.deficit == pytest.approx(cold.G.deficit)
+    assert warm.rng.bit_generator.state == cold.rng.bit_generator.state
+    if blocks and previous.warm_start.steps() * system.REPLAN_STEP_UNITS < planner.portfolio.sum():
+        assert warm.warm_start.recomputed == 1 # block plans of few steps are planned cold.
+    elif change == 'none':
+        assert warm.warm_start.recomputed == 0
+
+def individual_planner(seed: int, parcels: int = 200, **kwargs):
+    '''
+    Returns an IndividualPlanner of parcels with their own inputs (and ties between two annual crops), sharing scarce surface water and costly groundwater.
+    '''
+    rng = np.random.default_rng(seed)
+    assets = np.array([crops.Fallow(), crops.Annual(name='A'), crops.Annual(name='B'), crops.Perennial(unit_costs=crops.UnitCost(20, 1))], dtype=object)
+    inputs = np.empty((parcels, len(assets), 5))
+    inputs[..., 0], inputs[..., 1], inputs[..., 2] = rng.uniform(3, 6, (parcels, 1)), rng.uniform(0.5, 1.2, (parcels, len(assets))), rng.uniform(0, 1, (parcels, 1))
+    inputs[..., 3], inputs[..., 4] = rng.uniform(5, 15, (parcels, len(assets))), 0.1
+    inputs[:, 0, 1] = inputs[:, 0, 3] = 0
+    inputs[::2, 2] = inputs[::2, 1] # ties on every other parcel.
+    G = water.Groundwater(deficit=rng.uniform(0, 50), pump_cost_function=utilities.exponential(base=1, r=0.01))
+    planner = system.IndividualPlanner(crops=assets, G=G, S=water.Surfacewater(available=parcels), portfolio=rng.integers(0, len(assets), parcels),
+                                       rng=np.random.default_rng(seed), **kwargs)
+    return planner, inputs
+
+@pytest.mark.parametrize('seed', range(4))
+def test_individual_plan_converges(seed):
+    planner, inputs = individual_planner(seed, max_rounds=50)
+    choices = deepcopy(planner).plan(inputs)[:, 0].astype(int)
+    # the choices are a fixed point: no parcel changes its choice given the water left to it by the others' choices.
+    table = crops.CropTable.from_crops(planner.crops)
+    demand = np.maximum(table.water_demand(inputs[..., 0], inputs[..., 1]) - inputs[..., 2], 0)
+    allotment, deficits = planner._signals(demand[np.arange(len(choices)), choices], np.arange(len(choices)))
+    inputs[::2, 1:3, 3] += np.where(choices[::2, np.newaxis] == [1, 2], 1e-6, 0) # breaks the ties in favour of the chosen crop, choose() draws them at random.
+    np.testing.assert_array_equal(system.choose(table, planner.G, planner.S.unit_cost, inputs, allotment, deficits, planner.portfolio), choices)
+
+@pytest.mark.parametrize('rights', [False, True])
+def test_individual_plan_fills_senior_parcels_first(rights):
+    parcels, grown = 40, 15
+    seniority = np.random.default_rng(0).permutation(parcels) # the seniority (priority) of each parcel.
+    S = water.SurfaceRights(priority=seniority, entitlement=4.0) if rights else water.Surfacewater()
+    S.supply(4 * grown)
+    planner = system.IndividualPlanner(crops=np.array([crops.Fallow(), crops.Annual(unit_costs=crops.UnitCost(0, 5))], dtype=object), S=S,
+                                       G=water.Groundwater(active=False), portfolio=np.zeros(parcels, dtype=int), 
+                                       priority=None if rights else np.argsort(seniority), rng=np.random.default_rng(0))
+    outputs = planner.plan(np.array([[5, 0, 1, 0, 0.1], [5, 1, 1, 12, 0.1]])) # the annual crop needs 4 units of surface water to be profitable.
+    np.testing.assert_array_equal(np.flatnonzero(outputs[:, 0] == 1), np.sort(np.argsort(seniority)[:grown]))
+    np.testing.assert_allclose(outputs[:, 2], np.where(outputs[:, 0] == 1, 4.0, 0.0))
+
+def test_individual_plan_matches_across_processes():
+    planner, inputs = individual_planner(0, parcels=500, chunksize=100)
+    serial, parallel = deepcopy(planner), deepcopy(planner)
+    parallel.processes = 2
+    np.testing.assert_array_equal(parallel.plan(inputs), serial.plan(inputs))
+    assert parallel.rng.bit_generator.state == serial.rng.bit_generator.state
+    assert parallel.S.available == serial.S.available and parallel.G.deficit == serial.G.deficit
+
+def replanned(planner: system.CentralPlanner, inputs: np.ndarray) -> np.ndarray:
+    '''
+    Returns a replan (the warm path, replaying a previous plan of the same inputs).
+    '''
+    previous = deepcopy(planner)
+    previous.plan(inputs, blocks=False)
+    outputs = planner.replan(inputs, blocks=False, previous=previous.warm_start)
+    assert planner.warm_start.recomputed == 0
+    return outputs
+
+PLANS = {'unit': lambda planner, inputs: planner.plan(inputs, blocks=False), 'block': lambda planner, inputs: planner.plan(inputs),
+         'replan': replanned, 'exact': lambda planner, inputs: planner.plan(inputs, method='exact')}
+
+@pytest.mark.parametrize('method', list(PLANS))
+@pytest.mark.parametrize('seed', range(4))
+def test_allocation_matches_plan_outputs(method, seed):
+    planner, inputs = random_planner(seed, 'linear') if seed < 3 else tied_planner()
+    if method == 'exact':
+        pytest.importorskip('scipy')
+    outputs = PLANS[method](planner, inputs)
+    ids, n = outputs[:, 0].astype(int), len(planner.crops)
+    allocation = planner.allocation
+    np.testing.assert_array_equal(allocation.counts, np.bincount(ids, minlength=n))
+    np.testing.assert_allclose(allocation.sw, np.bincount(ids, weights=outputs[:, 2], minlength=n), atol=1e-9)
+    np.testing.assert_allclose(allocation.gw, np.bincount(ids, weights=outputs[:, 3], minlength=n), atol=1e-9)
+    assert allocation.units == len(outputs) == planner.total_area()
+    assert allocation.total_sw() == pytest.approx(outputs[:, 2].sum()) and allocation.total_gw() == pytest.approx(outputs[:, 3].sum())
+    np.testing.assert_array_equal(allocation.remaining(), np.maximum(planner.portfolio.astype(int) - np.bincount(ids, minlength=n), 0))
+    assert [planner.is_new(c) for c in range(n)] == [planner.is_new(c, outputs) for c in range(n)]
+    for unit, tied in allocation.ties:
+        assert ids[unit] in tied and len(tied) > 1
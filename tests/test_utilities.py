@@ -0,0 +1,64 @@
+import timeit
+
+import numpy as np
+import pytest
+
+import crops
+import utilities
+import water
+
+SCALARS = [0.25, 1, np.float64(0.25), np.float32(0.25), np.int64(1), np.array(0.25)]
+
+@pytest.mark.parametrize('x', SCALARS)
+def test_is_scalar(x):
+    assert utilities.is_scalar(x, 2.0)
+    assert not utilities.is_scalar(x, np.array([2.0]))
+    assert not utilities.is_scalar([x])
+
+@pytest.mark.parametrize('x', SCALARS)
+def test_scalar_path_matches_array_path(x):
+    fx = utilities.unit_sigmoid(k=np.int64(3))
+    production = crops.unit_production(max_production=np.float32(2), no_production_threshold=0.1, fx=fx)
+    exponential = utilities.exponential(base=2, r=np.float32(0.01))
+    assert np.ndim(fx(x)) == 0 and np.ndim(production(x)) == 0
+    assert fx(x) == pytest.approx(fx(np.array([x]))[0], rel=1e-6)
+    assert production(x) == pytest.approx(production(np.array([x]))[0], rel=1e-6)
+    assert exponential.integral(0, x) == pytest.approx(utilities.Exponential(base=2, r=np.array([np.float32(0.01)])).integral(0, x)[0], rel=1e-6)
+
+def test_cost_table_scalar_path_matches_array_path():
+    table = utilities.CostTable(lambda x: 1 + 1e-3 * x**2, 0, 150)
+    a, b = np.array([0.0, 0.5, 10.0, 149.0]), np.array([0.0, 20.0, 75.3, 150.0])
+    np.testing.assert_allclose(table.integral(a, b), [table.integral(float(x), float(y)) for x, y in zip(a, b)])
+    assert isinstance(table.integral(10.0, 20.0), float)
+    with pytest.raises(ValueError):
+        table.integral(10.0, 151.0)
+
+def test_cost_table_lookup_beats_quad():
+    f = lambda x: 1 + 1e-3 * x**2
+    tabulated, quad = water.Groundwater(deficit=10.0, max_deficit=150.0, pump_cost_function=f), water.Groundwater(deficit=10.0, pump_cost_function=f)
+    assert tabulated.bid(20.0) == pytest.approx(quad.bid(20.0), rel=1e-5) # within the interpolation error of the table.
+    seconds = [min(timeit.repeat(lambda: G.bid(20.0), number=2000, repeat=5)) for G in (tabulated, quad)]
+    assert seconds[0] < seconds[1]
+
+@pytest.mark.parametrize('d', [0, 0.3, 1])
+def test_expected_value_streaming_matches_history(d):
+    ts = np.random.default_rng(0).uniform(-5, 20, 30)
+    forecast = utilities.ExpectedValue(d)
+    assert np.isnan(forecast.value())
+    for t in range(len(ts)):
+        assert forecast.update(ts[t]) == pytest.approx(utilities.expected_value(ts[:t + 1], d))
+    resumed = utilities.ExpectedValue.from_history(ts[:10], d)
+    assert resumed.value() == pytest.approx(utilities.expected_value(ts[:10], d))
+    for t in range(10, len(ts)):
+        assert resumed.update(ts[t]) == pytest.approx(utilities.expected_value(ts[:t + 1], d))
+    assert resumed.value() == pytest.approx(forecast.value())
+
+def test_expected_value_batches():
+    ts = np.random.default_rng(1).uniform(-5, 20, (4, 3, 12))
+    d = np.array([0, 0.3, 1])
+    forecast = utilities.ExpectedValue(d, shape=(4, 3))
+    for t in range(ts.shape[-1]):
+        np.testing.assert_allclose(forecast.update(ts[..., t]), utilities.expected_values(ts[..., :t + 1], d))
+    np.testing.assert_allclose(utilities.ExpectedValue.from_history(ts, d).value(), forecast.value())
+    for i, j in np.ndindex(4, 3):
+        assert forecast.value()[i, j] == pytest.approx(utilities.expected_value(ts[i, j], d[j]))
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+import water
+import system
+import utilities
+
+@pytest.mark.parametrize('pump_cost_function, max_deficit', [(utilities.exponential(base=1, r=0), np.inf), (utilities.exponential(base=2, r=0.01), 50.0),
+                                                            (lambda x: 1 + 1e-3 * x**2, 50.0), (lambda x: 1 + 1e-3 * x**2, np.inf)])
+@pytest.mark.parametrize('deficit', [-30.0, 0.0, 20.0, 50.0, 80.0])
+def test_groundwater_bids_match_bid(pump_cost_function, max_deficit, deficit):
+    G = water.Groundwater(deficit=deficit, max_deficit=max_deficit, pump_cost_function=pump_cost_function)
+    q = np.array([-5.0, 0.0, 1e-9, 5.0, 25.0, 40.0, 100.0])
+    quantities, costs = G.bids(q)
+    expected = np.array([G.bid(x) for x in q])
+    np.testing.assert_allclose(quantities, expected[:, 0], atol=1e-9)
+    np.testing.assert_allclose(costs, expected[:, 1], rtol=1e-6, atol=1e-9)
+    assert (quantities >= 0).all() and (costs >= 0).all()
+
+def test_groundwater_bids_at_hypothetical_deficits():
+    G = water.Groundwater(max_deficit=50.0, pump_cost_function=utilities.exponential(base=1, r=0.01))
+    deficits = np.array([-10.0, 0.0, 45.0, 60.0])
+    quantities, costs = G.bids(np.full(4, 20.0), deficits)
+    for deficit, quantity, cost in zip(deficits, quantities, costs):
+        assert (quantity, cost) == pytest.approx(water.Groundwater(deficit=deficit, max_deficit=50.0, pump_cost_function=G.pump_cost_function).bid(20.0))
+
+def test_groundwater_field_bids_match_groundwater_bids():
+    Gs = [water.Groundwater(deficit=deficit, max_deficit=max_deficit, pump_cost_function=f) for deficit, max_deficit, f in
+          [(-30.0, np.inf, utilities.exponential(base=1, r=0)), (20.0, 50.0, utilities.exponential(base=2, r=0.01)), (80.0, 50.0, lambda x: 1 + 1e-3 * x**2)]]
+    field = water.GroundwaterField.from_groundwater(*Gs)
+    q = np.array([-5.0, 0.0, 5.0, 25.0, 100.0])
+    for i, G in enumerate(Gs):
+        quantities, costs = field.bids(q, cells=np.full(len(q), i))
+        expected = G.bids(q)
+        np.testing.assert_allclose(quantities, expected[0], atol=1e-9)
+        np.testing.assert_allclose(costs, expected[1], rtol=1e-4, atol=1e-9)
+        deficits = np.array([-10.0, 0.0, 10.0, 40.0, 60.0])
+        np.testing.assert_allclose(field.bids(q, deficits, np.full(len(q), i))[0], G.bids(q, deficits)[0], atol=1e-9) # same positional order.
+
+def test_planners_reject_groundwater_field():
+    field = water.GroundwaterField(deficit=np.zeros(3))
+    for kind in ('central', 'individual'):
+        with pytest.raises(TypeError):
+            system.default_planner(kind, G=field)
+
+def reference_allocations(priority: np.ndarray, claims: np.ndarray, supply: float) -> np.ndarray:
+    '''
+    Allocates a supply to claims one priority class at a time, senior (low priority) classes first and each class pro rata.
+    '''
+    allocations = np.zeros(len(claims))
+    for level in np.unique(priority):
+        holders = priority == level
+        total = claims[holders].sum()
+        allocations[holders] = claims[holders] * (min(supply / total, 1) if total > 0 else 0)
+        supply = max(supply - total, 0)
+    return allocations
+
+def test_surface_rights_fill_senior_classes_first():
+    S = water.SurfaceRights(priority=[2, 1, 1, 3], entitlement=[10, 10, 30, 10])
+    S.supply(35)
+    np.testing.assert_allclose(S.allocations(), [0, 8.75, 26.25, 0])
+    S.supply(55)
+    np.testing.assert_allclose(S.allocations(), [10, 10, 30, 5])
+    np.testing.assert_allclose(S.allocate(np.array([10, 5, 30, 10])), [10, 5, 30, 10])
+    np.testing.assert_allclose(S.allocate(np.array([20, 20, 20, 20])), [10, 10, 20, 10]) # demands are capped at the claims.
+    assert S.available == 55 and S.bid(60) == (55, 55)
+
+@pytest.mark.parametrize('seed', range(10))
+def test_surface_rights_update_and_curtail(seed):
+    rng = np.random.default_rng(seed)
+    holders = 12
+    S = water.SurfaceRights(priority=rng.integers(0, 4, holders), entitlement=rng.uniform(0, 10, holders))
+    S.supply(rng.uniform(0, 80))
+    for step in range(6):
+        if step % 3 == 0:
+            S.deliver(rng.uniform(0, S.available))
+        elif step % 3 == 1:
+            S.update(rng.uniform(S.delivered.sum(), 80))
+        else:
+            S.curtail(rng.integers(0, 4), rng.uniform(0, 1))
+        claims = np.maximum(S.entitlement * (1 - S.curtailment) - S.delivered, 0)
+        np.testing.assert_allclose(S.allocations(), reference_allocations(S.priority, claims, S.undelivered), atol=1e-9)
+        assert S.available == pytest.approx(min(S.undelivered, claims.sum()))
+        rebuilt = water.SurfaceRights(priority=S.priority, entitlement=S.entitlement, undelivered=S.undelivered, delivered=S.delivered, curtailment=S.curtailment)
+        np.testing.assert_allclose(S.allocations(), rebuilt.allocations(), atol=1e-9) # the class totals are kept up to date.
+    S.curtail(0, 0) # lifts every curtailment.
+    assert (S.curtailment == 0).all()
+
+def test_surface_rights_available_setter():
+    S = water.SurfaceRights(priority=[1, 2], entitlement=[10, 10])
+    S.supply(100)
+    S.available = 15
+    assert S.available == 15 and S.undelivered == 15
+    S.available = 20
+    assert S.available == 20
+    S.supply(10)
+    S.available = 25 # above the claims, the surplus supply is kept.
+    assert S.available == 20 and S.undelivered == 25
@@ -1,13 +1,157 @@
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Callable, Optional, Tuple, Union
+
 import numpy as np
-from typing import List, Callable
+
+def is_scalar(*args) -> bool:
+    '''
+    True if all of the arguments are scalars (python or numpy numbers, or 0-d arrays), used to take a fast scalar path in array-aware functions.
+    '''
+    for arg in args:
+        if not (isinstance(arg, (float, int)) or np.ndim(arg) == 0): # isinstance() first, np.ndim() takes about 10 times as long.
+            return False
+    return True
+
+@dataclass(frozen=True)
+class Exponential:
+    '''
+    An exponential function in the form: f(x) = base(1 + r)^x, with an analytic antiderivative.
+    
+    Arguments:
+        base: float - a base value such that f(0) = base.
+        r: float - a rate of exponential growth (r > 0) or decay (-1 < r < 0).
+    
+    Notes:
+        [1] x, base and r may be floats or np.ndarrays, arrays are broadcast against each other (i.e. to evaluate a family of functions in one call).
+    '''
+    base: float = 1
+    r: float = 0
+    
+    def __call__(self, x: float) -> float:
+        return self.base * (1 + self.r) ** x
+    
+    def integral(self, a: float, b: float) -> float:
+        '''
+        Returns the exact integral of the function on the domain [a, b].
+        '''
+        if is_scalar(self.r):
+            r = np.float64(self.r)
+            if r == 0:
+                return self.base * (b - a)
+            return self.base * ((1 + r) ** b - (1 + r) ** a) / math.log(1 + r)
+        r = np.asarray(self.r, dtype=float)
+        growth = r != 0
+        log = np.log1p(np.where(growth, r, 1.0))
+        return self.base * np.where(growth, ((1 + r) ** np.asarray(b) - (1 + r) ** np.asarray(a)) / log, np.subtract(b, a))
 
 def exponential(base: float = 1, r: float = 0) -> Callable[[float], float]:
     '''
     Returns an exponential function with a base of 1 and growth rate of r.
+    
+    Notes:
+        [1] The returned function exposes an integral(a, b) method, so it can be integrated without numerical quadrature.
+    '''
+    return Exponential(base=base, r=r)
+
+class CostTable:
+    '''
+    Precomputed cumulative integral of an arbitrary function, used to price groundwater pumping without numerical quadrature.
+    
+    Arguments:
+        f: Callable[[float], float] - the function to integrate (i.e. a groundwater pumping cost function).
+        lower: float - lower bound of the tabulated domain.
+        upper: float - upper bound of the tabulated domain.
+        n: int - number of tabulated intervals, 1000 by default.
+    
+    Notes:
+        [1] The integral is computed exactly for the piecewise linear interpolant of f on n equal intervals.
+        [2] The absolute error of any integral(a, b) is bounded by (b - a) h^2 max|f''| / 12, where h = (upper - lower) / n. 
+            The max|f''| term is estimated from second differences of the tabulated values and is reported by the error_bound() method. 
     '''
-    def f(x: float):
-        return base * (1 + r) ** x
-    return f
+    def __init__(self, f: Callable[[float], float], lower: float, upper: float, n: int = 1000):
+        if not (math.isfinite(lower) and math.isfinite(upper)) or upper <= lower:
+            raise ValueError(f'a cost table requires a finite domain with lower < upper, got [{lower}, {upper}].')
+        self.f = f
+        self.lower, self.upper = lower, upper
+        self.h = (upper - lower) / n
+        self.xs = np.linspace(lower, upper, n + 1)
+        self.ys = np.array([f(x) for x in self.xs], dtype=float)
+        self.cumulative = np.concatenate(([0.0], np.cumsum((self.ys[1:] + self.ys[:-1]) * self.h / 2)))
+        self.max_second_derivative = np.abs(np.diff(self.ys, n=2)).max() / self.h**2 if n > 1 else 0.0
+    
+    def __call__(self, x: float) -> float:
+        return self.f(x)
+    
+    def antiderivative(self, x: float) -> float:
+        '''
+        Returns the integral of the tabulated function on the domain [lower, x], x may be a float or np.ndarray.
+        '''
+        if is_scalar(x):
+            i = min(int((x - self.lower) // self.h), len(self.xs) - 2)
+            dx = x - self.xs[i]
+            return self.cumulative[i] + self.ys[i] * dx + (self.ys[i + 1] - self.ys[i]) / self.h * dx**2 / 2
+        i = np.minimum(((np.asarray(x) - self.lower) // self.h).astype(int), len(self.xs) - 2)
+        dx = x - self.xs[i]
+        slope = (self.ys[i + 1] - self.ys[i]) / self.h
+        return self.cumulative[i] + self.ys[i] * dx + slope * dx**2 / 2
+    
+    def integral(self, a: float, b: float) -> float:
+        '''
+        Returns the integral of the function on the domain [a, b], which must lie within [lower, upper].
+        '''
+        if (a < self.lower or b > self.upper) if is_scalar(a, b) else (np.any(np.asarray(a) < self.lower) or np.any(np.asarray(b) > self.upper)):
+            raise ValueError(f'[{a}, {b}] is outside of the tabulated domain [{self.lower}, {self.upper}].')
+        return self.antiderivative(b) - self.antiderivative(a)
+    
+    def error_bound(self, a: float, b: float) -> float:
+        '''
+        Returns the estimated upper bound on the absolute error of integral(a, b).
+        '''
+        return abs(b - a) * self.h**2 * self.max_second_derivative / 12
+
+def integrable(f: Callable[[float], float], lower: float = 0, upper: float = math.inf, n: int = 1000):
+    '''
+    Returns an object with an integral(a, b) method for the function f, or None if one can not be constructed.
+    
+    Arguments:
+        f: Callable[[float], float] - the function to integrate.
+        lower: float - lower bound of the domain, 0 by default.
+        upper: float - upper bound of the domain, math.inf by default.
+        n: int - number of intervals used to tabulate f, 1000 by default.
+    
+    Notes:
+        [1] Functions with an analytic antiderivative (i.e. Exponential) are returned as is.
+        [2] Other functions are tabulated as a CostTable if the domain is finite, otherwise None is returned.
+    '''
+    if hasattr(f, 'integral'):
+        return f
+    if math.isfinite(lower) and math.isfinite(upper) and lower < upper:
+        return CostTable(f, lower, upper, n)
+    return None
+
+@dataclass(frozen=True)
+class UnitSigmoid:
+    '''
+    A sigmoid (logistic) function on the domain and range of [0, 1].
+    
+    Arguments:
+        k: float - controls shape (~"steepness") of function.
+    
+    Notes:
+        [1] x and k may be floats or np.ndarrays, arrays are broadcast against each other and an np.ndarray is returned.
+    '''
+    k: float = 1
+    
+    def __call__(self, x: float) -> float:
+        if is_scalar(x, self.k):
+            x = float(x)
+            return 0 if x <= 0 else 1 / (1 + ((1 / x) - 1)**float(self.k)) if x < 1 else 1
+        x, k = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(self.k, dtype=float))
+        y = np.where(x < 1, 0.0, 1.0)
+        inner = (0 < x) & (x < 1)
+        y[inner] = 1 / (1 + ((1 / x[inner]) - 1)**k[inner])
+        return y
 
 def unit_sigmoid(k: float = 1) -> Callable[[float], float]:
     '''
@@ -16,9 +160,30 @@ def unit_sigmoid(k: float = 1) -> Callable[[float], float]:
     Arguments:
         k: float - controls shape (~"steepness") of function.
     '''
-    def f(x: float):
-        return 0 if x <= 0 else 1 / (1 + ((1 / x) - 1)**k) if x < 1 else 1
-    return f
+    return UnitSigmoid(k=k)
+
+def rng_state(rng: Optional[np.random.Generator]) -> Dict:
+    '''
+    Returns the state of a random number generator, or of the global np.random state if rng is None, as a json serializable dict.
+    '''
+    if rng is not None:
+        return {'generator': rng.bit_generator.state}
+    name, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return {'legacy': [name, keys.tolist(), int(pos), int(has_gauss), float(cached_gaussian)]}
+
+def set_rng_state(state: Dict, rng: Optional[np.random.Generator]) -> Optional[np.random.Generator]:
+    '''
+    Restores a state returned by rng_state(), returns the random number generator (a new one is created if rng is None but the state is of a generator).
+    '''
+    if 'legacy' in state:
+        name, keys, pos, has_gauss, cached_gaussian = state['legacy']
+        np.random.set_state((name, np.array(keys, dtype=np.uint32), pos, has_gauss, cached_gaussian))
+        return rng
+    generator = state['generator']
+    if rng is None or type(rng.bit_generator).__name__ != generator['bit_generator']:
+        rng = np.random.Generator(getattr(np.random, generator['bit_generator'])())
+    rng.bit_generator.state = generator
+    return rng
 
 def expected_value(ts: List[float], d: float = 0) -> float:
     '''
@@ -31,9 +196,63 @@ def expected_value(ts: List[float], d: float = 0) -> float:
     Notes:
         [1] The arithematic mean is return for d = 0 (no discounting of information).
         [2] The last value in ts is returned for d = 1 (perfect discounting of information).
+        [3] See expected_values() for a batch of time series, and ExpectedValue to update the expected value as new values arrive.
     '''
-    def partial_weight(t: int):
-        return (1 - d)**t
-    f = np.vectorize(partial_weight)
-    w = f(np.arange(len(ts) - 1, -1, -1))
-    return np.dot(w / np.sum(w), ts)
\ No newline at end of file
+    w = np.power(1.0 - d, np.arange(len(ts) - 1, -1, -1))
+    return np.dot(w / np.sum(w), ts)
+
+def expected_values(ts: np.ndarray, d: Union[float, np.ndarray] = 0) -> np.ndarray:
+    '''
+    Returns the expected value of each of a batch of time series, see expected_value().
+    
+    Arguments:
+        ts: np.ndarray[shape=(series x time), dtype=float] - time series histories, the last axis is time (any leading shape is allowed).
+        d: float or np.ndarray[shape=(series), dtype=float] - rate(s) of depreciation of information.
+    Returns:
+        np.ndarray[shape=(series), dtype=float]
+    '''
+    ts = np.asarray(ts, dtype=float)
+    w = np.power(1.0 - np.asarray(d, dtype=float)[..., np.newaxis], np.arange(ts.shape[-1] - 1, -1, -1))
+    return np.sum(w * ts, axis=-1) / np.sum(w, axis=-1)
+
+class ExpectedValue:
+    '''
+    Streaming expected value of a batch of time series, updated in constant time as each new value arrives.
+    
+    Arguments:
+        d: float or np.ndarray - rate(s) of depreciation of information (broadcastable to shape), see expected_value().
+        shape: Tuple[int, ...] - shape of the batch of series (i.e. (parcels, crops)), a single series by default.
+    
+    Notes:
+        [1] The weighted sum and the sum of the weights are discounted by (1 - d) before each new value is added, 
+            so value() matches expected_value() on the full history without storing it.
+        [2] value() is nan for a series with no values.
+    '''
+    def __init__(self, d: Union[float, np.ndarray] = 0, shape: Tuple[int, ...] = ()):
+        self.decay = 1.0 - np.broadcast_to(np.asarray(d, dtype=float), shape)
+        self.weighted = np.zeros(shape)
+        self.weights = np.zeros(shape)
+    
+    @staticmethod
+    def from_history(ts: np.ndarray, d: Union[float, np.ndarray] = 0) -> 'ExpectedValue':
+        '''
+        Returns the streaming expected value of a batch of time series histories: np.ndarray[shape=(series x time), dtype=float].
+        '''
+        ts = np.asarray(ts, dtype=float)
+        forecast = ExpectedValue(d, ts.shape[:-1])
+        w = np.power(forecast.decay[..., np.newaxis], np.arange(ts.shape[-1] - 1, -1, -1))
+        forecast.weighted = np.sum(w * ts, axis=-1)
+        forecast.weights = np.sum(w, axis=-1)
+        return forecast
+    
+    def update(self, x: Union[float, np.ndarray]) -> np.ndarray:
+        '''
+        Adds the next value of each series, and returns the updated expected values.
+        '''
+        self.weighted = self.decay * self.weighted + x
+        self.weights = self.decay * self.weights + 1
+        return self.value()
+    
+    def value(self) -> np.ndarray:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.weighted / self.weights
@@ -1,10 +1,11 @@
 import math
-from dataclasses import dataclass
-from typing import Callable
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Sequence, Union
 
-import scipy.integrate as integrate
+import numpy as np
 
-from utilities import exponential
+import instrument
+from utilities import CostTable, Exponential, exponential, integrable
 
 @dataclass
 class Groundwater:
@@ -13,21 +14,218 @@ class Groundwater:
     max_deficit: float = math.inf
     sustainable_yield: float = 0.0
     pump_cost_function: Callable[[float], float] = exponential(base=1, r=0)
+    _cost_integral: object = field(init=False, repr=False, compare=False, default=None)
+    
+    def __post_init__(self):
+        self._cost_integral = integrable(self.pump_cost_function, lower=0, upper=self.max_deficit)
+    
+    def pump_cost(self, a: float, b: float) -> float:
+        '''
+        Returns the cost of pumping groundwater on the deficit domain [a, b].
+        
+        Notes:
+            [1] Uses the analytic antiderivative or precomputed cost table of the pump_cost_function, 
+                numerical quadrature is only used when neither exists (or [a, b] is outside of the tabulated domain).
+            [2] scipy is only imported the first time quadrature is used.
+        '''
+        if b <= a:
+            return 0
+        if self._cost_integral is not None:
+            try:
+                cost = self._cost_integral.integral(a, b)
+                instrument.count('groundwater.integral.table' if isinstance(self._cost_integral, CostTable) else 'groundwater.integral.analytic')
+                return cost
+            except ValueError:
+                pass
+        instrument.count('groundwater.integral.quad')
+        from scipy import integrate # imported on first use, most cost functions never need quadrature.
+        return integrate.quad(self.pump_cost_function, a, b)[0]
+    
+    def pump_costs(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        '''
+        Vectorized pump_cost(), returns the cost of pumping groundwater on each deficit domain [a[i], b[i]].
+        '''
+        a, b = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float))
+        costs = np.zeros(a.shape)
+        pumped = a < b
+        if not pumped.any():
+            return costs
+        if self._cost_integral is not None:
+            try:
+                costs[pumped] = self._cost_integral.integral(a[pumped], b[pumped])
+                return costs
+            except ValueError:
+                pass
+        costs[pumped] = [self.pump_cost(ai, bi) for ai, bi in zip(a[pumped], b[pumped])]
+        return costs
     
     def pump(self, q: float):
         self.deficit = self.deficit + q if self.active else 0
+        instrument.event('groundwater.pump', q=q, deficit=self.deficit)
     
     def recharge(self, excess_yield: float = 0):
         self.deficit -= self.sustainable_yield + excess_yield if self.active else 0
+        instrument.event('groundwater.recharge', excess_yield=excess_yield, deficit=self.deficit)
         
     def bid(self, q: float):
+        instrument.count('groundwater.bid')
         if self.active and q > 0:
             qs = min(q, -self.deficit) if self.deficit < 0 else 0
-            qp = 0 if qs > q else min(q - qs, self.max_deficit - self.deficit)
-            cost = self.pump_cost_function(0) * qs + integrate.quad(lambda x: self.pump_cost_function(x), max(self.deficit, 0), self.deficit + qp)[0]
+            qp = 0 if qs > q else max(min(q - qs, self.max_deficit - max(self.deficit, 0)), 0)
+            cost = self.pump_cost_function(0) * qs + self.pump_cost(max(self.deficit, 0), max(self.deficit, 0) + qp)
             return qs+qp, cost
         else:
             return 0, 0
+    
+    def bids(self, q: np.ndarray, deficits: np.ndarray = None):
+        '''
+        Vectorized bid(), returns the available quantities and costs of each of an array of bids.
+        
+        Arguments:
+            q: np.ndarray - desired quantities of groundwater.
+            deficits: np.ndarray - hypothetical deficits each bid is priced at, the current deficit by default (the deficit state is not changed).
+        Returns:
+            Tuple[np.ndarray, np.ndarray] in the form: (quantities, costs).
+        '''
+        q, deficits = np.broadcast_arrays(np.asarray(q, dtype=float), np.asarray(self.deficit if deficits is None else deficits, dtype=float))
+        instrument.count('groundwater.bids', q.size)
+        if not self.active:
+            return np.zeros(q.shape), np.zeros(q.shape)
+        return _bids(q, deficits, self.max_deficit, self.pump_cost_function(0), self.pump_costs)
+
+def _bids(q: np.ndarray, deficits: np.ndarray, max_deficit: np.ndarray, surplus_cost: np.ndarray, pump_costs: Callable[[np.ndarray, np.ndarray], np.ndarray]):
+    '''
+    Returns the quantities and costs of bids q priced at deficits, shared by Groundwater.bids() and GroundwaterField.bids().
+    Water in storage above the sustainable yield (a negative deficit) is used first at surplus_cost per unit, 
+    then water is pumped up to max_deficit and priced by pump_costs(lower, upper) of the deficit domain pumped.
+    '''
+    q = np.maximum(q, 0)
+    qs = np.minimum(q, np.maximum(-deficits, 0))
+    lower = np.maximum(deficits, 0)
+    qp = np.maximum(np.minimum(q - qs, max_deficit - lower), 0) # nothing can be pumped beyond max_deficit.
+    return qs + qp, surplus_cost * qs + pump_costs(lower, lower + qp)
+
+@dataclass
+class GroundwaterField:
+    '''
+    Array backed groundwater of many aquifer cells (or wells), each with its own deficit, max deficit, sustainable yield and pumping cost curve.
+    
+    Arguments:
+        deficit: np.ndarray[shape=(cells), dtype=float] - deficit of each cell (state).
+        max_deficit: np.ndarray[shape=(cells), dtype=float] - max deficit of each cell (or a float shared by all cells), math.inf by default.
+        sustainable_yield: np.ndarray[shape=(cells), dtype=float] - sustainable yield of each cell (or a float shared by all cells), 0 by default.
+        pump_cost_functions: Sequence[Callable[[float], float]] - pumping cost function of each cell (or a single function shared by all cells).
+        active: bool - if False no groundwater is available, True by default.
+        n: int - number of intervals of each cell's cost table, 1000 by default.
+    
+    Notes:
+        [1] Pumping, recharge and bids are vectorized over the cells (or over an array of wells, each indexing the cell it pumps from).
+        [2] Exponential cost functions are integrated analytically, all others are priced by a cost table of the cell's domain [0, max_deficit] 
+            (precomputed once and stacked for all cells), so they require a finite max_deficit.
+        [3] A field of one cell behaves as the scalar Groundwater, see from_groundwater() and cell().
+        [4] bids() takes the arguments of Groundwater.bids() (then the cells), but a field is not a planner's G: 
+            the planners price bids against a single deficit, so they reject a field (use from_groundwater() and cell() to convert).
+    '''
+    deficit: np.ndarray
+    max_deficit: np.ndarray = math.inf
+    sustainable_yield: np.ndarray = 0.0
+    pump_cost_functions: Sequence[Callable[[float], float]] = (exponential(base=1, r=0),)
+    active: bool = True
+    n: int = 1000
+    
+    def __post_init__(self):
+        self.deficit = np.array(self.deficit, dtype=float, ndmin=1)
+        cells = len(self.deficit)
+        self.max_deficit = np.broadcast_to(np.asarray(self.max_deficit, dtype=float), (cells,)).copy()
+        self.sustainable_yield = np.broadcast_to(np.asarray(self.sustainable_yield, dtype=float), (cells,)).copy()
+        fs = list(self.pump_cost_functions) if isinstance(self.pump_cost_functions, Sequence) else [self.pump_cost_functions]
+        fs = fs * cells if len(fs) == 1 else fs
+        if len(fs) != cells:
+            raise ValueError(f'{len(fs)} pump cost functions were provided for {cells} cells.')
+        self.pump_cost_functions = fs
+        self._analytic = np.array([isinstance(f, Exponential) for f in fs])
+        self._exponential = Exponential(base=np.array([f.base if isinstance(f, Exponential) else 0.0 for f in fs], dtype=float),
+                                        r=np.array([f.r if isinstance(f, Exponential) else 0.0 for f in fs], dtype=float))
+        self._h, self._ys, self._cumulative = np.ones(cells), np.zeros((cells, self.n + 1)), np.zeros((cells, self.n + 1))
+        for i in np.flatnonzero(~self._analytic):
+            table = CostTable(fs[i], 0, self.max_deficit[i], self.n)
+            self._h[i], self._ys[i], self._cumulative[i] = table.h, table.ys, table.cumulative
+        self._f0 = np.array([f(0) for f in fs], dtype=float)
+    
+    @staticmethod
+    def from_groundwater(*G: Groundwater) -> 'GroundwaterField':
+        '''
+        Returns a field with one cell for each (scalar) Groundwater.
+        '''
+        return GroundwaterField(deficit=[g.deficit for g in G], max_deficit=[g.max_deficit for g in G], sustainable_yield=[g.sustainable_yield for g in G],
+                                pump_cost_functions=[g.pump_cost_function for g in G], active=all(g.active for g in G))
+    
+    def cell(self, i: int) -> Groundwater:
+        '''
+        Returns a (scalar) Groundwater copy of cell i.
+        '''
+        return Groundwater(active=self.active, deficit=float(self.deficit[i]), max_deficit=float(self.max_deficit[i]),
+                           sustainable_yield=float(self.sustainable_yield[i]), pump_cost_function=self.pump_cost_functions[i])
+    
+    def __len__(self) -> int:
+        return len(self.deficit)
+    
+    def _antiderivative(self, x: np.ndarray, cells: np.ndarray) -> np.ndarray:
+        h = self._h[cells]
+        i = np.clip((x // h).astype(int), 0, self.n - 1)
+        dx = x - i * h
+        y0, y1 = self._ys[cells, i], self._ys[cells, i + 1]
+        return self._cumulative[cells, i] + y0 * dx + (y1 - y0) / h * dx**2 / 2
+    
+    def pump_costs(self, a: np.ndarray, b: np.ndarray, cells: Optional[np.ndarray] = None) -> np.ndarray:
+        '''
+        Returns the cost of pumping groundwater on the deficit domain [a, b] of each cell (or of cells[i] for each i).
+        '''
+        cells = np.arange(len(self)) if cells is None else np.asarray(cells)
+        a, b, cells = np.broadcast_arrays(np.asarray(a, dtype=float), np.asarray(b, dtype=float), cells)
+        pumped = a < b
+        analytic = Exponential(base=self._exponential.base[cells], r=self._exponential.r[cells]).integral(a, b)
+        tabulated = self._antiderivative(b, cells) - self._antiderivative(a, cells)
+        return np.where(pumped, np.where(self._analytic[cells], analytic, tabulated), 0.0)
+    
+    def bids(self, q: np.ndarray, deficits: Optional[np.ndarray] = None, cells: Optional[np.ndarray] = None):
+        '''
+        Vectorized Groundwater.bid() for each cell (or for each well pumping from cells[i]), the deficit states are not changed.
+        
+        Arguments:
+            q: np.ndarray - desired quantities of groundwater.
+            deficits: Optional[np.ndarray] - hypothetical deficits each bid is priced at, the current deficit of its cell by default.
+            cells: Optional[np.ndarray] - cell of each bid, one bid per cell by default.
+        Returns:
+            Tuple[np.ndarray, np.ndarray] in the form: (quantities, costs).
+        '''
+        cells = np.arange(len(self)) if cells is None else np.asarray(cells)
+        q, cells = np.broadcast_arrays(np.asarray(q, dtype=float), cells)
+        deficits = self.deficit[cells] if deficits is None else np.broadcast_to(np.asarray(deficits, dtype=float), q.shape)
+        instrument.count('groundwater.bids', q.size)
+        if not self.active:
+            return np.zeros(q.shape), np.zeros(q.shape)
+        return _bids(q, deficits, self.max_deficit[cells], self._f0[cells], lambda a, b: self.pump_costs(a, b, cells))
+    
+    def pump(self, q: np.ndarray, cells: Optional[np.ndarray] = None):
+        '''
+        Pumps q from each cell (or from cells[i] for each i, i.e. an array of wells).
+        '''
+        if not self.active:
+            self.deficit[:] = 0
+        elif cells is None:
+            self.deficit += q
+        else:
+            np.add.at(self.deficit, np.asarray(cells), q)
+        instrument.event('groundwater.pump', q=float(np.sum(q)), deficit=float(self.deficit.sum()))
+    
+    def recharge(self, excess_yield: np.ndarray = 0):
+        '''
+        Recharges each cell by its sustainable yield plus its excess yield (an array, or a float shared by all cells).
+        '''
+        if self.active:
+            self.deficit -= self.sustainable_yield + excess_yield
+        instrument.event('groundwater.recharge', excess_yield=float(np.sum(excess_yield)), deficit=float(self.deficit.sum()))
 
 @dataclass
 class Surfacewater:
@@ -36,13 +234,221 @@ class Surfacewater:
 
     def supply(self, q: float):      
         self.available = q
+        instrument.event('surfacewater.supply', q=q, available=self.available)
 
     def deliver(self, q: float):
+        '''
+        Delivers q (or the sum of an array of deliveries) from the supply.
+        '''
+        q = q.sum() if isinstance(q, np.ndarray) else q
         self.available -= q
+        instrument.event('surfacewater.deliver', q=q, available=self.available)
 
     def bid(self, q: float):
+        instrument.count('surfacewater.bid')
         sw = self.available if self.available < q else q
         return sw, self.unit_cost * sw
+    
+    def bids(self, q: np.ndarray):
+        '''
+        Vectorized bid(), returns the available quantities and costs of each of an array of bids (priced independently against the current supply).
+        '''
+        sw = np.minimum(self.available, np.asarray(q, dtype=float))
+        return sw, self.unit_cost * sw
+
+@dataclass
+class SurfaceRights:
+    '''
+    Surface water allocated to right holders by priority (seniority), a drop in replacement for Surfacewater.
+    
+    Arguments:
+        priority: np.ndarray[shape=(holders), dtype=float] - priority of each right, lower is more senior, rights of equal priority share shortages pro rata.
+        entitlement: np.ndarray[shape=(holders), dtype=float] - face value (maximum seasonal diversion) of each right.
+        unit_cost: float - unit cost of surface water, 1 by default.
+        undelivered: float - surface water supply of the season not yet delivered (state).
+        delivered: np.ndarray[shape=(holders), dtype=float] - surface water delivered to each holder this season (state).
+        curtailment: np.ndarray[shape=(holders), dtype=float] - fraction of each right's entitlement curtailed (or a float for all rights), 0 by default, see curtail().
+    
+    Notes:
+        [1] Holders are indexed by seniority once (a stable sort of priority), so each class of rights of equal priority is a contiguous run of the sorted holders.
+            A season's supply is allocated to all holders in one pass: the cumulative sum of the class claims gives the water claimed by more senior classes, 
+            senior classes are filled, the class the supply runs out in is filled pro rata, and junior classes receive nothing.
+        [2] Each right claims its entitlement, net of curtailment and of its deliveries this season (or its demand if less, see allocate()), 
+            water not claimed by senior rights passes to junior rights.
+        [3] The class totals and their cumulative sums are kept, so an in season supply update (update()) only re-evaluates the classes, 
+            and deliveries or curtailments only update the classes they change, the holders are never re-sorted.
+        [4] As a Surfacewater: available is the water the district can deliver (the lesser of the undelivered supply and the outstanding claims), 
+            bid() and bids() without holders bid against it, and deliver(q) delivers a district total to the holders in proportion to their allocations.
+            Setting available to less than the outstanding claims sets the undelivered supply to it, so the supply above the claims is lost 
+            (setting it back does not restore it, save and restore undelivered instead).
+    '''
+    priority: np.ndarray
+    entitlement: np.ndarray
+    unit_cost: float = 1
+    undelivered: float = 0.0 # state
+    delivered: np.ndarray = None # state
+    curtailment: np.ndarray = 0.0
+    
+    def __post_init__(self):
+        self.priority = np.array(self.priority, dtype=float, ndmin=1)
+        holders = len(self.priority)
+        self.entitlement = np.broadcast_to(np.asarray(self.entitlement, dtype=float), (holders,)).copy()
+        self.curtailment = np.broadcast_to(np.asarray(self.curtailment, dtype=float), (holders,)).copy()
+        self.delivered = np.zeros(holders) if self.delivered is None else np.array(self.delivered, dtype=float)
+        self.reindex()
+    
+    def reindex(self):
+        '''
+        Rebuilds the priority index and class totals, i.e. after the priority, entitlement, curtailment or delivered arrays are changed directly.
+        '''
+        self._order = np.argsort(self.priority, kind='stable')
+        ordered = self.priority[self._order]
+        self._starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        self._class = np.empty(len(self), dtype=int)
+        self._class[self._order] = np.cumsum(np.r_[True, ordered[1:] != ordered[:-1]]) - 1
+        self._claims = self._outstanding()
+        self._totals = self._class_totals(self._claims)
+        self._senior = np.cumsum(self._totals) - self._totals
+    
+    def __len__(self) -> int:
+        return len(self.priority)
+    
+    @property
+    def order(self) -> np.ndarray:
+        '''Holder indices in seniority order.'''
+        return self._order
+    
+    @property
+    def available(self) -> float:
+        return float(min(self.undelivered, self._totals.sum()))
+    
+    @available.setter
+    def available(self, q: float):
+        self.undelivered = q if q < self._totals.sum() else self.undelivered + q - self.available
+    
+    def _outstanding(self, holders=slice(None)) -> np.ndarray:
+        return np.maximum(self.entitlement[holders] * (1 - self.curtailment[holders]) - self.delivered[holders], 0)
+    
+    def _class_totals(self, claims: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(claims[self._order], self._starts) if len(self) else np.zeros(0)
+    
+    def _update_claims(self, holders: np.ndarray):
+        claims = self._outstanding(holders)
+        np.add.at(self._totals, self._class[holders], claims - self._claims[holders])
+        self._claims[holders] = claims
+        self._senior = np.cumsum(self._totals) - self._totals
+    
+    @staticmethod
+    def _fractions(supply: float, senior: np.ndarray, totals: np.ndarray) -> np.ndarray:
+        '''
+        Returns the fraction of each class's claims that is filled by the supply.
+        '''
+        fractions = np.ones(totals.shape)
+        np.divide(supply - senior, totals, out=fractions, where=totals > 0)
+        return np.clip(fractions, 0, 1)
+    
+    def fractions(self) -> np.ndarray:
+        '''
+        Returns the fraction of the outstanding claims of each priority class (in seniority order) filled by the undelivered supply.
+        '''
+        return self._fractions(self.undelivered, self._senior, self._totals)
+    
+    def allocations(self) -> np.ndarray:
+        '''
+        Returns the undelivered supply allocated to each holder, given its outstanding claim.
+        '''
+        instrument.count('surfacerights.allocations', len(self))
+        return self._claims * self.fractions()[self._class]
+    
+    def allocate(self, demand: np.ndarray) -> np.ndarray:
+        '''
+        Returns the undelivered supply allocated to each holder if each claims the lesser of its demand and its outstanding claim (the state is not changed).
+        
+        Arguments:
+            demand: np.ndarray[shape=(holders), dtype=float] - surface water demanded by each holder.
+        '''
+        instrument.count('surfacerights.allocate', len(self))
+        claims = np.minimum(np.maximum(demand, 0), self._claims)
+        totals = self._class_totals(claims)
+        return claims * self._fractions(self.undelivered, np.cumsum(totals) - totals, totals)[self._class]
+    
+    def allotments(self, demand: np.ndarray) -> np.ndarray:
+        '''
+        Returns the surface water available to each holder if it claims its full outstanding claim, while every other holder claims its demand 
+        (i.e. the most each holder can be allocated given the demands of the others).
+        '''
+        claims = np.minimum(np.maximum(demand, 0), self._claims)
+        totals = self._class_totals(claims)
+        senior = (np.cumsum(totals) - totals)[self._class]
+        own = totals[self._class] - claims + self._claims
+        fractions = np.ones(len(self))
+        np.divide(self.undelivered - senior, own, out=fractions, where=own > 0)
+        return self._claims * np.clip(fractions, 0, 1)
+    
+    def supply(self, q: float):
+        '''
+        Starts a season with a supply of q, deliveries of the previous season are cleared.
+        '''
+        self.undelivered = q
+        self.delivered[:] = 0
+        self._claims = self._outstanding()
+        self._totals = self._class_totals(self._claims) # summed afresh rather than updated, so a season's totals do not depend on earlier seasons (i.e. a restored checkpoint).
+        self._senior = np.cumsum(self._totals) - self._totals
+        instrument.event('surfacewater.supply', q=q, available=self.available)
+    
+    def update(self, q: float):
+        '''
+        Revises the season's total supply to q (i.e. a new forecast), the water already delivered this season is kept.
+        '''
+        self.undelivered = q - self.delivered.sum()
+        instrument.event('surfacerights.update', q=q, available=self.available)
+    
+    def curtail(self, priority: float, fraction: float = 1.0):
+        '''
+        Curtails fraction of the entitlement of every right with a priority at or junior to priority (fraction=0 lifts the curtailment).
+        '''
+        holders = np.flatnonzero(self.priority >= priority)
+        self.curtailment[holders] = fraction
+        self._update_claims(holders)
+        instrument.event('surfacerights.curtail', priority=priority, fraction=fraction, available=self.available)
+    
+    def deliver(self, q, holders: Optional[np.ndarray] = None):
+        '''
+        Delivers surface water to holders.
+        
+        Arguments:
+            q: float or np.ndarray - a district total (delivered to the holders in proportion to their allocations), 
+                or the quantity delivered to each holder (or to each of holders).
+            holders: Optional[np.ndarray] - holder of each quantity, all holders by default.
+        '''
+        if np.ndim(q) == 0 and holders is None:
+            allocations = self.allocations()
+            total = allocations.sum()
+            q = allocations * (min(q, total) / total) if total > 0 else np.zeros(len(self))
+        holders = np.arange(len(self)) if holders is None else np.asarray(holders)
+        np.add.at(self.delivered, holders, q)
+        self.undelivered -= np.sum(q)
+        self._update_claims(np.unique(holders))
+        instrument.event('surfacewater.deliver', q=float(np.sum(q)), available=self.available)
+    
+    def bid(self, q: float, holder: Optional[int] = None):
+        '''
+        Returns the available quantity and cost of a bid, from the district's available supply or from a holder's allocation.
+        '''
+        instrument.count('surfacewater.bid')
+        if holder is None:
+            sw = min(q, self.available)
+        else:
+            c = self._class[holder]
+            sw = min(q, float(self._claims[holder] * self._fractions(self.undelivered, self._senior[c], self._totals[c])))
+        return sw, self.unit_cost * sw
+    
+    def bids(self, q: np.ndarray, holders: Optional[np.ndarray] = None):
+        '''
+        Vectorized bid(), bids are priced independently against the district's available supply, or against each of holders' allocations.
+        '''
+        sw = np.minimum(self.available if holders is None else self.allocations()[holders], np.asarray(q, dtype=float))
+        return sw, self.unit_cost * sw
 
 def demand(ETo: float, kc: float) -> float:
     '''
@@ -54,11 +460,63 @@ def demand(ETo: float, kc: float) -> float:
     '''
     return ETo * kc
 
-def bid(d: float, p: float, s: Surfacewater, g: Groundwater):
+def bid(d: float, p: float, s: Surfacewater, g: Groundwater, holder: Optional[int] = None):
+    '''
+    Returns the surface water and groundwater quantities and costs of a water demand d net of precipitation p, 
+    surface water is bid from holder's allocation if s is a SurfaceRights and holder is provided.
+    '''
+    instrument.count('water.bid')
     D = d - p
     if D > 0:
-        sw = s.bid(D)
+        sw = s.bid(D) if holder is None else s.bid(D, holder)
         gw = D - sw[0] if sw[0] < D else 0
         return sw, g.bid(gw)
     else:
-        return (0,0), (0,0)
\ No newline at end of file
+        return (0,0), (0,0)
+
+def bids(d: np.ndarray, p: np.ndarray, s: Union[Surfacewater, SurfaceRights], g: Groundwater, order: np.ndarray = None, deliver: bool = False):
+    '''
+    Vectorized bid(), prices an array of water demands against the surface and groundwater states.
+    
+    Arguments:
+        d: np.ndarray - water demands (a 1D array if order is provided).
+        p: np.ndarray - precipitation, broadcast against d.
+        s: Union[Surfacewater, SurfaceRights] - surface water supply, or surface water rights (then d holds the demand of each holder).
+        g: Groundwater - groundwater supply.
+        order: np.ndarray - if provided, demands are filled sequentially in this priority order (i.e. np.argsort of a seniority), 
+            so each demand sees the states left by the demands before it. By default, each demand is priced independently against the current states.
+        deliver: bool - if True (and order is provided, or s is a SurfaceRights) the delivered surface water and pumped groundwater are removed from s and g, False by default.
+    Returns:
+        Tuple[Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]] in the form: ((surface quantities, surface costs), (ground quantities, ground costs)).
+    
+    Notes:
+        [1] The sequential (ordered) fill uses cumulative sums of the demands rather than a loop over users, 
+            it matches calling bid() and then deliver() and pump() for each demand in order.
+        [2] If s is a SurfaceRights, surface water is allocated to the holders' demands by their rights (see SurfaceRights.allocate()), 
+            and pumping is ordered by the rights' seniority unless order is provided.
+    '''
+    D = np.maximum(np.subtract(d, p, dtype=float), 0)
+    instrument.count('water.bids', D.size)
+    rights = isinstance(s, SurfaceRights)
+    if order is None and not rights:
+        sw, sw_cost = s.bids(D)
+        gw, gw_cost = g.bids(D - sw)
+        return (sw, sw_cost), (gw, gw_cost)
+    order = s.order if order is None else order
+    D_ordered = D[order]
+    if rights:
+        sw_ordered = s.allocate(D)[order]
+    else:
+        before = np.cumsum(D_ordered) - D_ordered
+        sw_ordered = np.clip(s.available - before, 0, D_ordered)
+    gw_ordered = D_ordered - sw_ordered
+    deficits = g.deficit + np.cumsum(gw_ordered) - gw_ordered
+    if math.isfinite(g.max_deficit):
+        deficits = np.minimum(deficits, max(g.max_deficit, g.deficit))
+    sw, gw, deficit = np.empty(D.shape), np.empty(D.shape), np.empty(D.shape)
+    sw[order], gw[order], deficit[order] = sw_ordered, gw_ordered, deficits
+    gw, gw_cost = g.bids(gw, deficit)
+    if deliver:
+        s.deliver(sw)
+        g.pump(gw.sum())
+    return (sw, s.unit_cost * sw), (gw, gw_cost)
\ No newline at end of file